@@ -5,6 +5,11 @@
 OCR服务器启动入口
 """
 
+import time
+
+# 进程启动时间，供 --profile-startup 统计首次响应耗时
+_START_TIME = time.time()
+
 import sys
 import os
 
@@ -17,4 +22,4 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 from src.api.simple_api_server import main
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main(start_time=_START_TIME) 
\ No newline at end of file
@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+OCR服务压测工具
+按固定并发（闭环：每个线程收到响应后立即发下一个请求）或固定到达率（开环：按时间表发请求，
+不受响应快慢影响）向 /ocr 重放图片，统计延迟分位数、吞吐、错误率，以及服务端通过
+Server-Timing 响应头返回的各阶段耗时，并按时间窗口输出变化趋势
+可以压测已在运行的服务（--url），也可以自动启动 run_server.py（--start），便于在同一台机器上
+用相同负载比较不同的服务端参数
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import base64
+import socket
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from src.utils.config import (
+    API_BASE_URL, TEST_IMAGES_DIR, BATCH_IMAGE_EXTENSIONS, RESPONSE_PROFILE, RESPONSE_PROFILES,
+    REQUEST_TIMEOUT, LOADTEST_CONCURRENCY, LOADTEST_DURATION, LOADTEST_WINDOW,
+    LOADTEST_MAX_INFLIGHT, LOADTEST_STARTUP_TIMEOUT
+)
+
+# 延迟直方图的桶上限（毫秒）
+_HISTOGRAM_BOUNDS = [5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000]
+
+
+def load_bodies(inputs, profile=RESPONSE_PROFILE, extensions=BATCH_IMAGE_EXTENSIONS):
+    """
+    读取图片并预先编码成请求体，压测期间客户端不再做base64编码
+    :param inputs: 图片文件或目录
+    :return: [(文件名, 请求体字节), ...]
+    """
+    extensions = tuple(ext.lower() for ext in extensions)
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(os.path.join(item, name) for name in sorted(os.listdir(item))
+                         if name.lower().endswith(extensions))
+        else:
+            paths.append(item)
+    bodies = []
+    for path in paths:
+        with open(path, 'rb') as fin:
+            image = base64.b64encode(fin.read()).decode('ascii')
+        body = json.dumps({'image': image, 'profile': profile}).encode('utf-8')
+        bodies.append((os.path.basename(path), body))
+    return bodies
+
+
+def parse_server_timing(header):
+    """解析 Server-Timing 响应头，返回 {阶段: 毫秒}"""
+    timings = {}
+    for item in (header or '').split(','):
+        name, _, params = item.strip().partition(';')
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'dur':
+                try:
+                    timings[name.strip()] = float(value)
+                except ValueError:
+                    pass
+    return timings
+
+
+def percentile(sorted_values, q):
+    """最近秩法分位数，sorted_values 已排序"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(math.ceil(q / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Recorder(object):
+    """收集每个请求的结果，线程安全"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = []
+        self.dropped = []
+        self.start_time = None
+        self.end_time = None
+
+    def start(self):
+        self.start_time = time.time()
+
+    def stop(self):
+        self.end_time = time.time()
+
+    def record(self, sent, latency, status, timings=None, error=None):
+        """
+        :param sent: 请求的发送时刻（开环模式为计划发送时刻）
+        :param latency: 秒
+        :param status: HTTP状态码，请求失败时为None
+        """
+        with self.lock:
+            self.samples.append((sent - self.start_time, latency, status, timings or {}, error))
+
+    def record_dropped(self, sent):
+        """开环模式下在途请求已达上限，未发出的请求"""
+        with self.lock:
+            self.dropped.append(sent - self.start_time)
+
+    @staticmethod
+    def _summarize(samples, duration):
+        latencies = sorted(latency * 1000 for _, latency, _, _, _ in samples)
+        errors = {}
+        stages = {}
+        ok = 0
+        for _, _, status, timings, error in samples:
+            if status == 200:
+                ok += 1
+                for stage, ms in timings.items():
+                    stages.setdefault(stage, []).append(ms)
+            else:
+                key = str(status) if status is not None else error
+                errors[key] = errors.get(key, 0) + 1
+        count = len(samples)
+        return {
+            'requests': count,
+            'ok': ok,
+            'errors': errors,
+            'error_rate': round((count - ok) / float(count), 4) if count else 0.0,
+            'throughput_rps': round(ok / duration, 2) if duration > 0 else 0.0,
+            'latency_ms': {
+                'min': round(latencies[0], 2) if latencies else None,
+                'mean': round(sum(latencies) / len(latencies), 2) if latencies else None,
+                'p50': _round(percentile(latencies, 50)),
+                'p90': _round(percentile(latencies, 90)),
+                'p95': _round(percentile(latencies, 95)),
+                'p99': _round(percentile(latencies, 99)),
+                'max': round(latencies[-1], 2) if latencies else None
+            },
+            # 服务端各阶段的平均耗时，只统计成功的请求
+            'server_ms': {stage: round(sum(values) / len(values), 2) for stage, values in stages.items()}
+        }
+
+    def summary(self):
+        with self.lock:
+            samples = list(self.samples)
+            dropped = len(self.dropped)
+        duration = (self.end_time or time.time()) - self.start_time
+        summary = self._summarize(samples, duration)
+        summary['duration_s'] = round(duration, 2)
+        summary['dropped'] = dropped
+        summary['histogram'] = histogram([latency * 1000 for _, latency, _, _, _ in samples])
+        return summary
+
+    def windows(self, window=LOADTEST_WINDOW):
+        """按请求发送时刻分到长度为 window 秒的时间窗口，逐窗口统计"""
+        with self.lock:
+            samples = list(self.samples)
+            dropped = list(self.dropped)
+        buckets = {}
+        for sample in samples:
+            buckets.setdefault(int(sample[0] // window), []).append(sample)
+        dropped_counts = {}
+        for sent in dropped:
+            index = int(sent // window)
+            dropped_counts[index] = dropped_counts.get(index, 0) + 1
+        result = []
+        for index in sorted(set(buckets) | set(dropped_counts)):
+            stats = self._summarize(buckets.get(index, []), window)
+            stats['t'] = index * window
+            stats['dropped'] = dropped_counts.get(index, 0)
+            result.append(stats)
+        return result
+
+
+def _round(value):
+    return round(value, 2) if value is not None else None
+
+
+def histogram(latencies_ms, bounds=_HISTOGRAM_BOUNDS):
+    """[(桶上限毫秒, 数量), ...]，最后一个桶的上限为None"""
+    counts = [0] * (len(bounds) + 1)
+    for latency in latencies_ms:
+        index = 0
+        while index < len(bounds) and latency > bounds[index]:
+            index += 1
+        counts[index] += 1
+    return [(bound, count) for bound, count in zip(bounds + [None], counts)]
+
+
+class LoadGenerator(object):
+    """向 url 重放 bodies 中的请求体，结果写入 recorder"""
+
+    def __init__(self, url, bodies, recorder, keepalive=True, timeout=REQUEST_TIMEOUT):
+        self.url = url.rstrip('/') + '/ocr'
+        self.bodies = bodies
+        self.recorder = recorder
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self.local = threading.local()
+        self.counter = 0
+        self.counter_lock = threading.Lock()
+
+    def _next_body(self):
+        with self.counter_lock:
+            index = self.counter
+            self.counter += 1
+        return self.bodies[index % len(self.bodies)][1]
+
+    def _session(self):
+        # 每个线程一个Session，复用HTTP/1.1长连接；关闭长连接时每个请求新建连接
+        if not self.keepalive:
+            return requests
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = requests.Session()
+        return session
+
+    def send(self, sent=None):
+        """
+        发送一个请求
+        :param sent: 计划发送时刻，开环模式下从该时刻开始计延迟，避免服务端变慢时少算排队时间
+        """
+        body = self._next_body()
+        headers = {'Content-Type': 'application/json'}
+        if not self.keepalive:
+            headers['Connection'] = 'close'
+        start_time = time.time() if sent is None else sent
+        try:
+            response = self._session().post(self.url, data=body, headers=headers, timeout=self.timeout)
+            response.content
+        except requests.RequestException as e:
+            self.recorder.record(start_time, time.time() - start_time, None, error=type(e).__name__)
+            return
+        self.recorder.record(start_time, time.time() - start_time, response.status_code,
+                             parse_server_timing(response.headers.get('Server-Timing')))
+
+    def run_concurrency(self, concurrency, duration, max_requests=None):
+        """固定并发：concurrency 个线程各自循环发送，直到 duration 秒或总请求数达到 max_requests"""
+        deadline = time.time() + duration
+        issued = [0]
+        issued_lock = threading.Lock()
+
+        def worker():
+            while time.time() < deadline:
+                if max_requests is not None:
+                    with issued_lock:
+                        if issued[0] >= max_requests:
+                            return
+                        issued[0] += 1
+                self.send()
+
+        threads = [threading.Thread(target=worker, name=f"load-{index}", daemon=True) for index in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def run_rate(self, rate, duration, max_inflight=LOADTEST_MAX_INFLIGHT, max_requests=None):
+        """
+        固定到达率：每秒 rate 个请求，按计划时刻发出，与响应快慢无关
+        在途请求达到 max_inflight 时新请求计为丢弃，说明服务已跟不上该到达率
+        """
+        interval = 1.0 / rate
+        total = int(duration * rate)
+        if max_requests is not None:
+            total = min(total, max_requests)
+        slots = threading.BoundedSemaphore(max_inflight)
+
+        def task(sent):
+            try:
+                self.send(sent)
+            finally:
+                slots.release()
+
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=max_inflight) as pool:
+            for index in range(total):
+                sent = start_time + index * interval
+                delay = sent - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                if not slots.acquire(blocking=False):
+                    self.recorder.record_dropped(sent)
+                    continue
+                pool.submit(task, sent)
+
+
+def free_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('localhost', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def start_server(port, server_args=(), timeout=LOADTEST_STARTUP_TIMEOUT, log_path=os.devnull):
+    """启动 run_server.py 并等待 /ready 返回200，返回子进程"""
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    log = open(log_path, 'w')
+    process = subprocess.Popen([sys.executable, os.path.join(root, 'run_server.py'), '-p', str(port)] + list(server_args),
+                               cwd=root, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://localhost:{port}/ready"
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"服务器启动失败，退出码 {process.returncode}")
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return process
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"服务器在 {timeout} 秒内未就绪")
+
+
+def fetch_server_stats(url):
+    """压测结束后读取 GET /stats，失败时返回None"""
+    try:
+        return requests.get(url.rstrip('/') + '/stats', timeout=5).json()
+    except (requests.RequestException, ValueError):
+        return None
+
+
+def format_report(report):
+    """把报告整理成便于阅读的文本"""
+    summary = report['summary']
+    latency = summary['latency_ms']
+    lines = [
+        f"请求 {summary['requests']}，成功 {summary['ok']}，错误率 {summary['error_rate'] * 100:.2f}%，"
+        f"丢弃 {summary['dropped']}，耗时 {summary['duration_s']}s，吞吐 {summary['throughput_rps']} req/s",
+        "延迟(ms): " + "  ".join(f"{key} {value}" for key, value in latency.items()),
+    ]
+    if summary['errors']:
+        lines.append("错误: " + ", ".join(f"{key} x{count}" for key, count in summary['errors'].items()))
+    if summary['server_ms']:
+        lines.append("服务端平均(ms): " + "  ".join(f"{key} {value}" for key, value in summary['server_ms'].items()))
+    lines.append("延迟分布:")
+    peak = max([count for _, count in summary['histogram']] + [1])
+    for bound, count in summary['histogram']:
+        if count:
+            label = f"<= {bound}ms" if bound is not None else f"> {_HISTOGRAM_BOUNDS[-1]}ms"
+            lines.append(f"  {label:>10} {count:>7} {'#' * max(1, int(40 * count / peak))}")
+    lines.append(f"时间窗口（{report['config']['window']}s）:")
+    lines.append(f"  {'t':>6} {'req/s':>8} {'p50':>9} {'p99':>9} {'err':>5} {'drop':>5}  服务端(ms)")
+    for stats in report['windows']:
+        stages = " ".join(f"{key}={value}" for key, value in stats['server_ms'].items())
+        lines.append(f"  {stats['t']:>6} {stats['throughput_rps']:>8} {str(stats['latency_ms']['p50']):>9} "
+                     f"{str(stats['latency_ms']['p99']):>9} {stats['requests'] - stats['ok']:>5} "
+                     f"{stats['dropped']:>5}  {stages}")
+    return "\n".join(lines)
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='OCR服务压测：固定并发或固定到达率重放图片，统计延迟分位数和吞吐')
+    parser.add_argument('inputs', nargs='*', default=[TEST_IMAGES_DIR], help=f'图片文件或目录 (默认: {TEST_IMAGES_DIR})')
+    parser.add_argument('--url', type=str, default=API_BASE_URL, help=f'服务地址 (默认: {API_BASE_URL})')
+    parser.add_argument('--start', action='store_true', help='自动启动 run_server.py（空闲端口），压测结束后关闭')
+    parser.add_argument('--server_args', type=str, default='', help='--start 时传给 run_server.py 的参数，如 "--shape-buckets"')
+    parser.add_argument('--server_log', type=str, default=os.devnull, help='--start 时服务器输出写入的文件')
+    parser.add_argument('-c', '--concurrency', type=int, default=LOADTEST_CONCURRENCY, help='固定并发数')
+    parser.add_argument('-r', '--rate', type=float, default=None, help='固定到达率（请求/秒），指定时忽略 --concurrency')
+    parser.add_argument('--max_inflight', type=int, default=LOADTEST_MAX_INFLIGHT, help='固定到达率模式下在途请求上限')
+    parser.add_argument('-d', '--duration', type=float, default=LOADTEST_DURATION, help='压测时长（秒）')
+    parser.add_argument('-n', '--requests', type=int, default=None, help='总请求数上限')
+    parser.add_argument('--warmup', type=int, default=0, help='正式计时前先顺序发送的请求数，不计入统计')
+    parser.add_argument('--window', type=float, default=LOADTEST_WINDOW, help='时间窗口长度（秒）')
+    parser.add_argument('--profile', type=str, default='text', choices=RESPONSE_PROFILES, help='请求的响应格式')
+    parser.add_argument('--no_keepalive', action='store_true', help='每个请求新建连接')
+    parser.add_argument('--timeout', type=float, default=REQUEST_TIMEOUT, help='单个请求的超时（秒）')
+    parser.add_argument('-O', '--output', type=str, default=None, help='完整报告写入的JSON文件，便于比较不同服务端参数')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    bodies = load_bodies(args.inputs, args.profile)
+    if not bodies:
+        print("❌ 没有找到图片", file=sys.stderr)
+        return 1
+
+    server = None
+    url = args.url
+    if args.start:
+        port = free_port()
+        print(f"🚀 启动服务器: run_server.py -p {port} {args.server_args}", file=sys.stderr)
+        server = start_server(port, args.server_args.split(), log_path=args.server_log)
+        url = f"http://localhost:{port}"
+
+    try:
+        # 预热请求写入单独的记录器，不计入统计
+        warmup_recorder = Recorder()
+        warmup_recorder.start()
+        generator = LoadGenerator(url, bodies, warmup_recorder, keepalive=not args.no_keepalive, timeout=args.timeout)
+        for _ in range(args.warmup):
+            generator.send()
+        recorder = generator.recorder = Recorder()
+
+        mode = f"到达率 {args.rate}/s" if args.rate else f"并发 {args.concurrency}"
+        print(f"📈 {url}，{len(bodies)} 张图片，{mode}，时长 {args.duration}s", file=sys.stderr)
+        recorder.start()
+        if args.rate:
+            generator.run_rate(args.rate, args.duration, args.max_inflight, args.requests)
+        else:
+            generator.run_concurrency(args.concurrency, args.duration, args.requests)
+        recorder.stop()
+
+        report = {
+            'config': {
+                'url': url,
+                'images': len(bodies),
+                'mode': 'rate' if args.rate else 'concurrency',
+                'rate': args.rate,
+                'concurrency': None if args.rate else args.concurrency,
+                'duration': args.duration,
+                'window': args.window,
+                'keepalive': not args.no_keepalive,
+                'profile': args.profile,
+                'server_args': args.server_args if args.start else None
+            },
+            'summary': recorder.summary(),
+            'windows': recorder.windows(args.window),
+            'server_stats': fetch_server_stats(url)
+        }
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print(format_report(report))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fout:
+            json.dump(report, fout, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,87 +3,302 @@
 
 """
 简单的OCR API服务器
-使用Python内置的http.server
+使用Python内置的http.server，HTTP/1.1长连接，每个连接一个线程
 """
 
 import json
-import base64
-import cv2
-import numpy as np
-import io
+import hmac
 import argparse
 import sys
-import platform
 import os
-from PIL import Image
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
-from src.core.main import det_rec_functions, filter_box_rec
 import threading
 import time
+# 导入配置时会完成Windows编码设置
 from src.utils.config import (
-    SERVER_HOST, SERVER_PORT, SERVER_DEBUG,
-    DET_MODEL_PATH, REC_MODEL_PATH, OCR_KEYS_PATH,
+    SERVER_HOST, SERVER_PORT, SERVER_DEBUG, KEEPALIVE_TIMEOUT, GZIP_MIN_SIZE, GZIP_LEVEL,
+    DET_MODEL_PATH, REC_MODEL_PATH, OCR_KEYS_PATH, DEFAULT_REC_MODEL,
     SUCCESS_RESPONSE, ERROR_RESPONSE,
-    REQUEST_TIMEOUT, LOG_FORMAT
+    REQUEST_TIMEOUT, LOG_FORMAT,
+    WARMUP_ENABLED, WARMUP_DET_SIZES, WARMUP_REC_WIDTHS, SHAPE_BUCKETS_ENABLED,
+    STARTUP_HEALTH_TARGET_MS, RESPONSE_PROFILE, RESPONSE_PROFILES,
+    CHAR_TOPK, CHAR_ALT_THRESHOLD, JOBS_ENABLED, JOBS_DB_PATH, JOBS_WORKERS, JOBS_MAX_IMAGES,
+    MULTIPAGE_MAX_PAGES, MEMORY_TRACKING, MODEL_WATCH_INTERVAL, MODEL_RELOAD_DIR, MODEL_RELOAD_TOKEN,
+    FONT_PATH, VISUALIZE_FORMAT, VISUALIZE_QUALITY
 )
+from src.utils.startup_profile import StartupProfiler
 
-# 导入编码处理模块
-try:
-    from src.utils.encoding_utils import setup_windows_encoding
-    setup_windows_encoding()
-except ImportError:
-    # 如果无法导入，使用内联的编码处理
-    if platform.system() == 'Windows':
-        import codecs
-        import locale
-        
-        # 尝试设置控制台编码为UTF-8
+# cv2、onnxruntime、PIL 等重量级依赖以及OCR引擎都在首次使用时才导入，
+# 进程启动后可以立即开始监听并响应 /health
+
+# 全局共享的OCR引擎，首次使用时加载
+_engine = None
+_engine_lock = threading.Lock()
+# 创建引擎时的附加参数，由 run_server 设置
+_engine_options = {}
+
+
+def get_engine():
+    """获取全局OCR引擎，模型只加载一次"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                from src.core.engine import OCREngine
+                _engine = OCREngine(DET_MODEL_PATH, REC_MODEL_PATH, OCR_KEYS_PATH, **_engine_options)
+    return _engine
+
+
+# 增量识别的会话表，首次使用时创建
+_session_store = None
+
+
+def get_session_store():
+    global _session_store
+    if _session_store is None:
+        with _engine_lock:
+            if _session_store is None:
+                from src.core.incremental import SessionStore
+                _session_store = SessionStore(get_engine)
+    return _session_store
+
+
+def session_unsupported_options(data, options, query=None):
+    """增量识别会话不支持的参数：会话复用之前截图的识别结果，逐次变化的选项无法生效"""
+    query = query or {}
+    unsupported = []
+    if data.get('rois') is not None:
+        unsupported.append('rois')
+    if data.get('char_details') or 'topk' in data:
+        unsupported.append('char_details/topk')
+    if options['model'] not in (None, DEFAULT_REC_MODEL):
+        unsupported.append('model')
+    if query.get('visualize', [str(data.get('visualize', ''))])[0].lower() in ('1', 'true'):
+        unsupported.append('visualize')
+    return unsupported
+
+
+# 异步任务：SQLite任务表和后台识别线程，由 run_server 启动
+_job_store = None
+_job_workers = None
+
+# 请求级内存统计，--memory-tracking 时由 run_server 创建
+_memory_tracker = None
+
+
+def decode_image_bytes(image_data):
+    """把图片文件的字节解码为OpenCV图像"""
+    import io
+    import cv2
+    import numpy as np
+    from PIL import Image
+    # 转换为PIL图像
+    image = Image.open(io.BytesIO(image_data))
+    # 转换为OpenCV格式
+    return cv2.cvtColor(np.array(image.convert('RGB')), cv2.COLOR_RGB2BGR)
+
+
+def decode_base64(base64_string):
+    """base64字符串解码为字节，去掉可能的 data:image/jpeg;base64, 前缀"""
+    import base64
+    if ',' in base64_string:
+        base64_string = base64_string.split(',')[1]
+    return base64.b64decode(base64_string)
+
+
+def parse_recognition_options(data, query=None):
+    """
+    解析请求中的识别参数
+    :return: {'profile', 'char_topk', 'alt_threshold', 'model'}
+    :raises ValueError: 参数不合法
+    """
+    # 响应格式：查询参数 ?profile= 优先，其次是请求体中的 profile 字段
+    query = query or {}
+    profile = query.get('profile', [data.get('profile', RESPONSE_PROFILE)])[0]
+    if profile not in RESPONSE_PROFILES:
+        raise ValueError(f"不支持的profile: {profile}，可选: {', '.join(RESPONSE_PROFILES)}")
+    # 逐字符置信度和候选，默认关闭
+    char_topk = None
+    if data.get('char_details'):
         try:
-            # 设置环境变量
-            os.environ['PYTHONIOENCODING'] = 'utf-8'
-            
-            # 重新配置stdout和stderr
-            if hasattr(sys.stdout, 'detach'):
-                sys.stdout = codecs.getwriter('utf-8')(sys.stdout.detach())
-            if hasattr(sys.stderr, 'detach'):
-                sys.stderr = codecs.getwriter('utf-8')(sys.stderr.detach())
-            
-            # 设置locale
-            if hasattr(locale, 'setlocale'):
-                try:
-                    locale.setlocale(locale.LC_ALL, 'C.UTF-8')
-                except locale.Error:
-                    try:
-                        locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')
-                    except locale.Error:
-                        pass
-        except Exception:
-            # 如果设置失败，使用安全的打印函数
-            def safe_print(*args, **kwargs):
-                try:
-                    print(*args, **kwargs)
-                except UnicodeEncodeError:
-                    # 如果出现编码错误，尝试使用ASCII编码
-                    for arg in args:
-                        try:
-                            print(str(arg).encode('ascii', 'replace').decode('ascii'), end=' ')
-                        except:
-                            print('[编码错误]', end=' ')
-                    print()
-            
-            # 替换print函数
-            import builtins
-            builtins.print = safe_print
+            char_topk = int(data.get('topk', CHAR_TOPK))
+        except (TypeError, ValueError):
+            raise ValueError("topk 必须是整数")
+    try:
+        alt_threshold = float(data.get('alt_threshold', CHAR_ALT_THRESHOLD))
+    except (TypeError, ValueError):
+        raise ValueError("alt_threshold 必须是数字")
+    # 识别模型：模型名或语言代码，省略时为默认模型
+    model = query.get('model', [data.get('model')])[0]
+    if model:
+        model = get_engine().registry.resolve(model)
+    return {'profile': profile, 'char_topk': char_topk, 'alt_threshold': alt_threshold, 'model': model or None}
+
+
+def process_job_page(image_data, options):
+    """识别异步任务中的一页，返回与 /ocr 的 data 字段相同的结果"""
+    image = decode_image_bytes(image_data)
+    result = get_engine().ocr_result(image, options.get('char_topk'),
+                                     options.get('alt_threshold', CHAR_ALT_THRESHOLD), model=options.get('model'))
+    return result.to_response(options.get('profile', RESPONSE_PROFILE))
+
+
+def start_jobs(db_path=JOBS_DB_PATH, workers=JOBS_WORKERS):
+    """打开任务数据库并启动后台识别线程，上次未完成的任务继续处理"""
+    global _job_store, _job_workers
+    from src.core.jobs import JobStore, JobWorkers
+    _job_store = JobStore(db_path)
+    _job_workers = JobWorkers(_job_store, process_job_page, workers)
+    recovered, abandoned = _job_workers.start()
+    if recovered:
+        print(f"📋 重新排队 {recovered} 个未完成的任务页")
+    if abandoned:
+        print(f"⚠️ {abandoned} 个任务页多次处理均未完成，已标记为失败")
+
+
+def accepts_gzip(accept_encoding):
+    """Accept-Encoding 中是否包含gzip（或*）且q值不为0"""
+    for item in (accept_encoding or '').split(','):
+        name, _, params = item.strip().partition(';')
+        if name.strip().lower() not in ('gzip', '*'):
+            continue
+        params = params.strip().replace(' ', '')
+        if params.startswith('q='):
+            try:
+                return float(params[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+
+# 启动耗时分析，--profile-startup 时启用
+_profiler = None
+
+# 就绪状态：模型加载并预热完成后置位
+_ready = threading.Event()
+_warmup_info = {'state': 'pending'}
+
+
+def warmup_engine(det_sizes=WARMUP_DET_SIZES, rec_widths=WARMUP_REC_WIDTHS):
+    """加载模型并预热，完成后 /ready 返回200"""
+    _warmup_info['state'] = 'warming'
+    start_time = time.time()
+    try:
+        if _profiler is not None:
+            _profiler.time_imports()
+        engine = get_engine()
+        if _profiler is not None:
+            for name, seconds in engine.load_timings.items():
+                _profiler.record(f"加载模型: {name}", seconds)
+        timings = engine.warmup(det_sizes, rec_widths)
+    except Exception as e:
+        _warmup_info.update({'state': 'failed', 'error': str(e)})
+        print(f"❌ 模型预热失败: {e}")
+        return
+    _warmup_info.update({
+        'state': 'ready',
+        'load_ms': round(engine.load_time * 1000, 2),
+        'total_ms': round((time.time() - start_time) * 1000, 2),
+        'timings_ms': timings
+    })
+    _ready.set()
+    print(f"🔥 模型预热完成，耗时 {_warmup_info['total_ms']:.0f}ms")
+    if _profiler is not None:
+        _profiler.record('模型预热', sum(timings['det'].values()) / 1000.0 + sum(timings['rec'].values()) / 1000.0)
+        _profiler.mark('就绪')
+        _warmup_info['startup'] = _profiler.summary()
+        _profiler.report()
+
+
+# 模型热更新状态：idle / reloading / failed
+_reload_info = {'state': 'idle'}
+_reload_guard = threading.Lock()
+# 热更新时的预热尺寸，与启动预热相同，由 run_server 设置
+_warmup_sizes = {'det_sizes': WARMUP_DET_SIZES, 'rec_widths': WARMUP_REC_WIDTHS}
+
+
+def reload_models(det_file=None, rec_file=None, ocr_keys_file=None):
+    """
+    加载新模型、预热后替换，期间照常处理请求；已有热更新在进行时返回False
+    失败时继续使用原模型，错误记录在 _reload_info 中
+    """
+    with _reload_guard:
+        if _reload_info['state'] == 'reloading':
+            return False
+        _reload_info.update({'state': 'reloading', 'started': round(time.time(), 3)})
+    try:
+        info = get_engine().reload(det_file, rec_file, ocr_keys_file, **_warmup_sizes)
+    except Exception as e:
+        _reload_info.update({'state': 'failed', 'error': str(e), 'finished': round(time.time(), 3)})
+        print(f"❌ 模型热更新失败，继续使用原模型: {e}")
+        return True
+    _reload_info.update({'state': 'idle', 'error': None, 'finished': round(time.time(), 3), 'last': info})
+    print(f"🔄 模型已更新，指纹 {info['fingerprint']}")
+    return True
+
+
+def watch_models(interval=MODEL_WATCH_INTERVAL):
+    """
+    定期检查当前模型文件的修改时间和大小，变化后自动热更新
+    文件在连续两次检查之间不再变化才加载，避免读到复制到一半的文件；加载失败的版本不再重试
+    """
+    def signature():
+        files = get_engine().models.files
+        try:
+            return tuple((os.path.getmtime(files[name]['path']), os.path.getsize(files[name]['path']))
+                         for name in ('det', 'rec', 'keys'))
+        except OSError:
+            return None
+
+    _ready.wait()
+    loaded = signature()
+    previous = failed = None
+    while True:
+        time.sleep(interval)
+        current = signature()
+        if current is None or current == loaded or current == failed:
+            previous = current
+            continue
+        if current == previous:
+            print("👀 检测到模型文件变化，开始热更新")
+            reload_models()
+            if _reload_info['state'] == 'failed':
+                failed = current
+            else:
+                loaded = signature()
+        previous = current
+
 
 class OCRRequestHandler(BaseHTTPRequestHandler):
+    # 响应都带 Content-Length（流式响应用分块编码），连接可以复用
+    protocol_version = 'HTTP/1.1'
+    # 长连接空闲超时，超时后 handle() 结束并关闭连接
+    timeout = KEEPALIVE_TIMEOUT
+    # 响应头和响应体分两次写出，长连接上开着Nagle算法会与客户端的延迟ACK叠加出约40ms的等待
+    disable_nagle_algorithm = True
+    
     def do_GET(self):
         """处理GET请求"""
         parsed_url = urlparse(self.path)
         path = parsed_url.path
+        self.timings = None
         
         if path == '/health':
             self.send_health_response()
+        elif path == '/ready':
+            self.send_ready_response()
+        elif path == '/stats':
+            self.send_stats_response()
+        elif path.startswith('/jobs/'):
+            self.send_job_response(path[len('/jobs/'):])
+        elif path == '/admin/reload':
+            self.send_json_response(200, self.reload_status())
+        elif path == '/admin/memory':
+            self.send_memory_response()
+        elif path == '/admin/memory/diff':
+            self.send_memory_diff_response(parse_qs(parsed_url.query))
         elif path == '/':
             self.send_info_response()
         else:
@@ -93,132 +308,312 @@ class OCRRequestHandler(BaseHTTPRequestHandler):
         """处理POST请求"""
         parsed_url = urlparse(self.path)
         path = parsed_url.path
+        # 同一连接上的下一个请求从请求体之后开始，未读取的请求体在响应前丢弃
+        self.body_read = False
+        self.timings = None
         
         if path == '/ocr':
-            self.handle_ocr_request()
+            self.handle_ocr_request(parse_qs(parsed_url.query))
+        elif path == '/jobs':
+            self.handle_job_submit(parse_qs(parsed_url.query))
+        elif path == '/admin/reload':
+            self.handle_reload_request()
+        elif path == '/admin/memory/snapshot':
+            self.handle_memory_snapshot()
+        elif path == '/admin/memory/sample':
+            self.handle_memory_sample()
         else:
             self.send_error_response(404, "接口不存在")
     
-    def handle_ocr_request(self):
-        """处理OCR识别请求"""
+    def read_content_length(self):
+        """请求体长度，Content-Length 不是非负整数时已发送400响应并返回None"""
         try:
-            # 获取请求内容长度
             content_length = int(self.headers.get('Content-Length', 0))
-            if content_length == 0:
-                self.send_error_response(400, "请求体为空")
+        except ValueError:
+            content_length = -1
+        if content_length < 0:
+            # 无法确定请求体在哪里结束，发送响应后关闭连接
+            self.body_read = True
+            self.close_connection = True
+            self.send_error_response(400, "Content-Length 不合法")
+            return None
+        return content_length
+    
+    def read_json_body(self, allow_empty=False):
+        """
+        读取并解析JSON请求体，出错时已发送400响应并返回None
+        :param allow_empty: 为True时没有请求体返回空字典
+        """
+        # 获取请求内容长度
+        content_length = self.read_content_length()
+        if content_length is None:
+            return None
+        if content_length == 0:
+            if allow_empty:
+                return {}
+            self.send_error_response(400, "请求体为空")
+            return None
+        
+        # 读取请求数据
+        post_data = self.rfile.read(content_length)
+        self.body_read = True
+        
+        # 解析JSON数据
+        try:
+            data = json.loads(post_data.decode('utf-8'))
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            self.send_error_response(400, "JSON格式错误")
+            return None
+        if not isinstance(data, dict):
+            self.send_error_response(400, "请求体必须是JSON对象")
+            return None
+        return data
+    
+    def discard_body(self):
+        """丢弃未读取的请求体，否则长连接上的下一个请求会从请求体中间开始解析"""
+        if self.command != 'POST' or getattr(self, 'body_read', True):
+            return
+        self.body_read = True
+        try:
+            remaining = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            self.close_connection = True
+            return
+        while remaining > 0:
+            chunk = self.rfile.read(min(remaining, 65536))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+    
+    def handle_ocr_request(self, query=None):
+        """处理OCR识别请求，各阶段耗时通过 Server-Timing 响应头返回"""
+        self.request_start = time.time()
+        # 开启内存统计时，各阶段在记录耗时的同时记录内存变化
+        self.timings = _memory_tracker.begin() if _memory_tracker is not None else {}
+        try:
+            data = self.read_json_body()
+            if data is None:
                 return
+            self.timings['read'] = time.time() - self.request_start
             
-            # 读取请求数据
-            post_data = self.rfile.read(content_length)
+            # 检查必要字段
+            if 'image' not in data:
+                self.send_error_response(400, "缺少image字段")
+                return
             
-            # 解析JSON数据
             try:
-                data = json.loads(post_data.decode('utf-8'))
-            except json.JSONDecodeError:
-                self.send_error_response(400, "JSON格式错误")
+                options = parse_recognition_options(data, query)
+            except ValueError as e:
+                self.send_error_response(400, str(e))
                 return
+            profile = options['profile']
             
-            # 检查必要字段
-            if 'image' not in data:
-                self.send_error_response(400, "缺少image字段")
+            # 多页TIFF、GIF等逐页识别
+            if data.get('multipage'):
+                stream = query.get('stream', [str(data.get('stream', ''))])[0].lower() in ('1', 'true')
+                self.handle_multipage_request(data['image'], options, stream)
                 return
             
             # 处理base64图片
             base64_image = data['image']
+            decode_start = time.time()
             image = self.base64_to_image(base64_image)
+            self.timings['decode'] = time.time() - decode_start
+            
+            # 带session_id时只识别与上一张截图相比发生变化的区域
+            session_id = data.get('session_id')
+            if session_id:
+                # 不支持的选项不能静默忽略
+                unsupported = session_unsupported_options(data, options, query)
+                if unsupported:
+                    self.send_error_response(400, f"session_id 不能与以下参数同时使用: {', '.join(unsupported)}")
+                    return
+                self.send_success_response(
+                    self.process_session_image(str(session_id), image, bool(data.get('reset', False)), profile),
+                    compact=profile != 'full')
+                return
+            
+            char_topk, alt_threshold = options['char_topk'], options['alt_threshold']
+            
+            # 只识别客户端指定的区域
+            rois = None
+            if data.get('rois') is not None:
+                from src.core.regions import parse_rois
+                try:
+                    rois = parse_rois(data['rois'], image.shape)
+                except ValueError as e:
+                    self.send_error_response(400, str(e))
+                    return
+            
+            # 可视化需要字体文件，识别之前先检查
+            visualize = query.get('visualize', [str(data.get('visualize', ''))])[0].lower() in ('1', 'true')
+            if visualize and not os.path.exists(FONT_PATH):
+                self.send_error_response(503, f"可视化所需的字体文件不存在: {FONT_PATH}")
+                return
             
             # 执行OCR识别
-            results = self.process_image(image)
+            result = self.process_image(image, char_topk, alt_threshold, rois, self.timings, options['model'])
+            response = result.to_response(profile)
+            if visualize:
+                import base64
+                from src.core.visualize import encode_visualization
+                start_time = time.time()
+                response['visualization'] = base64.b64encode(encode_visualization(
+                    image, result, VISUALIZE_FORMAT, VISUALIZE_QUALITY)).decode('ascii')
+                self.timings['visualize'] = time.time() - start_time
             
             # 返回结果
-            self.send_success_response({
-                'text_count': len(results),
-                'results': results
-            })
+            self.send_success_response(response, compact=profile != 'full')
             
         except Exception as e:
             self.send_error_response(500, f"服务器内部错误: {str(e)}")
+        finally:
+            if _memory_tracker is not None:
+                _memory_tracker.finish(self.timings, self.path)
     
     def base64_to_image(self, base64_string):
         """将base64字符串转换为OpenCV图像"""
         try:
-            # 移除可能的data:image/jpeg;base64,前缀
-            if ',' in base64_string:
-                base64_string = base64_string.split(',')[1]
-            
-            # 解码base64
-            image_data = base64.b64decode(base64_string)
-            
-            # 转换为PIL图像
-            image = Image.open(io.BytesIO(image_data))
-            
-            # 转换为OpenCV格式
-            image_cv = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-            
-            return image_cv
+            return decode_image_bytes(decode_base64(base64_string))
         except Exception as e:
             raise ValueError(f"Base64解码失败: {e}")
     
-    def process_image(self, image):
-        """处理图像并返回OCR结果"""
+    def handle_multipage_request(self, base64_image, options, stream=False):
+        """
+        逐页解码并识别多帧图片，内存中只保留当前页
+        stream 为True时每识别完一页就输出一行JSON（NDJSON），最后一行为汇总
+        """
+        from src.core.frames import open_frames, read_frame
         try:
-            # 创建OCR系统实例
-            ocr_system = det_rec_functions(
-                image, 
-                DET_MODEL_PATH, 
-                REC_MODEL_PATH, 
-                OCR_KEYS_PATH
-            )
-            
-            # 获取检测框
-            dt_boxes = ocr_system.get_boxes()
-            
-            # 识别文本
-            rec_results, rec_results_info = ocr_system.recognition_img(dt_boxes)
-            
-            # 根据置信度过滤结果
-            dt_boxes, rec_results = filter_box_rec(dt_boxes, rec_results)
+            image, total, count = open_frames(decode_base64(base64_image), MULTIPAGE_MAX_PAGES)
+        except Exception as e:
+            self.send_error_response(400, f"图片解码失败: {e}")
+            return
+        summary = {'page_count': total, 'processed': count, 'truncated': count < total}
+        
+        if stream:
+            # 总长度事先未知：HTTP/1.1 用分块编码，每页一块；HTTP/1.0 客户端以关闭连接表示结束
+            self.chunked = self.request_version == 'HTTP/1.1'
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+            if self.chunked:
+                self.send_header('Transfer-Encoding', 'chunked')
+            else:
+                self.send_header('Connection', 'close')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+        pages = []
+        for index in range(count):
+            try:
+                frame = read_frame(image, index)
+                result = self.process_image(frame, options['char_topk'], options['alt_threshold'],
+                                            timings=self.timings, model=options['model'])
+                page = {'page': index, 'success': True, 'data': result.to_response(options['profile'])}
+            except Exception as e:
+                # 单页失败不影响其余页
+                page = {'page': index, 'success': False, 'error': str(e)}
+            # 释放当前页，下一页解码前内存中只有压缩数据
+            frame = None
+            if stream:
+                self.write_chunk((json.dumps(page, ensure_ascii=False) + '\n').encode('utf-8'))
+            else:
+                pages.append(page)
+        image.close()
+        
+        if stream:
+            summary['done'] = True
+            self.write_chunk((json.dumps(summary, ensure_ascii=False) + '\n').encode('utf-8'))
+            # 长度为0的块表示响应结束
+            if self.chunked:
+                self.write_chunk(b'')
+            return
+        summary['pages'] = pages
+        self.send_success_response(summary, compact=options['profile'] != 'full')
+    
+    def handle_job_submit(self, query=None):
+        """提交异步任务：保存图片后立即返回任务ID，识别在后台进行"""
+        if _job_store is None:
+            self.send_error_response(503, "异步任务未启用，使用 --jobs 启动")
+            return
+        try:
+            data = self.read_json_body()
+            if data is None:
+                return
+            images = data.get('images')
+            if images is None and 'image' in data:
+                images = [data['image']]
+            if not isinstance(images, list) or not images:
+                self.send_error_response(400, "缺少images字段")
+                return
+            if len(images) > JOBS_MAX_IMAGES:
+                self.send_error_response(400, f"单个任务最多 {JOBS_MAX_IMAGES} 张图片")
+                return
+            try:
+                options = parse_recognition_options(data, query)
+                image_data = [decode_base64(image) for image in images]
+            except (ValueError, TypeError) as e:
+                self.send_error_response(400, str(e))
+                return
+            job_id = _job_store.create(image_data, options)
+            _job_workers.notify()
+            self.send_json_response(202, {
+                'success': True,
+                'job_id': job_id,
+                'status': 'queued',
+                'pages': len(image_data)
+            })
+        except Exception as e:
+            self.send_error_response(500, f"服务器内部错误: {str(e)}")
+    
+    def send_job_response(self, job_id):
+        """查询异步任务的状态和已完成页的结果"""
+        if _job_store is None:
+            self.send_error_response(503, "异步任务未启用，使用 --jobs 启动")
+            return
+        job = _job_store.get(job_id)
+        if job is None:
+            self.send_error_response(404, "任务不存在或已过期")
+            return
+        job['success'] = True
+        self.send_json_response(200, job)
+    
+    def process_image(self, image, char_topk=None, alt_threshold=CHAR_ALT_THRESHOLD, rois=None, timings=None,
+                      model=None):
+        """处理图像并返回OCR结果（OCRResult），timings 不为None时累加各阶段耗时，model 为识别模型名"""
+        try:
+            # 检测+识别，并根据置信度过滤结果
+            return get_engine().ocr_result(image, char_topk, alt_threshold, rois, timings, model)
             
-            # 格式化结果
-            results = []
-            for i, (box, rec_result) in enumerate(zip(dt_boxes, rec_results)):
-                text, score = rec_result
-                
-                # 计算边界框坐标
-                box = box.astype(np.int32)
-                xmin = int(np.min(box[:, 0]))
-                xmax = int(np.max(box[:, 0]))
-                ymin = int(np.min(box[:, 1]))
-                ymax = int(np.max(box[:, 1]))
-                
-                # 格式化边界框为四个角点坐标
-                box_points = box.tolist()
-                
-                result = {
-                    "text": text,
-                    "confidence": float(score),
-                    "bbox": {
-                        "xmin": xmin,
-                        "ymin": ymin,
-                        "xmax": xmax,
-                        "ymax": ymax,
-                        "points": box_points  # 四个角点坐标
-                    }
+        except Exception as e:
+            raise Exception(f"OCR处理失败: {e}")
+    
+    def process_session_image(self, session_id, image, reset=False, profile='full'):
+        """按会话增量识别截图，返回合并后的完整结果"""
+        from src.core.result import OCRResult
+        try:
+            session = get_session_store().get(session_id)
+            with session.lock:
+                result = session.process(image, reset)
+            response = OCRResult.from_rec(result['boxes'], result['rec_results']).to_response(profile)
+            response.update({
+                'incremental': {
+                    'session_id': session_id,
+                    'full': result['full'],
+                    'regions': result['regions'],
+                    'changed_ratio': round(result['changed_ratio'], 4)
                 }
-                results.append(result)
-            
-            return results
-            
+            })
+            return response
         except Exception as e:
             raise Exception(f"OCR处理失败: {e}")
     
-    def send_success_response(self, data):
+    def send_success_response(self, data, compact=False):
         """发送成功响应"""
         response = {
             'success': True,
             'data': data
         }
-        self.send_json_response(200, response)
+        self.send_json_response(200, response, compact)
     
     def send_error_response(self, status_code, message):
         """发送错误响应"""
@@ -228,31 +623,230 @@ class OCRRequestHandler(BaseHTTPRequestHandler):
         }
         self.send_json_response(status_code, response)
     
-    def send_json_response(self, status_code, data):
-        """发送JSON响应"""
-        response_data = json.dumps(data, ensure_ascii=False, indent=2)
+    def send_json_response(self, status_code, data, compact=False):
+        """
+        发送JSON响应，compact 为True时不缩进、不加多余空格
+        客户端支持gzip且响应体不小于 GZIP_MIN_SIZE 时压缩
+        """
+        if compact:
+            response_data = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+        else:
+            response_data = json.dumps(data, ensure_ascii=False, indent=2)
+        body = response_data.encode('utf-8')
+        
+        gzipped = False
+        if GZIP_MIN_SIZE and len(body) >= GZIP_MIN_SIZE and accepts_gzip(self.headers.get('Accept-Encoding')):
+            import gzip
+            body = gzip.compress(body, GZIP_LEVEL)
+            gzipped = True
         
+        self.discard_body()
         self.send_response(status_code)
         self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if self.timings is not None:
+            self.send_header('Server-Timing', self.server_timing())
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        if GZIP_MIN_SIZE:
+            self.send_header('Vary', 'Accept-Encoding')
+        if self.close_connection:
+            self.send_header('Connection', 'close')
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
         self.end_headers()
         
-        self.wfile.write(response_data.encode('utf-8'))
+        self.wfile.write(body)
+    
+    def server_timing(self):
+        """
+        Server-Timing 响应头：read（读取并解析请求体）、decode（图片解码）、content/det/rec（见 OCREngine.ocr_result）
+        visualize（绘制标注图）以及 total（从收到请求头到开始发送响应），单位毫秒
+        """
+        timings = dict(self.timings, total=time.time() - self.request_start)
+        return ', '.join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in timings.items())
+    
+    def write_chunk(self, data):
+        """流式响应写出一块，分块编码时 data 为空表示响应结束"""
+        if self.chunked:
+            data = b'%x\r\n%s\r\n' % (len(data), data)
+        self.wfile.write(data)
+        self.wfile.flush()
     
     def send_health_response(self):
         """发送健康检查响应"""
-        self.send_json_response(200, SUCCESS_RESPONSE)
+        if _profiler is not None:
+            elapsed_ms = _profiler.mark_once('首次/health响应')
+            if elapsed_ms is not None:
+                print(f"⏱️  首次 /health 响应: 自进程启动 {elapsed_ms:.1f}ms (目标 {_profiler.target_ms}ms)")
+        # 模型指纹，模型尚未加载时为None
+        model = _engine.models.fingerprint if _engine is not None else None
+        self.send_json_response(200, dict(SUCCESS_RESPONSE, model=model))
+    
+    def send_ready_response(self):
+        """发送就绪检查响应，预热完成前返回503"""
+        if _ready.is_set():
+            self.send_json_response(200, {'success': True, 'ready': True, 'warmup': _warmup_info})
+        else:
+            self.send_json_response(503, {'success': False, 'ready': False, 'warmup': _warmup_info})
+    
+    def send_stats_response(self):
+        """发送运行统计：尺寸分桶的调用次数、耗时和缓冲区分配，空白检查计数，以及识别模型的加载情况"""
+        buckets = _engine.bucket_stats() if _engine is not None else None
+        content = _engine.content_stats() if _engine is not None else None
+        models = _engine.registry.stats() if _engine is not None else None
+        self.send_json_response(200, {
+            'success': True,
+            'shape_buckets': _engine_options.get('shape_buckets', SHAPE_BUCKETS_ENABLED),
+            'buckets': buckets,
+            'content_check': content,
+            'rec_models': models
+        })
+    
+    def reload_status(self):
+        status = dict(_reload_info, success=True)
+        status['model'] = _engine.model_info() if _engine is not None else None
+        return status
+    
+    def handle_reload_request(self):
+        """
+        热更新模型，body 可选 {"det": 路径, "rec": 路径, "keys": 路径, "wait": true}
+        默认在后台加载并立即返回202，wait 为true时等待完成
+        只接受 MODEL_RELOAD_DIR 下的文件；设置了 MODEL_RELOAD_TOKEN 时需要带 X-Admin-Token 请求头
+        """
+        token = self.headers.get('X-Admin-Token', '')
+        if MODEL_RELOAD_TOKEN and not hmac.compare_digest(token.encode('utf-8'), MODEL_RELOAD_TOKEN.encode('utf-8')):
+            self.send_error_response(401, "缺少或错误的 X-Admin-Token")
+            return
+        data = self.read_json_body(allow_empty=True)
+        if data is None:
+            return
+        if not _ready.is_set():
+            self.send_error_response(503, "模型尚未就绪")
+            return
+        files = {name: data.get(name) for name in ('det', 'rec', 'keys')}
+        model_dir = os.path.realpath(MODEL_RELOAD_DIR)
+        for name, path in files.items():
+            if path is None:
+                continue
+            if not isinstance(path, str):
+                self.send_error_response(400, f"{name} 必须是文件路径")
+                return
+            # 按解析符号链接后的实际路径检查并加载，避免检查之后链接被改到目录外
+            real_path = os.path.realpath(path)
+            if os.path.commonpath([model_dir, real_path]) != model_dir:
+                self.send_error_response(403, f"{name} 模型文件必须位于 {MODEL_RELOAD_DIR} 目录下: {path}")
+                return
+            if not os.path.isfile(real_path):
+                self.send_error_response(400, f"{name} 模型文件不存在: {path}")
+                return
+            files[name] = real_path
+        if _reload_info['state'] == 'reloading':
+            self.send_error_response(409, "模型热更新正在进行")
+            return
+        args = (files['det'], files['rec'], files['keys'])
+        if data.get('wait'):
+            if not reload_models(*args):
+                self.send_error_response(409, "模型热更新正在进行")
+                return
+            status = self.reload_status()
+            status['success'] = _reload_info['state'] != 'failed'
+            self.send_json_response(200 if status['success'] else 500, status)
+            return
+        threading.Thread(target=reload_models, args=args, name='model-reload', daemon=True).start()
+        self.send_json_response(202, {'success': True, 'state': 'reloading'})
+    
+    def memory_tracker(self):
+        """内存统计未开启时发送503并返回None"""
+        if _memory_tracker is None:
+            self.send_error_response(503, "内存统计未启用，使用 --memory-tracking 启动")
+        return _memory_tracker
+    
+    def send_memory_response(self):
+        """内存统计：当前RSS和Python分配、逐请求及各阶段的内存变化、采样得到的各阶段分配位置"""
+        tracker = self.memory_tracker()
+        if tracker is None:
+            return
+        from src.utils.memory import live_objects
+        stats = tracker.stats()
+        stats['live_objects'] = live_objects()
+        stats['success'] = True
+        self.send_json_response(200, stats)
+    
+    def send_memory_diff_response(self, query):
+        """比较两个快照（?from=&to=，省略 to 时与当前状态比较），列出新增内存最多的分配位置"""
+        tracker = self.memory_tracker()
+        if tracker is None:
+            return
+        old = query.get('from', [None])[0]
+        group = query.get('group', ['lineno'])[0]
+        if old is None:
+            self.send_error_response(400, "缺少from参数")
+            return
+        if group not in ('lineno', 'filename', 'traceback'):
+            self.send_error_response(400, "group 可选: lineno/filename/traceback")
+            return
+        try:
+            limit = int(query.get('limit', [0])[0]) or None
+            diff = tracker.diff(old, query.get('to', [None])[0], group, limit)
+        except KeyError as e:
+            self.send_error_response(404, f"快照不存在: {e}")
+            return
+        except ValueError:
+            self.send_error_response(400, "limit 必须是整数")
+            return
+        diff['success'] = True
+        self.send_json_response(200, diff)
+    
+    def handle_memory_snapshot(self):
+        """保存一个tracemalloc快照，body 可选 {"name": "..."}"""
+        tracker = self.memory_tracker()
+        if tracker is None:
+            return
+        data = self.read_json_body(allow_empty=True)
+        if data is None:
+            return
+        snapshot = tracker.snapshot(data.get('name'))
+        snapshot['success'] = True
+        self.send_json_response(200, snapshot)
+    
+    def handle_memory_sample(self):
+        """之后的若干个请求在阶段边界取快照，统计各阶段的分配位置，body 为 {"requests": N}"""
+        tracker = self.memory_tracker()
+        if tracker is None:
+            return
+        data = self.read_json_body()
+        if data is None:
+            return
+        try:
+            requests = int(data.get('requests', 10))
+        except (TypeError, ValueError):
+            self.send_error_response(400, "requests 必须是整数")
+            return
+        tracker.sample_stages(requests)
+        self.send_json_response(200, {'success': True, 'sampling': requests})
     
     def send_info_response(self):
         """发送API信息响应"""
         response = {
             'success': True,
             'message': 'OCR识别API服务',
+            # 当前生效的模型指纹和文件，模型尚未加载时为None
+            'model': _engine.model_info() if _engine is not None else None,
             'endpoints': {
                 'POST /ocr': 'OCR识别接口，需要传入base64编码的图片',
+                'POST /jobs': '提交异步识别任务，body 为 {"images": [base64, ...]}，可带 /ocr 的识别参数，立即返回 job_id',
+                'GET /jobs/<job_id>': '查询异步任务状态，results 为已完成各页的结果',
                 'GET /health': '健康检查接口',
+                'GET /ready': '就绪检查接口，模型预热完成前返回503',
+                'GET /stats': '运行统计：空白检查计数，开启 --shape-buckets 时包含各尺寸桶的耗时和内存分配',
+                'GET /admin/memory': '内存统计（--memory-tracking）：RSS、Python分配、逐请求和各阶段的内存变化',
+                'GET /admin/reload': '模型热更新状态和当前模型指纹',
+                'POST /admin/reload': f'热更新模型: body 可选 {{"det": 路径, "rec": 路径, "keys": 路径, "wait": true}}，路径须在 {MODEL_RELOAD_DIR} 目录下',
+                'POST /admin/memory/snapshot': '保存tracemalloc快照，body 可选 {"name": "..."}',
+                'GET /admin/memory/diff': '比较快照: ?from=名称&to=名称（省略时与当前比较）&group=lineno/filename/traceback',
+                'POST /admin/memory/sample': '之后的 N 个请求按阶段统计分配位置，body 为 {"requests": N}',
                 'GET /': 'API说明'
             },
             'usage': {
@@ -260,7 +854,18 @@ class OCRRequestHandler(BaseHTTPRequestHandler):
                 'url': '/ocr',
                 'content_type': 'application/json',
                 'body': {
-                    'image': 'base64编码的图片字符串'
+                    'image': 'base64编码的图片字符串',
+                    'session_id': '可选，会话ID，同一会话的连续截图只识别变化区域',
+                    'reset': '可选，为true时忽略会话中的上一张截图',
+                    'profile': '可选，响应格式: full(默认)/compact(不缩进)/text(仅文本)/columnar(按列，boxes展开为一维数组)',
+                    'char_details': '可选，为true时返回逐字符置信度，以及低置信度字符的候选',
+                    'topk': f'可选，候选数 (默认: {CHAR_TOPK})',
+                    'alt_threshold': f'可选，置信度低于该值的字符才给出候选 (默认: {CHAR_ALT_THRESHOLD})',
+                    'multipage': '可选，为true时逐页识别多页TIFF、GIF等多帧图片，返回 pages 列表',
+                    'stream': '可选，与 multipage 同时使用（或查询参数 ?stream=1），每识别完一页输出一行JSON',
+                    'rois': '可选，只识别这些区域，每项为 [xmin, ymin, xmax, ymax] 或多边形 [[x, y], ...]，结果带所属区域下标 roi',
+                    'visualize': '可选，为true时（或查询参数 ?visualize=1）在 visualization 中返回base64编码的标注图',
+                    'model': f'可选，识别模型名或语言代码（如 ja、ko、fr），首次使用时加载 (默认: {DEFAULT_REC_MODEL})'
                 }
             }
         }
@@ -270,14 +875,43 @@ class OCRRequestHandler(BaseHTTPRequestHandler):
         """自定义日志格式"""
         print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {format % args}")
 
-def run_server(host=SERVER_HOST, port=SERVER_PORT):
+def run_server(host=SERVER_HOST, port=SERVER_PORT, warmup=WARMUP_ENABLED,
+               det_sizes=WARMUP_DET_SIZES, rec_widths=WARMUP_REC_WIDTHS, profiler=None,
+               shape_buckets=SHAPE_BUCKETS_ENABLED, jobs=JOBS_ENABLED, memory_tracking=MEMORY_TRACKING,
+               model_watch=False):
     """运行HTTP服务器"""
+    global _profiler, _memory_tracker
+    _profiler = profiler
+    if memory_tracking:
+        # 在加载模型之前开始跟踪，模型加载和预热的分配也计入快照
+        from src.utils.memory import MemoryTracker
+        _memory_tracker = MemoryTracker()
+        _memory_tracker.start()
+    _engine_options['shape_buckets'] = shape_buckets
+    _warmup_sizes.update({'det_sizes': det_sizes, 'rec_widths': rec_widths})
     server_address = (host, port)
-    httpd = HTTPServer(server_address, OCRRequestHandler)
+    httpd = ThreadingHTTPServer(server_address, OCRRequestHandler)
+    if _profiler is not None:
+        _profiler.mark('开始监听')
+    
+    if jobs:
+        start_jobs()
+    
+    # 后台加载并预热模型，期间 /health 正常响应，/ready 返回503
+    if warmup:
+        threading.Thread(target=warmup_engine, args=(det_sizes, rec_widths), daemon=True).start()
+    else:
+        _warmup_info['state'] = 'skipped'
+        _ready.set()
+    
+    # 模型文件变化后自动热更新
+    if model_watch:
+        threading.Thread(target=watch_models, name='model-watch', daemon=True).start()
     
     print(f"🚀 OCR API服务器启动成功!")
     print(f"📡 服务地址: http://{host}:{port}")
     print(f"🔧 健康检查: http://{host}:{port}/health")
+    print(f"🔥 就绪检查: http://{host}:{port}/ready")
     print(f"📖 API文档: http://{host}:{port}/")
     print("=" * 50)
     print("按 Ctrl+C 停止服务器")
@@ -341,6 +975,66 @@ def parse_arguments():
         help='自动查找可用端口（当指定端口被占用时）'
     )
     
+    parser.add_argument(
+        '--no-warmup',
+        action='store_true',
+        help='跳过启动预热，/ready 立即返回200'
+    )
+    
+    parser.add_argument(
+        '--warmup-det-sizes',
+        type=str,
+        default=None,
+        help='检测预热尺寸，宽x高，逗号分隔 (例如: 960x960,1920x1088)'
+    )
+    
+    parser.add_argument(
+        '--warmup-rec-widths',
+        type=str,
+        default=None,
+        help='识别预热宽度，逗号分隔 (例如: 160,320,640)'
+    )
+    
+    parser.add_argument(
+        '--shape-buckets',
+        action='store_true',
+        default=SHAPE_BUCKETS_ENABLED,
+        help='把检测/识别输入补零到固定尺寸桶并复用缓冲区，统计见 GET /stats'
+    )
+    
+    parser.add_argument(
+        '--jobs',
+        action='store_true',
+        default=JOBS_ENABLED,
+        help=f'启用异步任务接口 /jobs（任务数据库: {JOBS_DB_PATH}）'
+    )
+    
+    parser.add_argument(
+        '--no-jobs',
+        action='store_false',
+        dest='jobs',
+        help='不启用异步任务接口 /jobs（覆盖 JOBS_ENABLED）'
+    )
+    
+    parser.add_argument(
+        '--watch-models',
+        action='store_true',
+        help=f'模型文件变化后自动热更新（每 {MODEL_WATCH_INTERVAL} 秒检查一次），也可通过 POST /admin/reload 手动更新'
+    )
+    
+    parser.add_argument(
+        '--memory-tracking',
+        action='store_true',
+        default=MEMORY_TRACKING,
+        help='统计每个请求的内存变化（tracemalloc + RSS），见 GET /admin/memory'
+    )
+    
+    parser.add_argument(
+        '--profile-startup',
+        action='store_true',
+        help='统计各模块导入、模型加载耗时以及首次 /health 响应时间'
+    )
+    
     parser.add_argument(
         '--version',
         action='version',
@@ -349,9 +1043,16 @@ def parse_arguments():
     
     return parser.parse_args()
 
-def main():
-    """主函数"""
+def main(start_time=None):
+    """
+    主函数
+    :param start_time: 进程启动时间，用于 --profile-startup 统计
+    """
     args = parse_arguments()
+    profiler = None
+    if args.profile_startup:
+        profiler = StartupProfiler(start_time, STARTUP_HEALTH_TARGET_MS)
+        profiler.mark('解析参数')
     
     # 验证端口号
     if args.port < 1 or args.port > 65535:
@@ -393,7 +1094,20 @@ def main():
         print(f"   (原指定端口 {args.port} 已被占用)")
     print("=" * 50)
     
-    run_server(host=args.host, port=port_to_use)
+    det_sizes = WARMUP_DET_SIZES
+    if args.warmup_det_sizes:
+        det_sizes = []
+        for size in args.warmup_det_sizes.split(','):
+            w, h = size.lower().split('x')
+            det_sizes.append((int(h), int(w)))
+    rec_widths = WARMUP_REC_WIDTHS
+    if args.warmup_rec_widths:
+        rec_widths = [int(w) for w in args.warmup_rec_widths.split(',')]
+    
+    run_server(host=args.host, port=port_to_use, warmup=WARMUP_ENABLED and not args.no_warmup,
+               det_sizes=det_sizes, rec_widths=rec_widths, profiler=profiler,
+               shape_buckets=args.shape_buckets, jobs=args.jobs, memory_tracking=args.memory_tracking,
+               model_watch=args.watch_models)
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
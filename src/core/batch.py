@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+批量OCR命令行工具
+支持目录、通配符和文件列表输入，并行解码+预取，结果逐行写入JSONL
+输出文件中已成功的图片会被跳过，中断后重新执行同一命令即可续跑
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import cv2
+
+from src.core.engine import OCREngine, format_results
+from src.core.pipeline import OCRPipeline
+from src.utils.config import (
+    DET_MODEL_PATH, REC_MODEL_PATH, OCR_KEYS_PATH, DROP_SCORE,
+    BATCH_IMAGE_EXTENSIONS, BATCH_DECODE_THREADS, BATCH_PREFETCH, SHAPE_BUCKETS_ENABLED,
+    PIPELINE_DET_WORKERS, PIPELINE_CROP_WORKERS, PIPELINE_REC_WORKERS
+)
+
+
+def iter_image_paths(inputs, file_list=None, recursive=False, extensions=BATCH_IMAGE_EXTENSIONS):
+    """
+    按顺序惰性枚举图片路径
+    :param inputs: 目录、通配符或单个文件
+    :param file_list: 每行一个路径的列表文件，'-' 表示标准输入
+    """
+    extensions = tuple(ext.lower() for ext in extensions)
+
+    def is_image(path):
+        return path.lower().endswith(extensions)
+
+    for item in inputs:
+        if os.path.isdir(item):
+            if recursive:
+                for root, dirs, files in os.walk(item):
+                    dirs.sort()
+                    for name in sorted(files):
+                        if is_image(name):
+                            yield os.path.normpath(os.path.join(root, name))
+            else:
+                for name in sorted(os.listdir(item)):
+                    path = os.path.join(item, name)
+                    if is_image(name) and os.path.isfile(path):
+                        yield os.path.normpath(path)
+        elif glob.has_magic(item):
+            for path in sorted(glob.iglob(item, recursive=True)):
+                if is_image(path) and os.path.isfile(path):
+                    yield os.path.normpath(path)
+        else:
+            # 明确指定的文件不按扩展名过滤
+            yield os.path.normpath(item)
+
+    if file_list:
+        fin = sys.stdin if file_list == '-' else open(file_list, 'r', encoding='utf-8')
+        try:
+            for line in fin:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    yield os.path.normpath(line)
+        finally:
+            if fin is not sys.stdin:
+                fin.close()
+
+
+def load_finished(output_path):
+    """读取已有的JSONL输出，返回已成功识别的图片路径集合"""
+    finished = set()
+    if not os.path.exists(output_path):
+        return finished
+    with open(output_path, 'r', encoding='utf-8') as fin:
+        for line in fin:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 中断时可能留下半行，直接忽略，该图片会被重新处理
+                continue
+            if record.get('success'):
+                finished.add(record['image'])
+    return finished
+
+
+def open_output(output_path):
+    """以追加方式打开输出文件，若上次中断在半行处，先补一个换行"""
+    needs_newline = False
+    if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+        with open(output_path, 'rb') as fin:
+            fin.seek(-1, os.SEEK_END)
+            needs_newline = fin.read(1) != b'\n'
+    fout = open(output_path, 'a', encoding='utf-8')
+    if needs_newline:
+        fout.write('\n')
+    return fout
+
+
+def decode_image(path):
+    """读取图片，失败时抛出异常"""
+    image = cv2.imread(path)
+    if image is None:
+        raise ValueError(f"无法读取图片: {path}")
+    return image
+
+
+def make_record(path, dt_boxes, rec_results):
+    results = format_results(dt_boxes, rec_results)
+    return {'image': path, 'success': True, 'text_count': len(results), 'results': results}
+
+
+def make_error_record(path, error):
+    return {'image': path, 'success': False, 'error': str(error)}
+
+
+def run_threaded(engine, paths, decode_threads=BATCH_DECODE_THREADS, prefetch=BATCH_PREFETCH):
+    """
+    单引擎模式：多线程解码并预取，主线程按顺序推理
+    逐张产出结果记录
+    """
+    with ThreadPoolExecutor(max_workers=decode_threads) as pool:
+        pending = deque()
+        paths = iter(paths)
+        exhausted = False
+        while True:
+            # 保持预取队列填满
+            while not exhausted and len(pending) < prefetch:
+                path = next(paths, None)
+                if path is None:
+                    exhausted = True
+                    break
+                pending.append((path, pool.submit(decode_image, path)))
+            if not pending:
+                break
+            path, future = pending.popleft()
+            try:
+                image = future.result()
+                dt_boxes, rec_results = engine.ocr(image)
+                yield make_record(path, dt_boxes, rec_results)
+            except Exception as e:
+                yield make_error_record(path, e)
+
+
+def run_pipelined(pipeline, paths):
+    """流水线模式：解码、检测、裁剪、识别分阶段并行，输出顺序为完成顺序"""
+    for path, dt_boxes, rec_results, error in pipeline.run((path, path) for path in paths):
+        if error is not None:
+            yield make_error_record(path, error)
+        else:
+            yield make_record(path, dt_boxes, rec_results)
+
+
+# 进程池中每个工作进程各自持有一个引擎
+_worker_engine = None
+
+
+def _init_worker(det_file, rec_file, ocr_keys_file, drop_score, shape_buckets=False):
+    global _worker_engine
+    # 每个进程只用单线程推理，避免进程数*线程数超过CPU核数
+    cv2.setNumThreads(1)
+    _worker_engine = OCREngine(det_file, rec_file, ocr_keys_file, drop_score, shape_buckets=shape_buckets)
+
+
+def _process_in_worker(path):
+    try:
+        image = decode_image(path)
+        dt_boxes, rec_results = _worker_engine.ocr(image)
+        return make_record(path, dt_boxes, rec_results)
+    except Exception as e:
+        return make_error_record(path, e)
+
+
+def run_pool(paths, workers, det_file, rec_file, ocr_keys_file, drop_score, prefetch=BATCH_PREFETCH,
+             shape_buckets=False):
+    """
+    进程池模式：每个进程自己解码和推理，只在进程间传递路径和结果
+    在途任务数受 prefetch 限制，输出顺序为完成顺序
+    """
+    initargs = (det_file, rec_file, ocr_keys_file, drop_score, shape_buckets)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+        pending = set()
+        paths = iter(paths)
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < max(prefetch, workers):
+                path = next(paths, None)
+                if path is None:
+                    exhausted = True
+                    break
+                pending.add(pool.submit(_process_in_worker, path))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def run_batch(args):
+    """执行批量识别，返回 (成功数, 失败数, 跳过数)"""
+    finished = load_finished(args.output)
+    skipped = [0]
+
+    def todo():
+        seen = set()
+        for path in iter_image_paths(args.inputs, args.file_list, args.recursive, args.extensions):
+            if path in finished or path in seen:
+                skipped[0] += 1
+                continue
+            seen.add(path)
+            yield path
+
+    if args.workers > 1:
+        records = run_pool(todo(), args.workers, args.det_path, args.rec_path,
+                           args.ocr_keys_file, args.drop_score, args.prefetch, args.shape_buckets)
+        engine = None
+    else:
+        engine = OCREngine(args.det_path, args.rec_path, args.ocr_keys_file, args.drop_score,
+                           shape_buckets=args.shape_buckets)
+        if args.pipeline:
+            pipeline = OCRPipeline(engine, decode_image, args.decode_threads, args.det_workers,
+                                   args.crop_workers, args.rec_workers, args.prefetch)
+            records = run_pipelined(pipeline, todo())
+        else:
+            records = run_threaded(engine, todo(), args.decode_threads, args.prefetch)
+
+    succeeded, failed = 0, 0
+    start_time = time.time()
+    with open_output(args.output) as fout:
+        for record in records:
+            fout.write(json.dumps(record, ensure_ascii=False) + '\n')
+            # 每行立即落盘，保证中断后可以续跑
+            fout.flush()
+            if record['success']:
+                succeeded += 1
+            else:
+                failed += 1
+                print(f"❌ {record['image']}: {record['error']}", file=sys.stderr)
+            done = succeeded + failed
+            if args.log_every and done % args.log_every == 0:
+                elapsed = time.time() - start_time
+                print(f"📊 已处理 {done} 张, {done / elapsed:.2f} 张/秒", file=sys.stderr)
+    if engine is not None and args.pipeline:
+        # 各阶段忙碌比例，接近1的阶段是瓶颈
+        print(json.dumps(pipeline.stats(), ensure_ascii=False, indent=2), file=sys.stderr)
+    if engine is not None and args.shape_buckets:
+        # 各尺寸桶的调用次数和耗时，用于调整 DET_SHAPE_BUCKETS / REC_WIDTH_BUCKETS
+        print(json.dumps(engine.bucket_stats(), ensure_ascii=False, indent=2), file=sys.stderr)
+    return succeeded, failed, skipped[0]
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='批量OCR识别，结果写入JSONL，可中断续跑')
+    parser.add_argument('inputs', nargs='*', help='图片文件、目录或通配符（如 "scans/**/*.jpg"）')
+    parser.add_argument('-l', '--file_list', type=str, default=None, help='图片路径列表文件，每行一个，"-" 表示标准输入')
+    parser.add_argument('-O', '--output', type=str, required=True, help='JSONL输出文件，已存在时跳过其中成功的图片')
+    parser.add_argument('-R', '--recursive', action='store_true', help='递归遍历目录')
+    parser.add_argument('--extensions', type=str, nargs='+', default=list(BATCH_IMAGE_EXTENSIONS), help='目录/通配符中收集的图片扩展名')
+    parser.add_argument('-d', '--det_path', type=str, default=DET_MODEL_PATH, help='text detection model path')
+    parser.add_argument('-r', '--rec_path', type=str, default=REC_MODEL_PATH, help='text recognition model path')
+    parser.add_argument('-o', '--ocr_keys_file', type=str, default=OCR_KEYS_PATH, help='word map file')
+    parser.add_argument('--drop_score', type=float, default=DROP_SCORE, help='置信度过滤阈值')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='推理进程数，1表示单进程共享引擎')
+    parser.add_argument('--decode_threads', type=int, default=BATCH_DECODE_THREADS, help='单进程模式下的解码线程数')
+    parser.add_argument('--prefetch', type=int, default=BATCH_PREFETCH, help='预取/在途图片数上限')
+    parser.add_argument('--pipeline', action='store_true', help='单进程流水线模式：解码/检测/裁剪/识别分阶段并行')
+    parser.add_argument('--det_workers', type=int, default=PIPELINE_DET_WORKERS, help='流水线模式下的检测线程数')
+    parser.add_argument('--crop_workers', type=int, default=PIPELINE_CROP_WORKERS, help='流水线模式下的裁剪线程数')
+    parser.add_argument('--rec_workers', type=int, default=PIPELINE_REC_WORKERS, help='流水线模式下的识别线程数')
+    parser.add_argument('--shape_buckets', action='store_true', default=SHAPE_BUCKETS_ENABLED,
+                        help='输入补零到固定尺寸桶并复用缓冲区，结束时输出各桶统计')
+    parser.add_argument('--log_every', type=int, default=100, help='每处理多少张输出一次进度，0表示不输出')
+    args = parser.parse_args(argv)
+    if not args.inputs and not args.file_list:
+        parser.error('至少需要指定一个输入或 --file_list')
+    if args.pipeline and args.workers > 1:
+        parser.error('--pipeline 只用于单进程模式，不能与 --workers 大于1同时使用')
+    if args.log_every < 0:
+        parser.error('--log_every 不能为负数')
+    return args
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    succeeded, failed, skipped = run_batch(args)
+    print(f"✅ 完成: 成功 {succeeded}, 失败 {failed}, 跳过 {skipped}", file=sys.stderr)
+    return 0 if failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+按尺寸分桶的推理会话
+输入的高、宽向上取整到一组固定尺寸并补零，每个尺寸的输入/输出缓冲区只分配一次，
+通过 IOBinding 反复使用，ONNX Runtime 不必为每个新尺寸重新分配内存
+"""
+
+import threading
+import time
+
+import numpy as np
+
+from src.utils.config import SHAPE_BUCKET_POOL_SIZE
+
+
+class BucketedSession(object):
+    """
+    包装 onnxruntime.InferenceSession，提供同样的 run / get_inputs 接口
+    每个形状的缓冲区放在进程内共享的池中，线程取出使用、用完放回，每个形状最多分配 pool_size 份，
+    都被占用时等待空闲的一份，分配次数与线程、连接的数量无关；返回的输出数组是拷贝，不会被之后的 run 覆盖
+    """
+
+    def __init__(self, session, buckets, crop_output=False, pool_size=SHAPE_BUCKET_POOL_SIZE):
+        """
+        :param buckets: [(高, 宽), ...]，选取能容纳输入的面积最小的一个
+        :param crop_output: 为True时把输出的最后两维按比例裁回原始尺寸（检测模型的概率图）
+        :param pool_size: 每个形状最多分配的缓冲区份数
+        """
+        self.session = session
+        self.buckets = sorted(set((int(h), int(w)) for h, w in buckets), key=lambda hw: (hw[0] * hw[1], hw))
+        self.crop_output = crop_output
+        self.input_name = session.get_inputs()[0].name
+        self.output_names = [output.name for output in session.get_outputs()]
+        self.pool_size = max(int(pool_size), 1)
+        # {形状: [空闲的缓冲区, ...]} 和 {形状: 已分配份数}
+        self._pools = {}
+        self._allocated = {}
+        self._pool_cond = threading.Condition()
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # 其余接口（get_inputs、get_outputs 等）直接转发给原会话
+        return getattr(self.session, name)
+
+    def select(self, height, width):
+        """能容纳 (height, width) 的最小桶，没有时返回None"""
+        for bucket in self.buckets:
+            if bucket[0] >= height and bucket[1] >= width:
+                return bucket
+        return None
+
+    def _record(self, key, elapsed, padding, allocated_bytes=0):
+        with self._stats_lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = {
+                    'runs': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'padding': 0.0,
+                    'allocations': 0, 'allocated_bytes': 0
+                }
+            elapsed_ms = elapsed * 1000
+            stats['runs'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            stats['padding'] += padding
+            if allocated_bytes:
+                stats['allocations'] += 1
+                stats['allocated_bytes'] += allocated_bytes
+
+    def _acquire(self, shape, dtype):
+        """从池中取出该输入形状的空闲 IOBinding 和缓冲区，未达到份数上限时分配新的，否则等待"""
+        with self._pool_cond:
+            pool = self._pools.setdefault(shape, [])
+            while not pool and self._allocated.get(shape, 0) >= self.pool_size:
+                self._pool_cond.wait()
+            if pool:
+                return pool.pop()
+            self._allocated[shape] = self._allocated.get(shape, 0) + 1
+        try:
+            input_buffer = np.zeros(shape, dtype=dtype)
+            io_binding = self.session.io_binding()
+            io_binding.bind_cpu_input(self.input_name, input_buffer)
+        except Exception:
+            with self._pool_cond:
+                self._allocated[shape] -= 1
+                self._pool_cond.notify()
+            raise
+        return {'io': io_binding, 'input': input_buffer, 'outputs': None}
+
+    def _release(self, shape, binding):
+        with self._pool_cond:
+            self._pools[shape].append(binding)
+            self._pool_cond.notify()
+
+    def run(self, output_names, input_feed, run_options=None):
+        inputs = input_feed[self.input_name]
+        height, width = inputs.shape[-2:]
+        start_time = time.time()
+        bucket = self.select(height, width)
+        if bucket is None:
+            # 超出所有桶的输入按原尺寸推理，单独计数
+            outputs = self.session.run(output_names, input_feed, run_options)
+            self._record('unbucketed', time.time() - start_time, 0.0)
+            return outputs
+
+        shape = tuple(inputs.shape[:-2]) + bucket
+        binding = self._acquire(shape, inputs.dtype)
+        try:
+            outputs, allocated_bytes = self._run_binding(binding, inputs, run_options)
+            # 缓冲区放回池中后可能被其他线程覆盖，先把输出（裁剪后的部分）拷贝出来
+            if self.crop_output:
+                cropped = []
+                for output in outputs:
+                    out_h = int(round(output.shape[-2] * height / float(bucket[0])))
+                    out_w = int(round(output.shape[-1] * width / float(bucket[1])))
+                    cropped.append(np.array(output[..., :out_h, :out_w]))
+                outputs = cropped
+            else:
+                outputs = [np.array(output) for output in outputs]
+        finally:
+            self._release(shape, binding)
+        if output_names is not None:
+            outputs = [outputs[self.output_names.index(name)] for name in output_names]
+
+        padding = 1.0 - (height * width) / float(bucket[0] * bucket[1])
+        key = 'x'.join(str(dim) for dim in shape)
+        self._record(key, time.time() - start_time, padding, allocated_bytes)
+        return list(outputs)
+
+    def _run_binding(self, binding, inputs, run_options):
+        """把输入补零写入缓冲区并推理，返回输出缓冲区和本次新分配的字节数"""
+        height, width = inputs.shape[-2:]
+        input_buffer = binding['input']
+        input_buffer[..., :height, :width] = inputs
+        input_buffer[..., height:, :] = 0
+        input_buffer[..., :height, width:] = 0
+
+        io_binding = binding['io']
+        if binding['outputs'] is not None:
+            self.session.run_with_iobinding(io_binding, run_options)
+            return binding['outputs'], 0
+        # 输出尺寸由模型决定，第一次让ORT分配，之后绑定到同形状的固定缓冲区
+        for name in self.output_names:
+            io_binding.bind_output(name, 'cpu')
+        self.session.run_with_iobinding(io_binding, run_options)
+        outputs = [np.array(output) for output in io_binding.copy_outputs_to_cpu()]
+        for name, output in zip(self.output_names, outputs):
+            io_binding.bind_output(name, 'cpu', 0, output.dtype, list(output.shape), output.ctypes.data)
+        binding['outputs'] = outputs
+        return outputs, input_buffer.nbytes + sum(output.nbytes for output in outputs)
+
+    def stats(self):
+        """
+        各桶的统计
+        :return: {桶: {runs, avg_ms, max_ms, avg_padding, allocations, allocated_mb}}，
+                 键为完整输入形状（如 1x3x960x960），超出所有桶的输入记在 unbucketed 下
+        """
+        with self._stats_lock:
+            items = list(self._stats.items())
+        result = {}
+        for key, stats in sorted(items):
+            runs = max(stats['runs'], 1)
+            result[key] = {
+                'runs': stats['runs'],
+                'avg_ms': round(stats['total_ms'] / runs, 2),
+                'max_ms': round(stats['max_ms'], 2),
+                'avg_padding': round(stats['padding'] / runs, 3),
+                'allocations': stats['allocations'],
+                'allocated_mb': round(stats['allocated_bytes'] / 1048576.0, 2)
+            }
+        return result
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+预编译字符表
+把字符映射文件编译成码点数组（下标0为CTC空白符），按文件内容哈希缓存为 .npy，
+各进程以只读内存映射方式加载，共享同一份物理内存；解码时直接用下标数组查表
+"""
+
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+from src.utils.config import CHARSET_CACHE_DIR
+
+# 进程内缓存，同一进程中的多个引擎共用同一个数组
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def compile_charset(data, use_space_char=True):
+    """
+    把字符映射文件的内容编译成码点数组
+    与 process_pred 原来的解析规则一致：逐行去掉换行符后拼接，再按字符拆分
+    :param data: 文件的原始字节
+    :return: uint32 数组，下标0为空白符（码点0）
+    """
+    character_str = ''.join(line.decode('utf-8').strip('\r\n') for line in data.split(b'\n'))
+    if use_space_char:
+        character_str += ' '
+    table = np.zeros(len(character_str) + 1, dtype=np.uint32)
+    table[1:] = np.frombuffer(character_str.encode('utf-32-le'), dtype='<u4')
+    return table
+
+
+def load_charset(character_dict_path, use_space_char=True, cache_dir=CHARSET_CACHE_DIR):
+    """
+    加载字符表，优先使用缓存文件（只读内存映射）
+    缓存目录不可写时退回到内存中的数组
+    """
+    with open(character_dict_path, 'rb') as fin:
+        data = fin.read()
+    digest = hashlib.sha1(data + (b'\x01' if use_space_char else b'\x00')).hexdigest()
+
+    with _tables_lock:
+        table = _tables.get(digest)
+        if table is not None:
+            return table
+
+        cache_path = os.path.join(cache_dir, f"charset_{digest}.npy") if cache_dir else None
+        if cache_path and os.path.exists(cache_path):
+            try:
+                table = np.load(cache_path, mmap_mode='r')
+            except (OSError, ValueError):
+                table = None
+        if table is None:
+            table = compile_charset(data, use_space_char)
+            if cache_path:
+                try:
+                    os.makedirs(cache_dir, exist_ok=True)
+                    # 先写临时文件再改名，多个进程同时编译也不会读到写了一半的文件
+                    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+                    with open(tmp_path, 'wb') as fout:
+                        np.save(fout, table)
+                    os.replace(tmp_path, cache_path)
+                    table = np.load(cache_path, mmap_mode='r')
+                except OSError:
+                    pass
+        _tables[digest] = table
+        return table
+
+
+def table_to_characters(table):
+    """码点数组转成字符列表，下标0为 'blank'，与 process_pred.character 一致"""
+    return ['blank'] + list(np.asarray(table[1:], dtype='<u4').tobytes().decode('utf-32-le'))
+
+
+def ctc_decode(table, preds_idx, preds_prob=None):
+    """
+    批量CTC解码：去掉空白符和连续重复的下标，查表得到文本
+    :param table: load_charset 返回的码点数组
+    :param preds_idx: (B, T) 每个时间步的argmax下标
+    :param preds_prob: (B, T) 对应概率，为None时置信度记为1
+    :return: [(文本, 平均置信度), ...]，没有字符时置信度为nan
+    """
+    preds_idx = np.asarray(preds_idx)
+    batch_size = preds_idx.shape[0]
+    keep = preds_idx != 0
+    keep[:, 1:] &= preds_idx[:, 1:] != preds_idx[:, :-1]
+    rows, cols = np.nonzero(keep)
+
+    # 所有行的字符一次查表、一次解码，再按每行的字符数切分
+    codes = np.asarray(table)[preds_idx[rows, cols]].astype('<u4')
+    text_all = codes.tobytes().decode('utf-32-le')
+    counts = keep.sum(axis=1)
+    ends = np.cumsum(counts)
+
+    if preds_prob is None:
+        weights = np.ones(len(rows), dtype=np.float64)
+    else:
+        weights = np.asarray(preds_prob)[rows, cols]
+    sums = np.bincount(rows, weights=weights, minlength=batch_size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        confs = sums / counts
+
+    results = []
+    start = 0
+    for end, conf in zip(ends.tolist(), confs.tolist()):
+        results.append((text_all[start:end], conf))
+        start = end
+    return results
+
+
+def ctc_decode_details(table, preds, preds_idx, preds_prob, topk=0, alt_threshold=1.0):
+    """
+    批量CTC解码，同时给出每个字符的置信度，以及低置信度字符的 top-k 候选
+    全部由同一个 preds 张量通过数组运算得到，不需要再次推理
+    :param preds: (B, T, C) 识别模型输出的概率
+    :param topk: 候选数，0表示不计算候选
+    :param alt_threshold: 只有置信度低于该值的字符才计算候选
+    :return: [(文本, 平均置信度, {'char_confidences': [...], 'alternatives': [...]}), ...]
+             alternatives 为 [{'index': 字符位置, 'candidates': [[字符, 概率], ...]}, ...]
+    """
+    preds_idx = np.asarray(preds_idx)
+    batch_size = preds_idx.shape[0]
+    keep = preds_idx != 0
+    keep[:, 1:] &= preds_idx[:, 1:] != preds_idx[:, :-1]
+    rows, cols = np.nonzero(keep)
+    table = np.asarray(table)
+
+    text_all = table[preds_idx[rows, cols]].astype('<u4').tobytes().decode('utf-32-le')
+    counts = keep.sum(axis=1)
+    ends = np.cumsum(counts)
+    char_probs = np.asarray(preds_prob)[rows, cols]
+    sums = np.bincount(rows, weights=char_probs, minlength=batch_size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        confs = sums / counts
+    char_probs = char_probs.tolist()
+
+    # 低置信度字符的候选：一次 argpartition 取出所有位置的 top-k，再在k个内排序
+    alternatives = [[] for _ in range(batch_size)]
+    if topk > 0:
+        low = np.flatnonzero(np.asarray(char_probs) < alt_threshold)
+        if len(low):
+            low_rows, low_cols = rows[low], cols[low]
+            candidates = np.asarray(preds)[low_rows, low_cols]
+            k = min(topk, candidates.shape[1])
+            top = np.argpartition(-candidates, k - 1, axis=1)[:, :k]
+            top_probs = np.take_along_axis(candidates, top, axis=1)
+            by_prob = np.argsort(-top_probs, axis=1)
+            top = np.take_along_axis(top, by_prob, axis=1)
+            top_probs = np.take_along_axis(top_probs, by_prob, axis=1).tolist()
+            # 下标0（空白符）显示为空字符串
+            top_chars = table[top].astype('<u4').view('<U1').tolist()
+            positions = (np.cumsum(keep, axis=1) - 1)[low_rows, low_cols].tolist()
+            for row, position, chars, probs in zip(low_rows.tolist(), positions, top_chars, top_probs):
+                alternatives[row].append({
+                    'index': position,
+                    'candidates': [[char, prob] for char, prob in zip(chars, probs)]
+                })
+
+    results = []
+    start = 0
+    for row, (end, conf) in enumerate(zip(ends.tolist(), confs.tolist())):
+        results.append((text_all[start:end], conf, {
+            'char_confidences': char_probs[start:end],
+            'alternatives': alternatives[row]
+        }))
+        start = end
+    return results
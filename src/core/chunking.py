@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+超宽文本行的分段识别
+识别输入宽度为 48 * w/h，整行表格、滚动字幕等会得到数千像素宽的输入；
+这类文本行按最大宽度切成相互重叠的若干段分别识别，再去掉重叠部分重复的字符拼接起来
+"""
+
+import math
+
+# 估计重叠区域内最多的字符数时，假定最窄的字符宽度为行高的这个比例
+_MIN_CHAR_WIDTH_RATIO = 0.25
+
+
+def split_wide_crop(img, max_width, overlap, rec_height=48):
+    """
+    把文本行图片切成相互重叠的若干段
+    :param max_width: 缩放到识别高度后每段的最大宽度
+    :param overlap: 缩放到识别高度后相邻两段的重叠宽度
+    :return: [(段图片, 重叠宽度占该段宽度的比例), ...]，不需要切分时只有一段
+    """
+    h, w = img.shape[:2]
+    scale = h / float(rec_height)
+    chunk_w = max(1, int(max_width * scale))
+    overlap_w = min(int(overlap * scale), chunk_w // 2)
+    if w <= chunk_w:
+        return [(img, 0.0)]
+    stride = chunk_w - overlap_w
+    count = int(math.ceil((w - overlap_w) / float(stride)))
+    # 平均分配，避免最后一段过窄
+    stride = int(math.ceil((w - overlap_w) / float(count)))
+    chunks = []
+    for index in range(count):
+        x0 = index * stride
+        x1 = min(w, x0 + stride + overlap_w)
+        chunks.append((img[:, x0:x1], overlap_w / float(x1 - x0)))
+    return chunks
+
+
+def _overlap_length(left, right, max_chars):
+    """
+    找出 left 末尾与 right 开头重复的字符
+    两端各允许有一个被切坏的字符不参与匹配
+    :return: (left 保留的字符数, right 起始下标)，没有找到重复时返回None
+    """
+    best = None
+    for drop_left in (0, 1):
+        for drop_right in (0, 1):
+            end = len(left) - drop_left
+            limit = min(end, len(right) - drop_right, max_chars)
+            # 丢弃了字符时至少要匹配两个字符，降低误匹配的可能
+            least = 1 + (drop_left or drop_right)
+            for length in range(limit, least - 1, -1):
+                if left[end - length:end] == right[drop_right:drop_right + length]:
+                    if best is None or length > best[0]:
+                        best = (length, end, drop_right + length)
+                    break
+    if best is None:
+        return None
+    return best[1], best[2]
+
+
+def stitch_chunks(results, overlap_ratios, overlap_chars):
+    """
+    拼接各段的识别结果
+    :param results: 各段的 (文本, 置信度) 或 (文本, 置信度, 字符详情)
+    :param overlap_ratios: split_wide_crop 给出的每段重叠比例
+    :param overlap_chars: 重叠区域内最多可能有的字符数
+    :return: 与单段结果格式相同的一条结果
+    """
+    with_details = len(results[0]) > 2
+    text = ''
+    conf_sum, conf_count = 0.0, 0
+    confidences, alternatives = [], []
+    for index, result in enumerate(results):
+        chunk_text, chunk_conf = result[0], result[1]
+        keep, start = len(text), 0
+        if index > 0 and text and chunk_text:
+            found = _overlap_length(text, chunk_text, overlap_chars)
+            if found is not None:
+                keep, start = found
+            else:
+                # 没有找到完全相同的字符时，按字符数比例各去掉重叠区域的一半
+                ratio = overlap_ratios[index] / 2
+                start = int(round(len(chunk_text) * ratio))
+                keep = len(text) - int(round(len(results[index - 1][0]) * ratio))
+        if keep < len(text):
+            # 前一段末尾被去掉的字符不计入置信度
+            removed = len(text) - keep
+            if with_details:
+                conf_sum -= sum(confidences[keep:])
+                confidences = confidences[:keep]
+                alternatives = [alt for alt in alternatives if alt['index'] < keep]
+            else:
+                # 只知道前一段新增字符的置信度，超出的部分不从总和和计数中扣除，两者保持一致
+                removed = min(removed, last_count)
+                conf_sum -= last_conf * removed
+            conf_count -= removed
+            text = text[:keep]
+
+        added = chunk_text[start:]
+        if with_details:
+            details = result[2]
+            chunk_confs = details['char_confidences'][start:]
+            conf_sum += sum(chunk_confs)
+            alternatives.extend(dict(alt, index=alt['index'] - start + len(text))
+                                for alt in details['alternatives'] if alt['index'] >= start)
+            confidences.extend(chunk_confs)
+        elif added:
+            conf_sum += chunk_conf * len(added)
+        last_conf, last_count = chunk_conf, len(added)
+        conf_count += len(added)
+        text += added
+
+    conf = conf_sum / conf_count if conf_count > 0 else float('nan')
+    if with_details:
+        return text, conf, {'char_confidences': confidences, 'alternatives': alternatives}
+    return text, conf
+
+
+def max_overlap_chars(overlap, rec_height=48):
+    """重叠宽度内最多可能出现的字符数"""
+    return int(math.ceil(overlap / (rec_height * _MIN_CHAR_WIDTH_RATIO))) + 1
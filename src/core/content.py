@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+空白/低内容图片检查
+在缩小后的灰度图上统计边缘像素数，几乎没有边缘的图片（空白页、纯色帧、渐变背景、空截图）
+不必再做整图检测
+灰度方差对稀疏文字不敏感（空白页上只有一个单词时方差也接近0），因此只按边缘判断
+"""
+
+import cv2
+import numpy as np
+
+from src.utils.config import CONTENT_CHECK_MAX_SIDE, CONTENT_EDGE_THRESH, CONTENT_MIN_EDGE_PIXELS
+
+
+def count_edges(image, max_side=CONTENT_CHECK_MAX_SIDE, edge_thresh=CONTENT_EDGE_THRESH):
+    """
+    :param image: BGR或灰度图像
+    :return: 缩小到最长边 max_side 后的边缘像素数
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    h, w = gray.shape[:2]
+    scale = max_side / float(max(h, w))
+    if scale < 1:
+        gray = cv2.resize(gray, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    # 相邻像素的灰度差，水平或垂直方向超过阈值即视为边缘
+    gray = gray.astype(np.int16)
+    edges = np.zeros(gray.shape, dtype=bool)
+    edges[:, 1:] |= np.abs(np.diff(gray, axis=1)) > edge_thresh
+    edges[1:, :] |= np.abs(np.diff(gray, axis=0)) > edge_thresh
+    return int(np.count_nonzero(edges))
+
+
+def is_low_content(image, max_side=CONTENT_CHECK_MAX_SIDE, edge_thresh=CONTENT_EDGE_THRESH,
+                   min_edge_pixels=CONTENT_MIN_EDGE_PIXELS):
+    """边缘像素数少于 min_edge_pixels 时认为没有文字"""
+    return count_edges(image, max_side, edge_thresh) < min_edge_pixels
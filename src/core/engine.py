@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+共享模型的OCR引擎
+检测/识别会话和字符表只加载一次，之后所有图片复用；reload() 在后台加载新模型并整体替换
+"""
+
+import hashlib
+import os
+import random
+import threading
+import time
+import weakref
+
+import numpy as np
+import onnxruntime
+
+from src.core.buckets import BucketedSession
+from src.core.content import is_low_content
+from src.core.regions import crop_roi, box_in_roi, dedupe_boxes
+from src.core.registry import RecognizerRegistry
+from src.core.main import det_rec_functions, filter_box_rec, process_pred
+from src.core.result import OCRResult
+from src.utils.config import (
+    DET_MODEL_PATH, REC_MODEL_PATH, OCR_KEYS_PATH, DROP_SCORE, DEFAULT_REC_MODEL, REC_MODELS,
+    WARMUP_DET_SIZES, WARMUP_REC_WIDTHS, CHAR_ALT_THRESHOLD,
+    SHAPE_BUCKETS_ENABLED, DET_SHAPE_BUCKETS, REC_WIDTH_BUCKETS, REC_MAX_WIDTH, REC_BATCH_NUM,
+    CONTENT_CHECK_ENABLED, CONTENT_AUDIT_RATE
+)
+
+
+def file_fingerprint(path):
+    """文件内容的SHA-256前12位"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fin:
+        for block in iter(lambda: fin.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+class ModelSet(object):
+    """
+    同时生效的一组检测、识别会话和字符表，热更新时整体替换
+    正在处理的请求持有旧的 ModelSet，处理完后旧会话随引用计数释放
+    """
+
+    __slots__ = ('det_session', 'rec_session', 'postprocess_op', 'files', 'fingerprint',
+                 'load_timings', 'load_time', 'loaded_at', '__weakref__')
+
+    def __init__(self, det_file, rec_file, ocr_keys_file, shape_buckets=False,
+                 det_buckets=DET_SHAPE_BUCKETS, rec_widths=REC_WIDTH_BUCKETS):
+        # 分别记录各部分加载耗时（秒）
+        self.load_timings = {}
+        start_time = time.time()
+        self.det_session = onnxruntime.InferenceSession(det_file)
+        self.load_timings['det'] = time.time() - start_time
+        self.rec_session = onnxruntime.InferenceSession(rec_file)
+        self.load_timings['rec'] = time.time() - start_time - self.load_timings['det']
+        self.postprocess_op = process_pred(ocr_keys_file, 'ch', True)
+        self.load_time = time.time() - start_time
+        self.load_timings['keys'] = self.load_time - self.load_timings['det'] - self.load_timings['rec']
+        if shape_buckets:
+            self.det_session = BucketedSession(self.det_session, det_buckets, crop_output=True)
+            self.rec_session = BucketedSession(self.rec_session, [(48, w) for w in rec_widths])
+        self.files = {
+            name: {'path': path, 'sha256': file_fingerprint(path), 'mtime': os.path.getmtime(path)}
+            for name, path in (('det', det_file), ('rec', rec_file), ('keys', ocr_keys_file))
+        }
+        # 三个文件的组合指纹，用于确认当前生效的是哪一版模型
+        self.fingerprint = hashlib.sha256(
+            ''.join(self.files[name]['sha256'] for name in ('det', 'rec', 'keys')).encode('ascii')).hexdigest()[:12]
+        self.loaded_at = time.time()
+
+    def info(self):
+        return {
+            'fingerprint': self.fingerprint,
+            'files': self.files,
+            'loaded_at': round(self.loaded_at, 3),
+            'load_ms': round(self.load_time * 1000, 2)
+        }
+
+
+class OCREngine(object):
+    """
+    OCR引擎，持有检测、识别两个ONNX会话
+    ONNX Runtime的 session.run 是线程安全的，同一个引擎可以被多个线程同时使用
+    会话、字符表放在 ModelSet 中，每张图片开始处理时取一次，热更新不影响正在处理的图片
+    """
+
+    def __init__(self, det_file=DET_MODEL_PATH, rec_file=REC_MODEL_PATH,
+                 ocr_keys_file=OCR_KEYS_PATH, drop_score=DROP_SCORE,
+                 shape_buckets=SHAPE_BUCKETS_ENABLED, det_buckets=DET_SHAPE_BUCKETS,
+                 rec_widths=REC_WIDTH_BUCKETS, rec_max_width=REC_MAX_WIDTH,
+                 content_check=CONTENT_CHECK_ENABLED, content_audit_rate=CONTENT_AUDIT_RATE,
+                 rec_models=REC_MODELS, det_params=None, rec_batch_num=REC_BATCH_NUM):
+        """
+        :param shape_buckets: 为True时检测/识别输入补零到 det_buckets / rec_widths 中的固定尺寸，
+                              并通过 IOBinding 复用缓冲区，见 bucket_stats()
+        :param rec_max_width: 识别输入宽度超过该值的文本行分段识别，为0时不分段
+        :param content_check: 为True时检测前先检查图片是否空白，空白图片直接返回空结果
+        :param content_audit_rate: 被判为空白的图片中抽查完整识别的比例，用于统计误判
+        :param rec_models: 可按请求选择的识别模型注册表，见 RecognizerRegistry
+        :param det_params: 覆盖 config 中的检测参数（det_db_thresh、unclip_ratio、limit_side_len 等），
+                           见 det_rec_functions.get_process
+        :param rec_batch_num: 每次送入识别模型的文本行数
+        """
+        self.drop_score = drop_score
+        self.rec_max_width = rec_max_width
+        self.det_params = det_params
+        self.rec_batch_num = rec_batch_num
+        self.content_check = content_check
+        self.content_audit_rate = content_audit_rate
+        self.content_counts = {'checked': 0, 'short_circuited': 0, 'audited': 0, 'missed': 0}
+        self._counts_lock = threading.Lock()
+        self.shape_buckets = shape_buckets
+        self.det_buckets = det_buckets
+        self.rec_widths = rec_widths
+        self.models = ModelSet(det_file, rec_file, ocr_keys_file, shape_buckets, det_buckets, rec_widths)
+        self.load_timings = self.models.load_timings
+        self.load_time = self.models.load_time
+        # 热更新：同一时间只进行一次；被替换的 ModelSet 用弱引用跟踪，确认其会话已释放
+        self._reload_lock = threading.Lock()
+        self._retired = []
+        self.reloads = 0
+        # 默认以外的识别模型在首次使用时加载
+        self.registry = RecognizerRegistry(rec_models, shape_buckets=shape_buckets, rec_widths=rec_widths)
+
+    @property
+    def det_session(self):
+        return self.models.det_session
+
+    @property
+    def rec_session(self):
+        return self.models.rec_session
+
+    @property
+    def postprocess_op(self):
+        return self.models.postprocess_op
+
+    @property
+    def det_file(self):
+        return self.models.files['det']['path']
+
+    @property
+    def rec_file(self):
+        return self.models.files['rec']['path']
+
+    @property
+    def ocr_keys_file(self):
+        return self.models.files['keys']['path']
+
+    def reload(self, det_file=None, rec_file=None, ocr_keys_file=None,
+               det_sizes=WARMUP_DET_SIZES, rec_widths=WARMUP_REC_WIDTHS):
+        """
+        加载新模型并预热，完成后整体替换；加载或预热失败时抛出异常，继续使用原模型
+        替换之后开始处理的图片使用新模型，正在处理的图片仍用原模型完成
+        :param det_file: 为None时重新加载当前路径的文件
+        :return: 新 ModelSet 的 info()，附带预热耗时
+        """
+        with self._reload_lock:
+            models = ModelSet(det_file or self.det_file, rec_file or self.rec_file,
+                              ocr_keys_file or self.ocr_keys_file,
+                              self.shape_buckets, self.det_buckets, self.rec_widths)
+            timings = self._warmup(models, det_sizes, rec_widths)
+            retired, self.models = self.models, models
+            self._retired = [ref for ref in self._retired if ref() is not None] + [weakref.ref(retired)]
+            self.reloads += 1
+        info = models.info()
+        info['warmup_ms'] = timings
+        return info
+
+    def model_info(self):
+        """当前生效的模型指纹和文件，以及尚未释放的旧模型数"""
+        info = self.models.info()
+        info['reloads'] = self.reloads
+        info['retired_alive'] = sum(ref() is not None for ref in self._retired)
+        return info
+
+    def recognizer(self, model=None):
+        """
+        取出请求指定的识别模型，默认模型返回None（使用 ModelSet 中的识别会话）
+        :raises ValueError: 模型未注册
+        """
+        if self.registry.resolve(model) == DEFAULT_REC_MODEL:
+            return None
+        return self.registry.get(model)
+
+    def bucket_stats(self):
+        """各尺寸桶的调用次数、耗时、补零比例和缓冲区分配情况，未开启分桶时返回None"""
+        if not self.shape_buckets:
+            return None
+        models = self.models
+        return {'det': models.det_session.stats(), 'rec': models.rec_session.stats()}
+
+    def check_content(self, image):
+        """
+        检测前的空白检查，同时累计计数
+        :return: (skip, audit)：skip 为True时可以直接返回空结果；
+                 audit 为True表示该图片被判为空白但被抽中完整识别，识别完成后需调用 record_audit
+        """
+        if not self.content_check:
+            return False, False
+        low = is_low_content(image)
+        audit = low and self.content_audit_rate > 0 and random.random() < self.content_audit_rate
+        with self._counts_lock:
+            self.content_counts['checked'] += 1
+            if audit:
+                self.content_counts['audited'] += 1
+            elif low:
+                self.content_counts['short_circuited'] += 1
+        return low and not audit, audit
+
+    def record_audit(self, found_text):
+        """记录抽查结果，found_text 为True说明空白检查漏掉了真实文字"""
+        if found_text:
+            with self._counts_lock:
+                self.content_counts['missed'] += 1
+
+    def content_stats(self):
+        """空白检查计数：检查数、直接返回数、抽查数以及抽查中发现文字的数量"""
+        with self._counts_lock:
+            return dict(self.content_counts)
+
+    def warmup(self, det_sizes=WARMUP_DET_SIZES, rec_widths=WARMUP_REC_WIDTHS):
+        """
+        用合成输入把每个尺寸跑一遍
+        ONNX Runtime 在首次遇到某个输入尺寸时才初始化内核和内存池，预热后正式请求不再承担这部分开销
+        开启分桶时预热的是这些尺寸所在的桶，分配的缓冲区放入进程内共享的池，之后各请求线程直接复用
+        :param det_sizes: 检测输入尺寸列表 [(高, 宽), ...]
+        :param rec_widths: 识别输入宽度列表
+        :return: 各尺寸耗时（毫秒）
+        """
+        return self._warmup(self.models, det_sizes, rec_widths)
+
+    @staticmethod
+    def _warmup(models, det_sizes, rec_widths):
+        timings = {'det': {}, 'rec': {}}
+        det_input = models.det_session.get_inputs()[0].name
+        for h, w in det_sizes:
+            img = np.zeros((1, 3, int(h), int(w)), dtype=np.float32)
+            start_time = time.time()
+            models.det_session.run(None, {det_input: img})
+            timings['det'][f"{w}x{h}"] = round((time.time() - start_time) * 1000, 2)
+        rec_input = models.rec_session.get_inputs()[0].name
+        for w in rec_widths:
+            img = np.zeros((1, 3, 48, int(w)), dtype=np.float32)
+            start_time = time.time()
+            models.rec_session.run(None, {rec_input: img})
+            timings['rec'][str(w)] = round((time.time() - start_time) * 1000, 2)
+        return timings
+
+    def create_system(self, image, char_topk=None, alt_threshold=CHAR_ALT_THRESHOLD, models=None,
+                      recognizer=None):
+        """
+        为单张图片创建复用本引擎会话的 det_rec_functions
+        :param models: 使用指定的 ModelSet，默认为当前生效的一组
+        :param recognizer: 不为None时用该识别模型（recognizer() 的返回值）代替 ModelSet 中的识别会话
+        """
+        # 只取一次，检测和识别一定来自同一组模型
+        models = models or self.models
+        rec = recognizer or models
+        return det_rec_functions(
+            image,
+            models.files['det']['path'],
+            rec.files['rec']['path'],
+            rec.files['keys']['path'],
+            det_session=models.det_session,
+            rec_session=rec.rec_session,
+            postprocess_op=rec.postprocess_op,
+            char_topk=char_topk,
+            alt_threshold=alt_threshold,
+            rec_max_width=self.rec_max_width,
+            det_params=self.det_params,
+            rec_batch_num=self.rec_batch_num
+        )
+
+    def ocr(self, image, char_topk=None, alt_threshold=CHAR_ALT_THRESHOLD, model=None):
+        """
+        检测+识别单张图片
+        :param image: BGR格式的OpenCV图像
+        :param char_topk: 不为None时每条结果附带逐字符置信度，并对低于 alt_threshold 的字符给出 top-k 候选
+        :param model: 识别模型名或语言别名，为None时使用默认模型
+        :return: (dt_boxes, rec_results)，已按置信度过滤
+        """
+        dt_boxes, rec_results, _ = self._ocr(image, char_topk, alt_threshold, model=model)
+        return dt_boxes, rec_results
+
+    def _ocr(self, image, char_topk, alt_threshold, timings=None, model=None):
+        recognizer = self.recognizer(model)
+        start_time = time.time()
+        skip, audit = self.check_content(image)
+        det_start = time.time()
+        add_timing(timings, 'content', det_start - start_time)
+        if skip:
+            return [], [], True
+        ocr_system = self.create_system(image, char_topk, alt_threshold, recognizer=recognizer)
+        dt_boxes = ocr_system.get_boxes()
+        rec_start = time.time()
+        add_timing(timings, 'det', rec_start - det_start)
+        rec_results, _ = ocr_system.recognition_img(dt_boxes)
+        add_timing(timings, 'rec', time.time() - rec_start)
+        dt_boxes, rec_results = filter_box_rec(dt_boxes, rec_results, self.drop_score)
+        if audit:
+            self.record_audit(len(dt_boxes) > 0)
+        return dt_boxes, rec_results, False
+
+    def ocr_regions(self, image, rois, char_topk=None, alt_threshold=CHAR_ALT_THRESHOLD, timings=None,
+                    model=None):
+        """
+        只检测+识别指定区域，检测分辨率由各区域裁剪图的大小决定
+        :param rois: regions.parse_rois 的返回值
+        :param timings: 不为None时累加各阶段耗时（秒），见 add_timing
+        :return: (dt_boxes, rec_results, roi_ids, short_circuited)，坐标为整页坐标，
+                 roi_ids 为每个框所属区域的下标；所有区域都是空白时 short_circuited 为True
+        """
+        img_h, img_w = image.shape[:2]
+        # 同一请求的所有区域使用同一组模型，中途热更新不影响本请求
+        models = self.models
+        recognizer = self.recognizer(model)
+        boxes, results, roi_ids = [], [], []
+        short_circuited = True
+        for roi_id, (rect, polygon) in enumerate(rois):
+            if rect is None:
+                continue
+            start_time = time.time()
+            crop, (x0, y0) = crop_roi(image, rect, polygon)
+            skip, audit = self.check_content(crop)
+            det_start = time.time()
+            add_timing(timings, 'content', det_start - start_time)
+            if skip:
+                continue
+            short_circuited = False
+            ocr_system = self.create_system(crop, char_topk, alt_threshold, models, recognizer)
+            offset = np.float32([x0, y0])
+            # 裁剪时四周多留了边距，只保留中心在区域内的文本框
+            crop_boxes = [box for box in ocr_system.get_boxes() if box_in_roi(box + offset, rect, polygon)]
+            rec_start = time.time()
+            add_timing(timings, 'det', rec_start - det_start)
+            rec_results, _ = ocr_system.recognition_img(crop_boxes)
+            add_timing(timings, 'rec', time.time() - rec_start)
+            crop_boxes, rec_results = filter_box_rec(crop_boxes, rec_results, self.drop_score)
+            if audit:
+                self.record_audit(len(crop_boxes) > 0)
+            for box, rec_result in zip(crop_boxes, rec_results):
+                box = box + offset
+                box[:, 0] = np.clip(box[:, 0], 0, img_w - 1)
+                box[:, 1] = np.clip(box[:, 1], 0, img_h - 1)
+                boxes.append(box)
+                results.append(rec_result)
+                roi_ids.append(roi_id)
+        boxes, results, roi_ids = dedupe_boxes(boxes, results, roi_ids)
+        return boxes, results, roi_ids, short_circuited
+
+    def ocr_result(self, image, char_topk=None, alt_threshold=CHAR_ALT_THRESHOLD, rois=None, timings=None,
+                   model=None):
+        """
+        检测+识别单张图片，返回 OCRResult；空白图片的 short_circuited 为True
+        :param rois: 不为None时只识别这些区域（regions.parse_rois 的返回值），结果带所属区域下标
+        :param timings: 不为None时累加空白检查（content）、检测（det）、识别（rec）的耗时（秒）
+        :param model: 识别模型名或语言别名，为None时使用默认模型
+        """
+        if rois is not None:
+            dt_boxes, rec_results, roi_ids, short_circuited = self.ocr_regions(
+                image, rois, char_topk, alt_threshold, timings, model)
+            result = OCRResult.from_rec(dt_boxes, rec_results, roi_ids)
+        else:
+            dt_boxes, rec_results, short_circuited = self._ocr(image, char_topk, alt_threshold, timings, model)
+            result = OCRResult.from_rec(dt_boxes, rec_results)
+        result.short_circuited = short_circuited
+        return result
+
+
+def add_timing(timings, stage, seconds):
+    """把一个阶段的耗时累加到 timings 字典，timings 为None时忽略"""
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def format_results(dt_boxes, rec_results):
+    """把检测框和识别结果整理成API返回的格式"""
+    return OCRResult.from_rec(dt_boxes, rec_results).to_dicts()
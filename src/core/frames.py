@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+多帧图片（多页TIFF、GIF动图等）逐页解码
+PIL 在 seek 到某一帧时才解码该帧，逐页读取时内存中只有一页的像素数据
+"""
+
+import io
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from src.utils.config import MULTIPAGE_MAX_PAGES
+
+
+def open_frames(image_data, max_pages=MULTIPAGE_MAX_PAGES):
+    """
+    打开多帧图片
+    :param image_data: 图片文件的字节
+    :return: (PIL图像, 总页数, 实际处理的页数)
+    """
+    image = Image.open(io.BytesIO(image_data))
+    total = getattr(image, 'n_frames', 1)
+    return image, total, min(total, max_pages) if max_pages else total
+
+
+def read_frame(image, index):
+    """
+    解码第 index 页，返回BGR图像
+    :param image: open_frames 返回的PIL图像
+    """
+    image.seek(index)
+    frame = np.array(image.convert('RGB'))
+    return cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+
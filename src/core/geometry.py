@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+文本框几何运算
+所有函数都作用于 (N, 4, 2) 的数组，一次处理全部文本框，不再逐框循环
+"""
+
+import cv2
+import numpy as np
+
+
+def empty_boxes(dtype=np.float32):
+    return np.zeros((0, 4, 2), dtype=dtype)
+
+
+def as_boxes(boxes, dtype=np.float32):
+    """转换成 (N, 4, 2) 数组"""
+    boxes = np.asarray(boxes, dtype=dtype)
+    if boxes.size == 0:
+        return empty_boxes(dtype)
+    return boxes.reshape(-1, 4, 2)
+
+
+def _take_points(boxes, index):
+    return np.take_along_axis(boxes, index[:, :, None], axis=1)
+
+
+def order_points_clockwise(boxes):
+    """
+    把四个角点排成 左上、右上、右下、左下
+    与 imutils 的做法一致：按x分成左右两对，每对再按y分上下
+    """
+    boxes = as_boxes(boxes)
+    by_x = _take_points(boxes, np.argsort(boxes[:, :, 0], axis=1, kind='stable'))
+    left, right = by_x[:, :2], by_x[:, 2:]
+    left = _take_points(left, np.argsort(left[:, :, 1], axis=1, kind='stable'))
+    right = _take_points(right, np.argsort(right[:, :, 1], axis=1, kind='stable'))
+    return np.stack([left[:, 0], right[:, 0], right[:, 1], left[:, 1]], axis=1).astype(np.float32)
+
+
+def order_mini_box_points(boxes):
+    """
+    cv2.boxPoints 输出的角点排序，与 DBPostProcess.get_mini_boxes 原有规则一致：
+    按x排序后，左边两点中y较小的为左上（y相等时取第二个），右边两点同理
+    """
+    boxes = as_boxes(boxes)
+    by_x = _take_points(boxes, np.argsort(boxes[:, :, 0], axis=1, kind='stable'))
+    p0, p1, p2, p3 = by_x[:, 0], by_x[:, 1], by_x[:, 2], by_x[:, 3]
+    left_down = (p1[:, 1] > p0[:, 1])[:, None]
+    right_down = (p3[:, 1] > p2[:, 1])[:, None]
+    top_left = np.where(left_down, p0, p1)
+    bottom_left = np.where(left_down, p1, p0)
+    top_right = np.where(right_down, p2, p3)
+    bottom_right = np.where(right_down, p3, p2)
+    return np.stack([top_left, top_right, bottom_right, bottom_left], axis=1)
+
+
+def mini_boxes(contours):
+    """
+    每个轮廓的最小外接矩形
+    :return: (boxes (N, 4, 2) float32 已排序, short_sides (N,))
+    """
+    if len(contours) == 0:
+        return empty_boxes(), np.zeros((0,), dtype=np.float32)
+    rects = [cv2.minAreaRect(contour) for contour in contours]
+    points = np.array([cv2.boxPoints(rect) for rect in rects], dtype=np.float32)
+    short_sides = np.array([min(rect[1]) for rect in rects], dtype=np.float32)
+    return order_mini_box_points(points), short_sides
+
+
+def clip_boxes(boxes, img_height, img_width):
+    """把角点限制在图像范围内并取整（与原 clip_det_res 一致）"""
+    boxes = as_boxes(boxes).copy()
+    boxes[:, :, 0] = np.floor(np.clip(boxes[:, :, 0], 0, img_width - 1))
+    boxes[:, :, 1] = np.floor(np.clip(boxes[:, :, 1], 0, img_height - 1))
+    return boxes
+
+
+def box_sizes(boxes):
+    """
+    文本框的宽和高
+    宽为左上到右上的距离，高为左上到左下的距离
+    """
+    boxes = as_boxes(boxes)
+    widths = np.linalg.norm(boxes[:, 0] - boxes[:, 1], axis=1)
+    heights = np.linalg.norm(boxes[:, 0] - boxes[:, 3], axis=1)
+    return widths, heights
+
+
+def filter_boxes(boxes, image_shape, min_size=3):
+    """
+    排序角点、裁剪到图像内，并去掉宽或高不超过 min_size 的框
+    :return: (M, 4, 2) float32
+    """
+    img_height, img_width = image_shape[0:2]
+    boxes = as_boxes(boxes)
+    if len(boxes) == 0:
+        return boxes
+    boxes = clip_boxes(order_points_clockwise(boxes), img_height, img_width)
+    widths, heights = box_sizes(boxes)
+    keep = (np.floor(widths) > min_size) & (np.floor(heights) > min_size)
+    return boxes[keep]
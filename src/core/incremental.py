@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+连续截图的增量OCR
+按会话保存上一张截图及其识别结果，新截图只对发生变化的区域做检测和识别，
+再与未变化的文本行合并，耗时大致与变化面积成正比
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from src.core.main import filter_box_rec
+from src.core.layout import reading_order
+from src.utils.config import (
+    INCREMENTAL_SESSION_TTL, INCREMENTAL_MAX_SESSIONS, INCREMENTAL_PIXEL_DIFF_THRESH,
+    INCREMENTAL_REGION_MARGIN, INCREMENTAL_FULL_RATIO
+)
+
+
+def _to_gray(image):
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+
+
+def _box_rect(box):
+    """四边形的外接矩形 (x0, y0, x1, y1)，右下角为开区间"""
+    return (int(np.floor(box[:, 0].min())), int(np.floor(box[:, 1].min())),
+            int(np.ceil(box[:, 0].max())) + 1, int(np.ceil(box[:, 1].max())) + 1)
+
+
+def _intersects(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def _merge_rects(rects):
+    """合并所有相交的矩形，直到互不相交"""
+    rects = list(rects)
+    merged = True
+    while merged:
+        merged = False
+        result = []
+        for rect in rects:
+            for i, other in enumerate(result):
+                if _intersects(rect, other):
+                    result[i] = (min(rect[0], other[0]), min(rect[1], other[1]),
+                                 max(rect[2], other[2]), max(rect[3], other[3]))
+                    merged = True
+                    break
+            else:
+                result.append(rect)
+        rects = result
+    return rects
+
+
+def changed_regions(prev_gray, cur_gray, pixel_diff_thresh=INCREMENTAL_PIXEL_DIFF_THRESH,
+                    margin=INCREMENTAL_REGION_MARGIN):
+    """
+    计算两帧之间发生变化的区域
+    :return: 互不相交的矩形列表 [(x0, y0, x1, y1), ...]
+    """
+    diff = (cv2.absdiff(prev_gray, cur_gray) > pixel_diff_thresh).astype(np.uint8)
+    if not diff.any():
+        return []
+    # 先按边距膨胀，相邻的变化点会连成一块
+    kernel = np.ones((2 * margin + 1, 2 * margin + 1), dtype=np.uint8)
+    diff = cv2.dilate(diff, kernel)
+    num, _, stats, _ = cv2.connectedComponentsWithStats(diff, connectivity=8)
+    rects = []
+    for x, y, w, h, _ in stats[1:num]:
+        rects.append((int(x), int(y), int(x + w), int(y + h)))
+    return _merge_rects(rects)
+
+
+class IncrementalOCR(object):
+    """
+    单个会话的增量识别状态
+    同一会话的请求需要串行处理，由调用方持有 self.lock
+    """
+
+    def __init__(self, engine,
+                 pixel_diff_thresh=INCREMENTAL_PIXEL_DIFF_THRESH,
+                 margin=INCREMENTAL_REGION_MARGIN,
+                 full_ratio=INCREMENTAL_FULL_RATIO):
+        self.engine = engine
+        self.pixel_diff_thresh = pixel_diff_thresh
+        self.margin = margin
+        self.full_ratio = full_ratio
+        self.lock = threading.Lock()
+        self.last_used = time.time()
+        self.prev_gray = None
+        self.boxes = []
+        self.rec_results = []
+
+    def _full(self, image):
+        ocr_system = self.engine.create_system(image)
+        dt_boxes = ocr_system.get_boxes()
+        rec_results, _ = ocr_system.recognition_img(dt_boxes)
+        self.boxes = [np.array(box, dtype=np.float32) for box in dt_boxes]
+        self.rec_results = list(rec_results)
+
+    def _regions(self, image, rects):
+        """只对变化区域做检测+识别，坐标映射回整图"""
+        boxes, rec_results = [], []
+        for x0, y0, x1, y1 in rects:
+            crop = image[y0:y1, x0:x1]
+            ocr_system = self.engine.create_system(crop)
+            dt_boxes = ocr_system.get_boxes()
+            if len(dt_boxes) == 0:
+                continue
+            crop_results, _ = ocr_system.recognition_img(dt_boxes)
+            offset = np.float32([x0, y0])
+            for box, rec_result in zip(dt_boxes, crop_results):
+                boxes.append(np.array(box, dtype=np.float32) + offset)
+                rec_results.append(rec_result)
+        return boxes, rec_results
+
+    def process(self, image, reset=False):
+        """
+        识别一张截图
+        :param image: BGR格式的OpenCV图像
+        :param reset: 为True时忽略上一帧，整图识别
+        :return: dict，包含 boxes、rec_results（已按置信度过滤）以及增量统计信息
+        """
+        self.last_used = time.time()
+        gray = _to_gray(image)
+        h, w = gray.shape[:2]
+        rects = []
+        full = reset or self.prev_gray is None or self.prev_gray.shape != gray.shape
+        if not full:
+            rects = changed_regions(self.prev_gray, gray, self.pixel_diff_thresh, self.margin)
+            rects = [(max(0, x0), max(0, y0), min(w, x1), min(h, y1)) for x0, y0, x1, y1 in rects]
+
+            # 与变化区域相交的旧文本框整体失效，把它们并入变化区域以便完整重新检测
+            box_rects = [_box_rect(box) for box in self.boxes]
+            stale = set()
+            grown = True
+            while grown and rects:
+                grown = False
+                for index, box_rect in enumerate(box_rects):
+                    if index in stale:
+                        continue
+                    for i, rect in enumerate(rects):
+                        if _intersects(box_rect, rect):
+                            rects[i] = (max(0, min(rect[0], box_rect[0])), max(0, min(rect[1], box_rect[1])),
+                                        min(w, max(rect[2], box_rect[2])), min(h, max(rect[3], box_rect[3])))
+                            stale.add(index)
+                            grown = True
+                            break
+                if grown:
+                    rects = _merge_rects(rects)
+
+            changed_area = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in rects)
+            changed_ratio = changed_area / float(h * w)
+            full = changed_ratio > self.full_ratio
+
+        if full:
+            self._full(image)
+            changed_ratio = 1.0
+            rects = []
+        elif rects:
+            new_boxes, new_results = self._regions(image, rects)
+            kept = [(box, rec_result) for index, (box, rec_result)
+                    in enumerate(zip(self.boxes, self.rec_results)) if index not in stale]
+            merged = kept + list(zip(new_boxes, new_results))
+            # 与 sorted_boxes 一致，按阅读顺序排列
+            order, _, _ = reading_order([item[0] for item in merged])
+            self.boxes = [merged[i][0] for i in order]
+            self.rec_results = [merged[i][1] for i in order]
+        self.prev_gray = gray
+
+        dt_boxes, rec_results = filter_box_rec(self.boxes, self.rec_results, self.engine.drop_score)
+        return {
+            'boxes': dt_boxes,
+            'rec_results': rec_results,
+            'full': full,
+            'regions': [list(rect) for rect in rects],
+            'changed_ratio': changed_ratio
+        }
+
+
+class SessionStore(object):
+    """
+    线程安全的会话表，空闲超时或数量超限时淘汰最久未使用的会话
+    """
+
+    def __init__(self, engine_getter, ttl=INCREMENTAL_SESSION_TTL, max_sessions=INCREMENTAL_MAX_SESSIONS):
+        self.engine_getter = engine_getter
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _expire(self, now):
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+            if now - session.last_used <= self.ttl and len(self.sessions) <= self.max_sessions:
+                break
+            del self.sessions[session_id]
+
+    def get(self, session_id):
+        """取出会话，不存在时新建"""
+        now = time.time()
+        with self.lock:
+            session = self.sessions.pop(session_id, None)
+            if session is None:
+                session = IncrementalOCR(self.engine_getter())
+            session.last_used = now
+            self.sessions[session_id] = session
+            self._expire(now)
+            return session
+
+    def discard(self, session_id):
+        with self.lock:
+            return self.sessions.pop(session_id, None) is not None
+
+    def __len__(self):
+        with self.lock:
+            return len(self.sessions)
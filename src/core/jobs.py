@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+异步识别任务
+任务和图片保存在本地SQLite数据库中，由后台线程逐页识别；服务重启后未完成的页会重新排队，
+完成的任务在保留期过后连同结果一起删除
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from src.utils.config import (
+    JOBS_DB_PATH, JOBS_WORKERS, JOBS_RETENTION_SECONDS, JOBS_POLL_INTERVAL, JOBS_PURGE_INTERVAL,
+    JOBS_MAX_ATTEMPTS
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    options TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    finished REAL,
+    expires REAL
+);
+CREATE TABLE IF NOT EXISTS job_pages (
+    job_id TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    image BLOB,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (job_id, page)
+);
+CREATE INDEX IF NOT EXISTS job_pages_status ON job_pages (status);
+CREATE INDEX IF NOT EXISTS jobs_expires ON jobs (expires);
+"""
+
+
+class JobStore(object):
+    """
+    SQLite任务表，单个连接加锁后供多个线程使用
+    页状态: pending -> running -> done / failed
+    任务状态: queued -> running -> done（至少一页成功）/ failed（全部失败）
+    """
+
+    def __init__(self, path=JOBS_DB_PATH, retention=JOBS_RETENTION_SECONDS, max_attempts=JOBS_MAX_ATTEMPTS):
+        self.path = path
+        self.retention = retention
+        self.max_attempts = max(int(max_attempts), 1)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(_SCHEMA)
+        # 旧版本创建的数据库没有 attempts 列
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(job_pages)')]
+        if 'attempts' not in columns:
+            self.conn.execute('ALTER TABLE job_pages ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0')
+
+    def recover(self):
+        """
+        服务重启后，把上次中断时正在处理的页重新排队
+        已处理 max_attempts 次的页很可能就是导致进程退出的原因，不再重试，直接标记为失败
+        :return: (重新排队的页数, 标记为失败的页数)
+        """
+        with self.lock:
+            exhausted = self.conn.execute(
+                "SELECT job_id, page FROM job_pages WHERE status = 'running' AND attempts >= ?",
+                (self.max_attempts,)).fetchall()
+        for job_id, page in exhausted:
+            self.complete(job_id, page, error=f"处理{self.max_attempts}次均未完成（服务在处理中退出），不再重试")
+        with self.lock:
+            cursor = self.conn.execute("UPDATE job_pages SET status = 'pending' WHERE status = 'running'")
+            return cursor.rowcount, len(exhausted)
+
+    def create(self, images, options=None):
+        """
+        :param images: 各页图片的原始字节（已完成base64解码）
+        :param options: 识别参数，处理时原样传给识别函数
+        :return: 任务ID
+        """
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            self.conn.execute('BEGIN')
+            try:
+                self.conn.execute(
+                    "INSERT INTO jobs (id, status, options, total, created) VALUES (?, 'queued', ?, ?, ?)",
+                    (job_id, json.dumps(options or {}), len(images), time.time()))
+                self.conn.executemany(
+                    "INSERT INTO job_pages (job_id, page, status, image) VALUES (?, ?, 'pending', ?)",
+                    [(job_id, page, sqlite3.Binary(image)) for page, image in enumerate(images)])
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+        return job_id
+
+    def claim(self):
+        """
+        取出下一个待处理的页并标记为处理中
+        :return: (job_id, page, 图片字节, options)，没有待处理的页时返回None
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT p.job_id, p.page, p.image, j.options FROM job_pages p JOIN jobs j ON j.id = p.job_id "
+                "WHERE p.status = 'pending' ORDER BY j.created, p.page LIMIT 1").fetchone()
+            if row is None:
+                return None
+            job_id, page, image, options = row
+            self.conn.execute("UPDATE job_pages SET status = 'running', attempts = attempts + 1 "
+                              "WHERE job_id = ? AND page = ?", (job_id, page))
+            self.conn.execute("UPDATE jobs SET status = 'running' WHERE id = ? AND status = 'queued'", (job_id,))
+            return job_id, page, bytes(image), json.loads(options)
+
+    def complete(self, job_id, page, result=None, error=None):
+        """记录一页的结果或错误，并释放图片数据；最后一页完成时设置任务的保留期限"""
+        now = time.time()
+        status = 'failed' if error is not None else 'done'
+        with self.lock:
+            self.conn.execute('BEGIN')
+            try:
+                self.conn.execute(
+                    "UPDATE job_pages SET status = ?, image = NULL, result = ?, error = ? WHERE job_id = ? AND page = ?",
+                    (status, None if result is None else json.dumps(result, ensure_ascii=False), error, job_id, page))
+                self.conn.execute(
+                    "UPDATE jobs SET done = done + 1, failed = failed + ? WHERE id = ?", (int(error is not None), job_id))
+                self.conn.execute(
+                    "UPDATE jobs SET status = CASE WHEN failed = total THEN 'failed' ELSE 'done' END, "
+                    "finished = ?, expires = ? WHERE id = ? AND done = total",
+                    (now, now + self.retention, job_id))
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+
+    def get(self, job_id, with_results=True):
+        """
+        查询任务
+        :return: 状态字典，任务不存在或已过期删除时返回None
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT status, total, done, failed, created, finished, expires FROM jobs WHERE id = ?",
+                (job_id,)).fetchone()
+            if row is None:
+                return None
+            pages = []
+            if with_results:
+                pages = self.conn.execute(
+                    "SELECT page, status, result, error FROM job_pages "
+                    "WHERE job_id = ? AND status IN ('done', 'failed') ORDER BY page", (job_id,)).fetchall()
+        status, total, done, failed, created, finished, expires = row
+        job = {
+            'job_id': job_id,
+            'status': status,
+            'pages': total,
+            'done': done,
+            'failed': failed,
+            'created': created,
+            'finished': finished,
+            'expires': expires
+        }
+        if with_results:
+            job['results'] = [
+                {'page': page, 'success': True, 'data': json.loads(result)} if page_status == 'done'
+                else {'page': page, 'success': False, 'error': error}
+                for page, page_status, result, error in pages
+            ]
+        return job
+
+    def purge(self, now=None):
+        """删除已过保留期的任务，返回删除的任务数"""
+        now = time.time() if now is None else now
+        with self.lock:
+            self.conn.execute('BEGIN')
+            try:
+                self.conn.execute(
+                    "DELETE FROM job_pages WHERE job_id IN (SELECT id FROM jobs WHERE expires < ?)", (now,))
+                count = self.conn.execute("DELETE FROM jobs WHERE expires < ?", (now,)).rowcount
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+        return count
+
+    def counts(self):
+        """各状态的任务数"""
+        with self.lock:
+            return dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+class JobWorkers(object):
+    """
+    后台识别线程
+    process(image_bytes, options) 由调用方提供，返回可JSON序列化的结果，出错时抛出异常
+    """
+
+    def __init__(self, store, process, workers=JOBS_WORKERS,
+                 poll_interval=JOBS_POLL_INTERVAL, purge_interval=JOBS_PURGE_INTERVAL):
+        self.store = store
+        self.process = process
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.purge_interval = purge_interval
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.last_purge = 0.0
+        self.purge_lock = threading.Lock()
+
+    def start(self):
+        """启动后台线程，返回 store.recover() 的 (重新排队的页数, 标记为失败的页数)"""
+        recovered = self.store.recover()
+        for index in range(self.workers):
+            threading.Thread(target=self._loop, name=f"ocr-job-{index}", daemon=True).start()
+        return recovered
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+
+    def notify(self):
+        """有新任务时唤醒空闲线程"""
+        self.wakeup.set()
+
+    def _maybe_purge(self):
+        now = time.time()
+        with self.purge_lock:
+            if now - self.last_purge < self.purge_interval:
+                return
+            self.last_purge = now
+        self.store.purge(now)
+
+    def _loop(self):
+        while not self.stopped.is_set():
+            self._maybe_purge()
+            item = self.store.claim()
+            if item is None:
+                self.wakeup.wait(self.poll_interval)
+                self.wakeup.clear()
+                continue
+            job_id, page, image, options = item
+            try:
+                result = self.process(image, options)
+            except Exception as e:
+                self.store.complete(job_id, page, error=str(e))
+            else:
+                self.store.complete(job_id, page, result=result)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+阅读顺序与行/段落分组
+按框高的相对比例把文本框聚成行，行内按x排序，全部用数组运算完成，复杂度 O(n log n)
+"""
+
+import numpy as np
+
+from src.utils.config import LINE_TOLERANCE, PARAGRAPH_GAP
+
+
+def reading_order(boxes, line_tol=LINE_TOLERANCE, para_gap=PARAGRAPH_GAP):
+    """
+    计算文本框的阅读顺序
+    :param boxes: (N, 4, 2) 文本框，或可以转换成该形状的列表
+    :param line_tol: 按中心y排序后，相邻两框中心距离超过 line_tol * 较小框高 时换行
+    :param para_gap: 相邻两行的垂直间距超过 para_gap * 较小行高 时换段
+    :return: (order, line_ids, para_ids)
+             order 为按阅读顺序排列的原始下标，line_ids / para_ids 与 order 一一对应
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4, 2)
+    num_boxes = boxes.shape[0]
+    if num_boxes == 0:
+        empty = np.zeros((0,), dtype=np.int64)
+        return empty, empty.copy(), empty.copy()
+
+    ys = boxes[:, :, 1]
+    top = ys.min(axis=1)
+    bottom = ys.max(axis=1)
+    heights = np.maximum(bottom - top, 1.0)
+    center_y = (top + bottom) / 2
+    left = boxes[:, :, 0].min(axis=1)
+
+    # 按中心y排序后，相邻框的间距与框高比较，决定是否开始新的一行
+    by_y = np.argsort(center_y, kind='stable')
+    gaps = np.diff(center_y[by_y])
+    pair_heights = np.minimum(heights[by_y][1:], heights[by_y][:-1])
+    new_line = gaps > line_tol * pair_heights
+    line_of = np.empty(num_boxes, dtype=np.int64)
+    line_of[by_y] = np.concatenate([[0], np.cumsum(new_line)])
+
+    # 先按行、再按行内x排序
+    order = np.lexsort((left, line_of))
+    line_ids = line_of[order]
+
+    # 行的上下边界，相邻行间距过大时开始新的段落
+    starts = np.flatnonzero(np.concatenate([[True], np.diff(line_ids) != 0]))
+    line_top = np.minimum.reduceat(top[order], starts)
+    line_bottom = np.maximum.reduceat(bottom[order], starts)
+    line_height = np.maximum(line_bottom - line_top, 1.0)
+    line_gaps = line_top[1:] - line_bottom[:-1]
+    new_para = line_gaps > para_gap * np.minimum(line_height[1:], line_height[:-1])
+    para_of_line = np.concatenate([[0], np.cumsum(new_para)])
+    para_ids = para_of_line[line_ids]
+    return order, line_ids, para_ids
@@ -6,10 +6,15 @@ import onnxruntime
 import numpy as np
 import pyclipper
 from shapely.geometry import Polygon
-from PIL import ImageDraw, Image, ImageFont
-import random
-import argparse
-import glob
+from src.core.geometry import mini_boxes, order_points_clockwise, clip_boxes, filter_boxes
+from src.core.layout import reading_order
+from src.core.charset import load_charset, table_to_characters, ctc_decode, ctc_decode_details
+from src.core.chunking import split_wide_crop, stitch_chunks, max_overlap_chars
+from src.utils.config import (
+    REC_MAX_WIDTH, REC_CHUNK_OVERLAP, REC_MODELS, REC_BATCH_NUM,
+    DET_DB_THRESH, DET_DB_BOX_THRESH, MAX_CANDIDATES, UNCLIP_RATIO, USE_DILATION, DET_LIMIT_SIDE_LEN
+)
+# PIL绘图模块、random、argparse 在首次使用时才导入，缩短服务启动时间
 
 
 # PalldeOCR 检测模块 需要用到的图片预处理类
@@ -158,31 +163,29 @@ class DBPostProcess(object):
 
         num_contours = min(len(contours), self.max_candidates)
 
-        boxes = []
+        # 所有候选框一次性求最小外接矩形并排序角点，得到 (N, 4, 2)
+        points, ssides = mini_boxes(contours[:num_contours])
+        points = points[ssides >= self.min_size]
+
+        expanded = []
         scores = []
-        for index in range(num_contours):
-            contour = contours[index]
-            points, sside = self.get_mini_boxes(contour)
-            if sside < self.min_size:
-                continue
-            points = np.array(points)
-            score = self.box_score_fast(pred, points.reshape(-1, 2))
+        for box in points:
+            score = self.box_score_fast(pred, box)
             if self.box_thresh > score:
                 continue
+            expanded.append(self.unclip(box).reshape(-1, 1, 2))
+            scores.append(score)
 
-            box = self.unclip(points).reshape(-1, 1, 2)
-            box, sside = self.get_mini_boxes(box)
-            if sside < self.min_size + 2:
-                continue
-            box = np.array(box)
+        boxes, ssides = mini_boxes(expanded)
+        keep = ssides >= self.min_size + 2
+        boxes = boxes[keep]
+        scores = [score for score, kept in zip(scores, keep) if kept]
 
-            box[:, 0] = np.clip(
-                np.round(box[:, 0] / width * dest_width), 0, dest_width)
-            box[:, 1] = np.clip(
-                np.round(box[:, 1] / height * dest_height), 0, dest_height)
-            boxes.append(box.astype(int))
-            scores.append(score)
-        return np.array(boxes, dtype=int), scores
+        boxes[:, :, 0] = np.clip(
+            np.round(boxes[:, :, 0] / width * dest_width), 0, dest_width)
+        boxes[:, :, 1] = np.clip(
+            np.round(boxes[:, :, 1] / height * dest_height), 0, dest_height)
+        return boxes.astype(int), scores
 
     def unclip(self, box):
         unclip_ratio = self.unclip_ratio
@@ -194,27 +197,8 @@ class DBPostProcess(object):
         return expanded
 
     def get_mini_boxes(self, contour):
-        bounding_box = cv2.minAreaRect(contour)
-        points = sorted(list(cv2.boxPoints(bounding_box)), key=lambda x: x[0])
-
-        index_1, index_2, index_3, index_4 = 0, 1, 2, 3
-        if points[1][1] > points[0][1]:
-            index_1 = 0
-            index_4 = 1
-        else:
-            index_1 = 1
-            index_4 = 0
-        if points[3][1] > points[2][1]:
-            index_2 = 2
-            index_3 = 3
-        else:
-            index_2 = 3
-            index_3 = 2
-
-        box = [
-            points[index_1], points[index_2], points[index_3], points[index_4]
-        ]
-        return box, min(bounding_box[1])
+        boxes, ssides = mini_boxes([contour])
+        return boxes[0], ssides[0]
 
     def box_score_fast(self, bitmap, _box):
         h, w = bitmap.shape[:2]
@@ -254,21 +238,23 @@ class DBPostProcess(object):
 ## 根据推理结果解码识别结果
 class process_pred(object):
     def __init__(self, character_dict_path=None, character_type='ch', use_space_char=False):
-        self.character_str = ''
-        with open(character_dict_path, 'rb') as fin:
-            lines = fin.readlines()
-            for line in lines:
-                line = line.decode('utf-8').strip('\n').strip('\r\n')
-                self.character_str += line
-        if use_space_char:
-            self.character_str += ' '
-        dict_character = list(self.character_str)
-
-        dict_character = self.add_special_char(dict_character)
-        self.dict = {}
-        for i, char in enumerate(dict_character):
-            self.dict[char] = i
-        self.character = dict_character
+        # 字符表预编译为码点数组并按文件哈希缓存，多个进程共享同一份只读内存映射
+        self.table = load_charset(character_dict_path, use_space_char)
+        self._character = None
+        self._dict = None
+
+    @property
+    def character(self):
+        """字符列表，下标0为 'blank'，仅在需要时构建"""
+        if self._character is None:
+            self._character = table_to_characters(self.table)
+        return self._character
+
+    @property
+    def dict(self):
+        if self._dict is None:
+            self._dict = {char: i for i, char in enumerate(self.character)}
+        return self._dict
 
     def add_special_char(self, dict_character):
         dict_character = ['blank'] + dict_character
@@ -296,12 +282,19 @@ class process_pred(object):
             result_list.append((text, np.mean(conf_list)))
         return result_list
 
-    def __call__(self, preds, label=None):
+    def __call__(self, preds, label=None, char_topk=None, alt_threshold=1.0):
+        """
+        char_topk 为None时只返回 (文本, 置信度)；
+        否则返回 (文本, 置信度, 字符详情)，并对置信度低于 alt_threshold 的字符给出 top-k 候选
+        """
         if not isinstance(preds, np.ndarray):
             preds = np.array(preds)
         preds_idx = preds.argmax(axis=2)
-        preds_prob = preds.max(axis=2)
-        text = self.decode(preds_idx, preds_prob, is_remove_duplicate=True)
+        preds_prob = np.take_along_axis(preds, preds_idx[:, :, None], axis=2)[:, :, 0]
+        if char_topk is None:
+            text = ctc_decode(self.table, preds_idx, preds_prob)
+        else:
+            text = ctc_decode_details(self.table, preds, preds_idx, preds_prob, char_topk, alt_threshold)
         if label is None:
             return text
         label = self.decode(label)
@@ -310,18 +303,44 @@ class process_pred(object):
 
 class det_rec_functions(object):
 
-    def __init__(self, image, det_file, rec_file, ocr_keys_file, use_large=False):
+    def __init__(self, image, det_file, rec_file, ocr_keys_file, use_large=False,
+                 det_session=None, rec_session=None, postprocess_op=None,
+                 char_topk=None, alt_threshold=1.0,
+                 rec_max_width=REC_MAX_WIDTH, rec_chunk_overlap=REC_CHUNK_OVERLAP,
+                 det_params=None, rec_batch_num=REC_BATCH_NUM):
         self.img = image.copy()
+        # 检测前后处理参数，未给出的取 config 中的默认值，见 get_process
+        self.det_params = det_params or {}
+        # 每次送入识别模型的文本行数，大于1时按宽高比排序后补零到同一宽度一起推理
+        self.rec_batch_num = max(int(rec_batch_num), 1)
+        # 识别输入宽度超过 rec_max_width 的文本行分段识别，为0时不分段
+        self.rec_max_width = rec_max_width
+        self.rec_chunk_overlap = rec_chunk_overlap
+        # 不为None时识别结果附带逐字符置信度和 top-k 候选
+        self.char_topk = char_topk
+        self.alt_threshold = alt_threshold
         self.det_file = det_file
         self.small_rec_file = rec_file
-        self.onet_det_session = onnxruntime.InferenceSession(self.det_file)
-        if use_large:
-            print("can not use large model")
-            exit()
+        # 允许传入已创建好的会话和解码器，多张图片共享同一套模型，避免重复加载
+        if det_session is not None:
+            self.onet_det_session = det_session
+        else:
+            self.onet_det_session = onnxruntime.InferenceSession(self.det_file)
+        if use_large and rec_session is None:
+            # 大模型需要在识别模型注册表中登记为 large，识别模型和字符表都取自登记的文件
+            if 'large' not in REC_MODELS:
+                raise ValueError("未配置large识别模型，请在 REC_MODELS 中添加 large")
+            self.small_rec_file = REC_MODELS['large']['rec']
+            ocr_keys_file = REC_MODELS['large']['keys']
+        if rec_session is not None:
+            self.onet_rec_session = rec_session
         else:
             self.onet_rec_session = onnxruntime.InferenceSession(self.small_rec_file)
         self.infer_before_process_op, self.det_re_process_op = self.get_process()
-        self.postprocess_op = process_pred(ocr_keys_file, 'ch', True)
+        if postprocess_op is not None:
+            self.postprocess_op = postprocess_op
+        else:
+            self.postprocess_op = process_pred(ocr_keys_file, 'ch', True)
 
     ## 图片预处理过程
     def transform(self, data, ops=None):
@@ -358,58 +377,27 @@ class det_rec_functions(object):
     def order_points_clockwise(self, pts):
         """
         reference from: https://github.com/jrosebr1/imutils/blob/master/imutils/perspective.py
-        # sort the points based on their x-coordinates
         """
-        xSorted = pts[np.argsort(pts[:, 0]), :]
-
-        # grab the left-most and right-most points from the sorted
-        # x-roodinate points
-        leftMost = xSorted[:2, :]
-        rightMost = xSorted[2:, :]
-
-        # now, sort the left-most coordinates according to their
-        # y-coordinates so we can grab the top-left and bottom-left
-        # points, respectively
-        leftMost = leftMost[np.argsort(leftMost[:, 1]), :]
-        (tl, bl) = leftMost
-
-        rightMost = rightMost[np.argsort(rightMost[:, 1]), :]
-        (tr, br) = rightMost
-
-        rect = np.array([tl, tr, br, bl], dtype="float32")
-        return rect
+        return order_points_clockwise(pts)[0]
 
     def clip_det_res(self, points, img_height, img_width):
-        for pno in range(points.shape[0]):
-            points[pno, 0] = int(min(max(points[pno, 0], 0), img_width - 1))
-            points[pno, 1] = int(min(max(points[pno, 1], 0), img_height - 1))
-        return points
+        return clip_boxes(points, img_height, img_width)[0]
 
     def filter_tag_det_res(self, dt_boxes, image_shape):
-        img_height, img_width = image_shape[0:2]
-        dt_boxes_new = []
-        for box in dt_boxes:
-            box = self.order_points_clockwise(box)
-            box = self.clip_det_res(box, img_height, img_width)
-            rect_width = int(np.linalg.norm(box[0] - box[1]))
-            rect_height = int(np.linalg.norm(box[0] - box[3]))
-            if rect_width <= 3 or rect_height <= 3:
-                continue
-            dt_boxes_new.append(box)
-        dt_boxes = np.array(dt_boxes_new)
-        return dt_boxes
+        return filter_boxes(dt_boxes, image_shape)
 
     ### 定义图片前处理过程，和检测结果后处理过程
     def get_process(self):
-        det_db_thresh = 0.3
-        det_db_box_thresh = 0.5
-        max_candidates = 2000
-        unclip_ratio = 1.6
-        use_dilation = True
+        params = self.det_params
+        det_db_thresh = params.get('det_db_thresh', DET_DB_THRESH)
+        det_db_box_thresh = params.get('det_db_box_thresh', DET_DB_BOX_THRESH)
+        max_candidates = params.get('max_candidates', MAX_CANDIDATES)
+        unclip_ratio = params.get('unclip_ratio', UNCLIP_RATIO)
+        use_dilation = params.get('use_dilation', USE_DILATION)
 
         pre_process_list = [{
             'DetResizeForTest': {
-                'limit_side_len': 2500,
+                'limit_side_len': params.get('limit_side_len', DET_LIMIT_SIDE_LEN),
                 'limit_type': 'max'
             }
         }, {
@@ -433,23 +421,15 @@ class det_rec_functions(object):
 
     def sorted_boxes(self, dt_boxes):
         """
-        Sort text boxes in order from top to bottom, left to right
+        Sort text boxes in reading order: group boxes into lines with a tolerance
+        relative to box height, then left to right within each line
         args:
-            dt_boxes(array):detected text boxes with shape [4, 2]
+            dt_boxes(array):detected text boxes with shape [N, 4, 2]
         return:
-            sorted boxes(array) with shape [4, 2]
+            sorted boxes(list) of arrays with shape [4, 2]
         """
-        num_boxes = dt_boxes.shape[0]
-        sorted_boxes = sorted(dt_boxes, key=lambda x: (x[0][1], x[0][0]))
-        _boxes = list(sorted_boxes)
-
-        for i in range(num_boxes - 1):
-            if abs(_boxes[i + 1][0][1] - _boxes[i][0][1]) < 10 and \
-                    (_boxes[i + 1][0][0] < _boxes[i][0][0]):
-                tmp = _boxes[i]
-                _boxes[i] = _boxes[i + 1]
-                _boxes[i + 1] = tmp
-        return _boxes
+        order, _, _ = reading_order(dt_boxes)
+        return [dt_boxes[i] for i in order]
 
     ### 图像输入预处理
     def resize_norm_img(self, img, max_wh_ratio):
@@ -515,12 +495,25 @@ class det_rec_functions(object):
 
     ### 单张图片推理
     def get_img_res(self, onnx_model, img, process_op):
+        h, w = img.shape[:2]
+        if self.rec_max_width and 48.0 * w / h > self.rec_max_width:
+            # 超宽文本行分段识别后拼接
+            chunks = split_wide_crop(img, self.rec_max_width, self.rec_chunk_overlap)
+            results = [self._rec_one(onnx_model, chunk, process_op)[0] for chunk, _ in chunks]
+            return [stitch_chunks(results, [ratio for _, ratio in chunks],
+                                  max_overlap_chars(self.rec_chunk_overlap))]
+        return self._rec_one(onnx_model, img, process_op)
+
+    def _rec_one(self, onnx_model, img, process_op):
         h, w = img.shape[:2]
         img = self.resize_norm_img(img, w * 1.0 / h)
         img = img[np.newaxis, :]
         inputs = {onnx_model.get_inputs()[0].name: img}
         outs = onnx_model.run(None, inputs)
-        result = process_op(outs[0])
+        if self.char_topk is None:
+            result = process_op(outs[0])
+        else:
+            result = process_op(outs[0], char_topk=self.char_topk, alt_threshold=self.alt_threshold)
         return result
 
     def recognition_img(self, dt_boxes):
@@ -534,21 +527,47 @@ class det_rec_functions(object):
             img_crop = self.get_rotate_crop_image(img, tmp_box)
             img_list.append(img_crop)
         ## 识别小图片
-        results = []
-        results_info = []
-        for pic in img_list:
-            res = self.get_img_res(self.onet_rec_session, pic, self.postprocess_op)
-            results.append(res[0])
-            results_info.append(res)
-
-
+        if self.rec_batch_num > 1:
+            results_info = self.get_batch_res(self.onet_rec_session, img_list, self.postprocess_op)
+        else:
+            results_info = [self.get_img_res(self.onet_rec_session, pic, self.postprocess_op) for pic in img_list]
+        results = [res[0] for res in results_info]
         return results, results_info
 
+    ### 多张图片批量推理
+    def get_batch_res(self, onnx_model, img_list, process_op):
+        """
+        按宽高比排序后每 rec_batch_num 张补零到本批最宽的宽度一起推理，结果按原顺序返回
+        需要分段识别的超宽文本行仍单独处理
+        """
+        results_info = [None] * len(img_list)
+        ratios = [img.shape[1] * 1.0 / img.shape[0] for img in img_list]
+        batchable = []
+        for i, ratio in enumerate(ratios):
+            if self.rec_max_width and 48.0 * ratio > self.rec_max_width:
+                results_info[i] = self.get_img_res(onnx_model, img_list[i], process_op)
+            else:
+                batchable.append(i)
+        batchable.sort(key=lambda i: ratios[i])
+        for start in range(0, len(batchable), self.rec_batch_num):
+            indices = batchable[start:start + self.rec_batch_num]
+            max_wh_ratio = max(ratios[i] for i in indices)
+            batch = np.stack([self.resize_norm_img(img_list[i], max_wh_ratio) for i in indices])
+            outs = onnx_model.run(None, {onnx_model.get_inputs()[0].name: batch})
+            if self.char_topk is None:
+                batch_results = process_op(outs[0])
+            else:
+                batch_results = process_op(outs[0], char_topk=self.char_topk, alt_threshold=self.alt_threshold)
+            for i, result in zip(indices, batch_results):
+                results_info[i] = [result]
+        return results_info
+
 
 def filter_box_rec(dt_boxes, rec_results, drop_score=0.5):
     filter_boxes, filter_rec_res = [], []
     for box, rec_result in zip(dt_boxes, rec_results):
-        text, score = rec_result
+        # rec_result 为 (文本, 置信度)，开启逐字符详情时还带第三项
+        score = rec_result[1]
         if score >= drop_score:
             filter_boxes.append(box)
             filter_rec_res.append(rec_result)
@@ -560,6 +579,8 @@ def filter_box_rec(dt_boxes, rec_results, drop_score=0.5):
 #     def __init__(self, image, boxes, txt, scires):
 
 def draw_ocr_box_txt(image, boxes,  txts=None, scores=None, drop_score=0.5, font_path="simfang.ttf"):
+    import random
+    from PIL import ImageDraw, Image
     h, w = image.height, image.width
     img_left = image.copy()
     img_right = np.ones((h, w, 3), dtype=np.uint8) * 255
@@ -584,6 +605,7 @@ def draw_ocr_box_txt(image, boxes,  txts=None, scores=None, drop_score=0.5, font
     return np.array(img_show)
 
 def draw_box_txt_fine(img_size, box, txt, font_path="simfang.ttf"):
+    from PIL import ImageDraw, Image
     box_height = int(
         math.sqrt((box[0][0] - box[3][0])**2 + (box[0][1] - box[3][1])**2))
     box_width = int(
@@ -620,13 +642,9 @@ def draw_box_txt_fine(img_size, box, txt, font_path="simfang.ttf"):
 
 
 def create_font(txt, sz, font_path="simfang.ttf"):
-    font_size = int(sz[1] * 0.99)
-    font = ImageFont.truetype(font_path, font_size, encoding="utf-8")
-    length = font.getlength(txt)
-    if length > sz[0]:
-        font_size = int(font_size * sz[0] / length)
-        font = ImageFont.truetype(font_path, font_size, encoding="utf-8")
-    return font
+    # 字体按字号缓存，同一字号只加载一次
+    from src.core.visualize import fit_font
+    return fit_font(txt, sz, font_path)
 
 def detect_result(det_file, rec_file, ocr_keys_file, image_path):
     '''
@@ -665,6 +683,7 @@ def detect_result(det_file, rec_file, ocr_keys_file, image_path):
 
 
 if __name__=='__main__':
+    import argparse
     parser = argparse.ArgumentParser(description='Text Recognition')
     parser.add_argument('-d', '--det_path', type=str, default="det.onnx", help='text detection model path')
     parser.add_argument('-r', '--rec_path', type=str, default="rec.onnx", help='text recognition model path')
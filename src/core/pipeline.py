@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+流水线式OCR
+解码、检测（含后处理）、裁剪、识别分成独立的阶段，阶段之间用有界队列连接，
+每个阶段有自己的线程数：第N+1张图片检测的同时，第N张图片的文本行在识别
+各阶段的忙碌比例（occupancy）用于判断瓶颈在哪个阶段
+"""
+
+import queue
+import threading
+import time
+
+from src.core.main import filter_box_rec
+from src.utils.config import (
+    PIPELINE_DECODE_WORKERS, PIPELINE_DET_WORKERS, PIPELINE_CROP_WORKERS,
+    PIPELINE_REC_WORKERS, PIPELINE_QUEUE_SIZE
+)
+
+# 阶段结束标记
+_STOP = object()
+
+
+class _Job(object):
+    """在各阶段之间传递的一张图片"""
+
+    __slots__ = ('key', 'source', 'system', 'boxes', 'crops', 'rec_results', 'error', 'audit')
+
+    def __init__(self, key, source):
+        self.key = key
+        self.source = source
+        self.system = None
+        self.boxes = None
+        self.crops = None
+        self.rec_results = None
+        self.error = None
+        self.audit = False
+
+
+class _Stage(object):
+    """一个阶段：若干线程从输入队列取任务，处理后放入输出队列"""
+
+    def __init__(self, name, func, workers, in_queue, out_queue, downstream_workers):
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.downstream_workers = downstream_workers
+        self.lock = threading.Lock()
+        self.items = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.blocked = 0.0
+        self.running = self.workers
+        self.threads = []
+
+    def start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._loop, name=f"ocr-{self.name}-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _loop(self):
+        while True:
+            job = self.in_queue.get()
+            if job is _STOP:
+                break
+            start_time = time.time()
+            failed = False
+            # 上游已失败的任务直接传下去，错误只计在出错的阶段
+            if job.error is None:
+                try:
+                    self.func(job)
+                except Exception as e:
+                    job.error = e
+                    failed = True
+            busy = time.time() - start_time
+            # 下游队列已满时在这里阻塞，计为反压时间
+            self.out_queue.put(job)
+            blocked = time.time() - start_time - busy
+            with self.lock:
+                self.items += 1
+                self.errors += failed
+                self.busy += busy
+                self.blocked += blocked
+        with self.lock:
+            self.running -= 1
+            last = self.running == 0
+        if last:
+            # 本阶段最后一个线程退出时通知下游的每个线程
+            for _ in range(self.downstream_workers):
+                self.out_queue.put(_STOP)
+
+    def stats(self, elapsed):
+        with self.lock:
+            capacity = max(elapsed * self.workers, 1e-9)
+            return {
+                'workers': self.workers,
+                'items': self.items,
+                'errors': self.errors,
+                'busy_s': round(self.busy, 3),
+                'occupancy': round(self.busy / capacity, 3),
+                'blocked_s': round(self.blocked, 3),
+                'queue': self.in_queue.qsize()
+            }
+
+
+class OCRPipeline(object):
+    """
+    多阶段流水线，共享同一个 OCREngine
+    run() 按完成顺序产出结果，同时处理的图片数受队列长度限制
+    """
+
+    def __init__(self, engine, decode=None,
+                 decode_workers=PIPELINE_DECODE_WORKERS, det_workers=PIPELINE_DET_WORKERS,
+                 crop_workers=PIPELINE_CROP_WORKERS, rec_workers=PIPELINE_REC_WORKERS,
+                 queue_size=PIPELINE_QUEUE_SIZE):
+        """
+        :param decode: 把输入转换成BGR图像的函数（如按路径读取），为None时输入本身就是图像
+        :param queue_size: 相邻阶段之间的队列长度
+        """
+        self.engine = engine
+        self.decode = decode
+        self.workers = {
+            'decode': decode_workers,
+            'det': det_workers,
+            'crop': crop_workers,
+            'rec': rec_workers
+        }
+        self.queue_size = queue_size
+        self.stages = []
+        self.start_time = None
+        self.end_time = None
+
+    def _decode(self, job):
+        job.source = self.decode(job.source) if self.decode is not None else job.source
+
+    def _det(self, job):
+        skip, job.audit = self.engine.check_content(job.source)
+        if skip:
+            # 空白图片不做检测，后续阶段得到空列表
+            job.source = None
+            job.boxes, job.crops, job.rec_results = [], [], []
+            return
+        job.system = self.engine.create_system(job.source)
+        job.source = None
+        job.boxes = job.system.get_boxes()
+
+    def _crop(self, job):
+        if job.system is None:
+            return
+        img = job.system.img
+        job.crops = [job.system.get_rotate_crop_image(img, box.copy()) for box in job.boxes]
+
+    def _rec(self, job):
+        if job.system is None:
+            return
+        system = job.system
+        job.rec_results = [system.get_img_res(system.onet_rec_session, crop, system.postprocess_op)[0]
+                           for crop in job.crops]
+        job.crops = None
+        job.system = None
+
+    def run(self, items):
+        """
+        :param items: 可迭代的 (key, 输入) 序列
+        :return: 生成器，逐个产出 (key, dt_boxes, rec_results, error)，失败时 error 为异常对象；
+                 items 迭代时抛出的异常在已送入的图片全部产出后重新抛出
+        """
+        funcs = [('decode', self._decode), ('det', self._det), ('crop', self._crop), ('rec', self._rec)]
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(funcs) + 1)]
+        self.stages = []
+        for index, (name, func) in enumerate(funcs):
+            downstream = self.workers[funcs[index + 1][0]] if index + 1 < len(funcs) else 1
+            self.stages.append(_Stage(name, func, self.workers[name], queues[index], queues[index + 1],
+                                      max(1, int(downstream))))
+        self.start_time = time.time()
+        self.end_time = None
+        for stage in self.stages:
+            stage.start()
+
+        # 输入序列抛出的异常，在所有已送入的图片产出后由 run() 重新抛出
+        feed_error = []
+
+        def feed():
+            try:
+                for key, source in items:
+                    queues[0].put(_Job(key, source))
+            except Exception as e:
+                feed_error.append(e)
+            finally:
+                # 无论输入是否出错都通知各阶段结束，否则 run() 会一直等待
+                for _ in range(self.stages[0].workers):
+                    queues[0].put(_STOP)
+
+        threading.Thread(target=feed, name='ocr-feed', daemon=True).start()
+
+        output = queues[-1]
+        while True:
+            job = output.get()
+            if job is _STOP:
+                break
+            if job.error is not None:
+                yield job.key, [], [], job.error
+                continue
+            dt_boxes, rec_results = filter_box_rec(job.boxes, job.rec_results, self.engine.drop_score)
+            if job.audit:
+                self.engine.record_audit(len(dt_boxes) > 0)
+            yield job.key, dt_boxes, rec_results, None
+        self.end_time = time.time()
+        if feed_error:
+            raise feed_error[0]
+
+    def stats(self):
+        """
+        各阶段统计
+        occupancy 为忙碌时间 / (线程数 * 总耗时)，接近1的阶段是瓶颈；
+        blocked_s 为等待下游队列的时间，较大说明下游处理不过来
+        """
+        if self.start_time is None:
+            return {}
+        elapsed = (self.end_time or time.time()) - self.start_time
+        stages = {stage.name: stage.stats(elapsed) for stage in self.stages}
+        bottleneck = max(stages, key=lambda name: stages[name]['occupancy']) if stages else None
+        return {'elapsed_s': round(elapsed, 3), 'stages': stages, 'bottleneck': bottleneck}
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+客户端指定的感兴趣区域（ROI）
+只对各区域的裁剪图做检测和识别，检测分辨率由裁剪图大小决定，结果映射回整页坐标
+"""
+
+import cv2
+import numpy as np
+
+from src.utils.config import ROI_MAX_COUNT, ROI_MARGIN
+
+# 检测输入的边长需为32的倍数，过小的裁剪图先补边
+_MIN_DET_SIDE = 32
+
+
+def parse_rois(rois, image_shape):
+    """
+    解析并校验ROI列表
+    :param rois: 每项为矩形 [xmin, ymin, xmax, ymax]，或多边形 [[x, y], [x, y], ...]（至少3个点）
+    :param image_shape: 整页图像的 shape
+    :return: [(矩形 (x0, y0, x1, y1), 多边形 (K, 2) float32 或None), ...]，与输入一一对应，
+             与图像不相交的区域矩形为None
+    :raises ValueError: 格式不正确或数量超过 ROI_MAX_COUNT
+    """
+    if not isinstance(rois, (list, tuple)):
+        raise ValueError("rois 必须是列表")
+    if len(rois) > ROI_MAX_COUNT:
+        raise ValueError(f"rois 数量不能超过 {ROI_MAX_COUNT}")
+    img_h, img_w = image_shape[:2]
+    parsed = []
+    for index, roi in enumerate(rois):
+        try:
+            points = np.asarray(roi, dtype=np.float32)
+        except (TypeError, ValueError):
+            raise ValueError(f"rois[{index}] 格式错误")
+        polygon = None
+        if points.shape == (4,):
+            x0, y0, x1, y1 = points.tolist()
+        elif points.ndim == 2 and points.shape[1] == 2 and points.shape[0] >= 3:
+            polygon = points
+            x0, y0 = points.min(axis=0).tolist()
+            x1, y1 = points.max(axis=0).tolist()
+        else:
+            raise ValueError(f"rois[{index}] 应为 [xmin, ymin, xmax, ymax] 或至少3个点的多边形")
+        if not np.isfinite(points).all() or x1 <= x0 or y1 <= y0:
+            raise ValueError(f"rois[{index}] 坐标无效")
+        rect = (max(0, int(np.floor(x0))), max(0, int(np.floor(y0))),
+                min(img_w, int(np.ceil(x1))), min(img_h, int(np.ceil(y1))))
+        if rect[2] <= rect[0] or rect[3] <= rect[1]:
+            rect = None
+        parsed.append((rect, polygon))
+    return parsed
+
+
+def crop_roi(image, rect, polygon=None, margin=ROI_MARGIN):
+    """
+    裁剪ROI，四周多留 margin 像素，避免贴边的文字检测不完整
+    多边形以外的部分用区域内的中位色填充
+    :return: (裁剪图, 裁剪图左上角在整页中的坐标 (x, y))
+    """
+    img_h, img_w = image.shape[:2]
+    x0, y0 = max(0, rect[0] - margin), max(0, rect[1] - margin)
+    x1, y1 = min(img_w, rect[2] + margin), min(img_h, rect[3] + margin)
+    crop = image[y0:y1, x0:x1]
+    if polygon is not None:
+        mask = np.zeros(crop.shape[:2], dtype=np.uint8)
+        cv2.fillPoly(mask, [np.round(polygon - np.float32([x0, y0])).astype(np.int32)], 1)
+        inside = crop[mask > 0]
+        if len(inside):
+            crop = crop.copy()
+            crop[mask == 0] = np.median(inside, axis=0).astype(crop.dtype)
+    pad_h, pad_w = max(0, _MIN_DET_SIDE - crop.shape[0]), max(0, _MIN_DET_SIDE - crop.shape[1])
+    if pad_h or pad_w:
+        crop = cv2.copyMakeBorder(crop, 0, pad_h, 0, pad_w, cv2.BORDER_REPLICATE)
+    return crop, (x0, y0)
+
+
+def box_in_roi(box, rect, polygon=None):
+    """文本框中心是否在ROI内"""
+    cx, cy = np.asarray(box, dtype=np.float32).reshape(-1, 2).mean(axis=0).tolist()
+    if polygon is not None:
+        return cv2.pointPolygonTest(polygon.reshape(-1, 1, 2), (cx, cy), False) >= 0
+    return rect[0] <= cx < rect[2] and rect[1] <= cy < rect[3]
+
+
+def _rect_iou(a, b):
+    w = min(a[2], b[2]) - max(a[0], b[0])
+    h = min(a[3], b[3]) - max(a[1], b[1])
+    if w <= 0 or h <= 0:
+        return 0.0
+    inter = w * h
+    return inter / float((a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter)
+
+
+def dedupe_boxes(boxes, rec_results, roi_ids, iou_thresh=0.5):
+    """相互重叠的ROI会检测出同一行文字，去掉外接矩形重叠超过 iou_thresh 且文本相同的重复项"""
+    kept, kept_rects = [], []
+    for index, box in enumerate(boxes):
+        points = np.asarray(box, dtype=np.float32).reshape(-1, 2)
+        rect = tuple(points.min(axis=0).tolist() + points.max(axis=0).tolist())
+        duplicate = any(rec_results[other][0] == rec_results[index][0] and _rect_iou(rect, other_rect) > iou_thresh
+                        for other, other_rect in zip(kept, kept_rects))
+        if not duplicate:
+            kept.append(index)
+            kept_rects.append(rect)
+    return [boxes[i] for i in kept], [rec_results[i] for i in kept], [roi_ids[i] for i in kept]
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+识别模型注册表
+按模型名（或语言别名）在首次使用时加载识别会话和字符表，驻留的模型数或估计内存超出上限时
+释放最久未使用的模型；正在使用被释放模型的请求持有其引用，处理完后会话随引用计数释放
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import onnxruntime
+
+from src.core.buckets import BucketedSession
+from src.core.main import process_pred
+from src.utils.config import (
+    DEFAULT_REC_MODEL, REC_MODELS, REC_MODEL_ALIASES, REC_MODEL_MAX_LOADED,
+    REC_MODEL_MAX_MEMORY_MB, REC_WIDTH_BUCKETS
+)
+
+
+def resolve_model_name(name, models=REC_MODELS, aliases=REC_MODEL_ALIASES):
+    """
+    把请求中的模型名或语言代码转换为注册表中的模型名，为空时返回默认模型名
+    :raises ValueError: 模型未注册
+    """
+    if not name:
+        return DEFAULT_REC_MODEL
+    name = str(name)
+    name = aliases.get(name, name)
+    if name not in models:
+        raise ValueError(f"不支持的模型: {name}，可选: {', '.join(sorted(models))}")
+    return name
+
+
+class Recognizer(object):
+    """一个识别模型的会话、解码器和文件信息"""
+
+    __slots__ = ('name', 'rec_session', 'postprocess_op', 'files', 'size', 'load_time', '__weakref__')
+
+    def __init__(self, name, rec_file, ocr_keys_file, shape_buckets=False, rec_widths=REC_WIDTH_BUCKETS):
+        start_time = time.time()
+        self.name = name
+        self.rec_session = onnxruntime.InferenceSession(rec_file)
+        if shape_buckets:
+            self.rec_session = BucketedSession(self.rec_session, [(48, w) for w in rec_widths])
+        self.postprocess_op = process_pred(ocr_keys_file, 'ch', True)
+        self.files = {'rec': {'path': rec_file}, 'keys': {'path': ocr_keys_file}}
+        # 会话占用的内存与权重大小相当，用模型文件大小估计
+        self.size = os.path.getsize(rec_file)
+        self.load_time = time.time() - start_time
+
+
+class RecognizerRegistry(object):
+    """
+    非默认识别模型的懒加载和LRU淘汰，默认模型由引擎的 ModelSet 持有，不经过注册表
+    """
+
+    def __init__(self, models=REC_MODELS, aliases=REC_MODEL_ALIASES, max_loaded=REC_MODEL_MAX_LOADED,
+                 max_memory_mb=REC_MODEL_MAX_MEMORY_MB, shape_buckets=False, rec_widths=REC_WIDTH_BUCKETS):
+        """
+        :param models: {模型名: {'rec': 识别模型路径, 'keys': 字符表路径}}
+        :param max_loaded: 同时驻留的模型数上限
+        :param max_memory_mb: 驻留模型的估计内存上限（MB），为0时不限制
+        """
+        self.models = models
+        self.aliases = aliases
+        self.max_loaded = max(int(max_loaded), 1)
+        self.max_bytes = int(max_memory_mb * 1048576)
+        self.shape_buckets = shape_buckets
+        self.rec_widths = rec_widths
+        # 按最近使用排序，末尾为最近使用
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        # 每个模型一把加载锁，同一模型的并发请求只加载一次，不同模型可以同时加载
+        self._load_locks = {}
+        self.counts = {'hits': 0, 'loads': 0, 'evictions': 0, 'load_failures': 0}
+
+    def resolve(self, name):
+        return resolve_model_name(name, self.models, self.aliases)
+
+    def get(self, name):
+        """
+        取出模型，未加载时加载并按需淘汰
+        :param name: 模型名或语言别名
+        :raises ValueError: 模型未注册
+        """
+        name = self.resolve(name)
+        with self._lock:
+            recognizer = self._touch(name)
+            if recognizer is not None:
+                return recognizer
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+        with load_lock:
+            # 等锁期间其他线程可能已经加载完成
+            with self._lock:
+                recognizer = self._touch(name)
+                if recognizer is not None:
+                    return recognizer
+            entry = self.models[name]
+            try:
+                recognizer = Recognizer(name, entry['rec'], entry['keys'], self.shape_buckets, self.rec_widths)
+            except Exception:
+                with self._lock:
+                    self.counts['load_failures'] += 1
+                raise
+            with self._lock:
+                self._loaded[name] = recognizer
+                self.counts['loads'] += 1
+                self._evict()
+            print(f"📦 加载识别模型 {name}，耗时 {recognizer.load_time * 1000:.0f}ms")
+            return recognizer
+
+    def _touch(self, name):
+        recognizer = self._loaded.get(name)
+        if recognizer is not None:
+            self._loaded.move_to_end(name)
+            self.counts['hits'] += 1
+        return recognizer
+
+    def _evict(self):
+        """超出数量或内存上限时从最久未使用的开始释放，至少保留刚加载的一个"""
+        while len(self._loaded) > 1 and (
+                len(self._loaded) > self.max_loaded or
+                (self.max_bytes and sum(r.size for r in self._loaded.values()) > self.max_bytes)):
+            name, _ = self._loaded.popitem(last=False)
+            self.counts['evictions'] += 1
+            print(f"📤 释放识别模型 {name}")
+
+    def unload(self, name=None):
+        """释放指定模型，name 为None时全部释放"""
+        with self._lock:
+            if name is None:
+                self._loaded.clear()
+            else:
+                self._loaded.pop(self.resolve(name), None)
+
+    def stats(self):
+        """已注册和已加载的模型、估计内存和命中/加载/淘汰次数"""
+        with self._lock:
+            loaded = [{'name': r.name, 'size_mb': round(r.size / 1048576.0, 2),
+                       'load_ms': round(r.load_time * 1000, 2)} for r in reversed(self._loaded.values())]
+            counts = dict(self.counts)
+        return {
+            'default': DEFAULT_REC_MODEL,
+            'available': sorted(self.models),
+            'loaded': loaded,
+            'loaded_mb': round(sum(item['size_mb'] for item in loaded), 2),
+            'max_loaded': self.max_loaded,
+            'max_memory_mb': round(self.max_bytes / 1048576.0, 2),
+            **counts
+        }
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+OCR结果的紧凑表示
+检测框、置信度用数组整体保存，序列化时一次性转换，避免逐框构造字典
+"""
+
+import numpy as np
+
+from src.core.layout import reading_order
+
+
+class OCRResult(object):
+    """
+    一张图片的识别结果
+    boxes: (N, 4, 2) int32 四个角点坐标
+    scores: (N,) float32 置信度
+    texts: 长度为N的文本列表
+    lines / paragraphs: (N,) 每个框所在的行号、段落号，框按阅读顺序排列
+    char_details: 开启逐字符详情时为长度N的列表，否则为None
+    roi_ids: 只识别指定区域时为 (N,) 每个框所属区域的下标，否则为None
+    short_circuited: 空白检查判定没有内容、未做检测时为True
+    """
+
+    __slots__ = ('boxes', 'scores', 'texts', 'lines', 'paragraphs', 'char_details', 'roi_ids', 'short_circuited')
+
+    def __init__(self, boxes=None, texts=None, scores=None, lines=None, paragraphs=None, char_details=None,
+                 roi_ids=None):
+        self.boxes = np.zeros((0, 4, 2), dtype=np.int32) if boxes is None else boxes
+        self.texts = [] if texts is None else texts
+        self.scores = np.zeros((0,), dtype=np.float32) if scores is None else scores
+        self.lines = np.zeros((len(self.texts),), dtype=np.int64) if lines is None else lines
+        self.paragraphs = np.zeros((len(self.texts),), dtype=np.int64) if paragraphs is None else paragraphs
+        self.char_details = char_details
+        self.roi_ids = roi_ids
+        self.short_circuited = False
+
+    @classmethod
+    def from_rec(cls, dt_boxes, rec_results, roi_ids=None):
+        """由检测框列表和 [(文本, 置信度), ...] 构造，并按阅读顺序排列、标注行和段落"""
+        if len(dt_boxes) == 0:
+            return cls(roi_ids=None if roi_ids is None else np.zeros((0,), dtype=np.int64))
+        boxes = np.asarray(dt_boxes).reshape(-1, 4, 2)
+        order, lines, paragraphs = reading_order(boxes)
+        boxes = boxes[order].astype(np.int32)
+        texts = [rec_results[i][0] for i in order]
+        scores = np.array([rec_results[i][1] for i in order], dtype=np.float32)
+        char_details = None
+        if len(rec_results[0]) > 2:
+            char_details = [rec_results[i][2] for i in order]
+        if roi_ids is not None:
+            roi_ids = np.asarray(roi_ids, dtype=np.int64)[order]
+        return cls(boxes, texts, scores, lines, paragraphs, char_details, roi_ids)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def rects(self):
+        """外接矩形 (N, 4)：xmin, ymin, xmax, ymax"""
+        return np.concatenate([self.boxes.min(axis=1), self.boxes.max(axis=1)], axis=1)
+
+    def to_dicts(self):
+        """逐框字典格式，与原 /ocr 接口的 results 一致"""
+        rects = self.rects().tolist()
+        points = self.boxes.tolist()
+        scores = self.scores.tolist()
+        lines = self.lines.tolist()
+        paragraphs = self.paragraphs.tolist()
+        items = [{
+            "text": text,
+            "confidence": score,
+            "bbox": {
+                "xmin": rect[0],
+                "ymin": rect[1],
+                "xmax": rect[2],
+                "ymax": rect[3],
+                "points": box_points  # 四个角点坐标
+            },
+            "line": line,
+            "paragraph": paragraph
+        } for text, score, rect, box_points, line, paragraph
+            in zip(self.texts, scores, rects, points, lines, paragraphs)]
+        if self.char_details is not None:
+            for item, details in zip(items, self.char_details):
+                item["chars"] = details  # 逐字符置信度和候选
+        if self.roi_ids is not None:
+            for item, roi_id in zip(items, self.roi_ids.tolist()):
+                item["roi"] = roi_id  # 所属区域在请求 rois 中的下标
+        return items
+
+    def to_response(self, profile='full'):
+        """
+        按响应格式生成 data 字段
+        full/compact: 逐框字典（compact 只是序列化时不缩进）
+        text: 只返回文本
+        columnar: 按列返回，boxes 为展开的一维数组，每8个数为一个框
+        """
+        if profile == 'text':
+            return {'text_count': len(self), 'short_circuited': self.short_circuited, 'texts': list(self.texts)}
+        if profile == 'columnar':
+            data = {
+                'text_count': len(self),
+                'short_circuited': self.short_circuited,
+                'texts': list(self.texts),
+                'confidences': self.scores.tolist(),
+                'boxes': self.boxes.ravel().tolist(),
+                'box_shape': [len(self), 4, 2],
+                'lines': self.lines.tolist(),
+                'paragraphs': self.paragraphs.tolist()
+            }
+            if self.char_details is not None:
+                data['chars'] = self.char_details
+            if self.roi_ids is not None:
+                data['rois'] = self.roi_ids.tolist()
+            return data
+        return {'text_count': len(self), 'short_circuited': self.short_circuited, 'results': self.to_dicts()}
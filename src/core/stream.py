@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+视频/帧流OCR
+相邻帧几乎相同时复用上一帧的检测框，只在画面明显变化或到达关键帧间隔时重新检测，
+其余帧只跟踪已有文本框，并且只重新识别像素发生变化的文本框
+"""
+
+import sys
+import json
+import argparse
+
+import cv2
+import numpy as np
+
+from src.core.main import filter_box_rec
+from src.core.engine import OCREngine, format_results
+from src.utils.config import (
+    DET_MODEL_PATH, REC_MODEL_PATH, OCR_KEYS_PATH, DROP_SCORE,
+    STREAM_KEYFRAME_INTERVAL, STREAM_DIFF_MAX_SIDE, STREAM_PIXEL_DIFF_THRESH,
+    STREAM_SCENE_CHANGE_RATIO, STREAM_NEW_TEXT_RATIO, STREAM_CROP_CHANGE_RATIO,
+    STREAM_TRACK_MIN_RESPONSE
+)
+
+
+class FrameStreamOCR(object):
+    """
+    有状态的逐帧OCR
+    用法: stream = FrameStreamOCR(engine); for frame in frames: stream.process(frame)
+    """
+
+    def __init__(self, engine,
+                 keyframe_interval=STREAM_KEYFRAME_INTERVAL,
+                 diff_max_side=STREAM_DIFF_MAX_SIDE,
+                 pixel_diff_thresh=STREAM_PIXEL_DIFF_THRESH,
+                 scene_change_ratio=STREAM_SCENE_CHANGE_RATIO,
+                 new_text_ratio=STREAM_NEW_TEXT_RATIO,
+                 crop_change_ratio=STREAM_CROP_CHANGE_RATIO,
+                 track_motion=True,
+                 track_min_response=STREAM_TRACK_MIN_RESPONSE):
+        self.engine = engine
+        self.keyframe_interval = keyframe_interval
+        self.diff_max_side = diff_max_side
+        self.pixel_diff_thresh = pixel_diff_thresh
+        self.scene_change_ratio = scene_change_ratio
+        self.new_text_ratio = new_text_ratio
+        self.crop_change_ratio = crop_change_ratio
+        self.track_motion = track_motion
+        self.track_min_response = track_min_response
+        self.reset()
+
+    def reset(self):
+        """清空状态，下一帧将做完整检测"""
+        self.frame_index = -1
+        self.frames_since_key = 0
+        self.scale = 1.0
+        self.ref_small = None
+        self.boxes = []
+        self.rec_results = []
+        self.regions = []
+        self.box_mask = None
+
+    def _to_small(self, frame):
+        """缩小并转灰度，用于帧间差分"""
+        h, w = frame.shape[:2]
+        self.scale = min(1.0, float(self.diff_max_side) / max(h, w))
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        if self.scale < 1.0:
+            gray = cv2.resize(gray, (max(1, int(w * self.scale)), max(1, int(h * self.scale))),
+                              interpolation=cv2.INTER_AREA)
+        # 轻微模糊，降低亚像素平移和压缩噪声造成的误判
+        return cv2.GaussianBlur(gray, (3, 3), 0)
+
+    def _update_regions(self):
+        """根据文本框计算其在缩略图上的外接矩形和覆盖掩码"""
+        h, w = self.ref_small.shape[:2]
+        self.regions = []
+        self.box_mask = np.zeros((h, w), dtype=np.uint8)
+        for box in self.boxes:
+            small_box = box * self.scale
+            x0 = int(np.clip(np.floor(small_box[:, 0].min()) - 1, 0, w - 1))
+            y0 = int(np.clip(np.floor(small_box[:, 1].min()) - 1, 0, h - 1))
+            x1 = int(np.clip(np.ceil(small_box[:, 0].max()) + 1, x0 + 1, w))
+            y1 = int(np.clip(np.ceil(small_box[:, 1].max()) + 1, y0 + 1, h))
+            self.regions.append((x0, y0, x1, y1))
+            self.box_mask[y0:y1, x0:x1] = 1
+
+    def _keyframe(self, frame, small):
+        """完整检测+识别，并以当前帧作为新的参考帧"""
+        ocr_system = self.engine.create_system(frame)
+        dt_boxes = ocr_system.get_boxes()
+        # 保留全部框（包括低置信度的），文字变清晰后可以被重新识别
+        rec_results, _ = ocr_system.recognition_img(dt_boxes)
+        self.boxes = [np.array(box, dtype=np.float32) for box in dt_boxes]
+        self.rec_results = list(rec_results)
+        self.ref_small = small
+        self.frames_since_key = 0
+        self._update_regions()
+        return self._result(True, len(self.boxes))
+
+    def _track(self, small, frame_shape):
+        """估计全局平移（摄像头/滚动），平移文本框和参考帧"""
+        (dx, dy), response = cv2.phaseCorrelate(np.float32(self.ref_small), np.float32(small))
+        if response < self.track_min_response or (abs(dx) < 0.5 and abs(dy) < 0.5):
+            return
+        h, w = small.shape[:2]
+        M = np.float32([[1, 0, dx], [0, 1, dy]])
+        self.ref_small = cv2.warpAffine(self.ref_small, M, (w, h), borderMode=cv2.BORDER_REPLICATE)
+
+        full_h, full_w = frame_shape[:2]
+        shift = np.float32([dx, dy]) / self.scale
+        boxes, rec_results = [], []
+        for box, rec_result in zip(self.boxes, self.rec_results):
+            box = box + shift
+            box[:, 0] = np.clip(box[:, 0], 0, full_w - 1)
+            box[:, 1] = np.clip(box[:, 1], 0, full_h - 1)
+            # 移出画面的框直接丢弃
+            if np.linalg.norm(box[0] - box[1]) <= 3 or np.linalg.norm(box[0] - box[3]) <= 3:
+                continue
+            boxes.append(box)
+            rec_results.append(rec_result)
+        self.boxes, self.rec_results = boxes, rec_results
+        self._update_regions()
+
+    def _result(self, keyframe, recognized):
+        dt_boxes, rec_results = filter_box_rec(self.boxes, self.rec_results, self.engine.drop_score)
+        return {
+            'frame_index': self.frame_index,
+            'keyframe': keyframe,
+            'recognized': recognized,
+            'boxes': dt_boxes,
+            'rec_results': rec_results
+        }
+
+    def process(self, frame):
+        """
+        处理一帧
+        :param frame: BGR格式的OpenCV图像
+        :return: dict，包含 keyframe（是否做了完整检测）、recognized（本帧识别的框数）、
+                 boxes 和 rec_results（已按置信度过滤）
+        """
+        self.frame_index += 1
+        small = self._to_small(frame)
+        if self.ref_small is None or small.shape != self.ref_small.shape \
+                or self.frames_since_key >= self.keyframe_interval:
+            return self._keyframe(frame, small)
+        self.frames_since_key += 1
+
+        if self.track_motion and self.boxes:
+            self._track(small, frame.shape)
+
+        diff = cv2.absdiff(small, self.ref_small) > self.pixel_diff_thresh
+        # 画面整体变化（切换场景）或文本框以外出现变化（可能有新文字）时重新检测
+        if diff.mean() > self.scene_change_ratio:
+            return self._keyframe(frame, small)
+        if np.logical_and(diff, self.box_mask == 0).mean() > self.new_text_ratio:
+            return self._keyframe(frame, small)
+
+        changed = []
+        for index, (x0, y0, x1, y1) in enumerate(self.regions):
+            if diff[y0:y1, x0:x1].mean() > self.crop_change_ratio:
+                changed.append(index)
+        if changed:
+            ocr_system = self.engine.create_system(frame)
+            rec_results, _ = ocr_system.recognition_img([self.boxes[i] for i in changed])
+            for index, rec_result in zip(changed, rec_results):
+                self.rec_results[index] = rec_result
+                x0, y0, x1, y1 = self.regions[index]
+                self.ref_small[y0:y1, x0:x1] = small[y0:y1, x0:x1]
+        return self._result(False, len(changed))
+
+
+def iter_video_ocr(engine, source, frame_step=1, **kwargs):
+    """
+    逐帧识别视频文件或摄像头
+    :param source: 视频路径或摄像头编号，直接传给 cv2.VideoCapture
+    :param frame_step: 每隔多少帧处理一帧
+    :return: 生成 (时间戳毫秒, 帧结果)
+    """
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise ValueError(f"无法打开视频: {source}")
+    stream = FrameStreamOCR(engine, **kwargs)
+    frame_count = 0
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            frame_count += 1
+            if (frame_count - 1) % frame_step != 0:
+                continue
+            timestamp = capture.get(cv2.CAP_PROP_POS_MSEC)
+            yield timestamp, stream.process(frame)
+    finally:
+        capture.release()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='视频逐帧OCR，结果写入JSONL')
+    parser.add_argument('source', type=str, help='视频文件路径或摄像头编号')
+    parser.add_argument('-O', '--output', type=str, default='-', help='JSONL输出文件，默认标准输出')
+    parser.add_argument('-d', '--det_path', type=str, default=DET_MODEL_PATH, help='text detection model path')
+    parser.add_argument('-r', '--rec_path', type=str, default=REC_MODEL_PATH, help='text recognition model path')
+    parser.add_argument('-o', '--ocr_keys_file', type=str, default=OCR_KEYS_PATH, help='word map file')
+    parser.add_argument('--drop_score', type=float, default=DROP_SCORE, help='置信度过滤阈值')
+    parser.add_argument('--frame_step', type=int, default=1, help='每隔多少帧处理一帧')
+    parser.add_argument('--keyframe_interval', type=int, default=STREAM_KEYFRAME_INTERVAL, help='强制完整检测的帧间隔')
+    args = parser.parse_args(argv)
+
+    source = int(args.source) if args.source.isdigit() else args.source
+    engine = OCREngine(args.det_path, args.rec_path, args.ocr_keys_file, args.drop_score)
+    fout = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    keyframes, frames = 0, 0
+    try:
+        for timestamp, result in iter_video_ocr(engine, source, args.frame_step,
+                                                keyframe_interval=args.keyframe_interval):
+            frames += 1
+            keyframes += int(result['keyframe'])
+            record = {
+                'frame': result['frame_index'],
+                'timestamp_ms': timestamp,
+                'keyframe': result['keyframe'],
+                'recognized': result['recognized'],
+                'results': format_results(result['boxes'], result['rec_results'])
+            }
+            fout.write(json.dumps(record, ensure_ascii=False) + '\n')
+    finally:
+        if fout is not sys.stdout:
+            fout.close()
+    print(f"✅ 完成: 共 {frames} 帧, 完整检测 {keyframes} 帧", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+检测参数、识别批大小的精度/速度扫描
+在带标注的图片集上对参数网格的每个组合跑一遍，记录每张图片的耗时和文本级精度，
+输出全部结果和Pareto前沿（没有其他组合同时更快且更准），用于挑选线上使用的参数
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+from collections import Counter
+
+import cv2
+import numpy as np
+
+from src.core.engine import OCREngine
+from src.utils.config import (
+    DET_MODEL_PATH, REC_MODEL_PATH, OCR_KEYS_PATH, DROP_SCORE,
+    SWEEP_GRID, SWEEP_METRIC, SWEEP_REPEAT, SWEEP_WARMUP
+)
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    if str(value).lower() in ('1', 'true', 'yes', 'on'):
+        return True
+    if str(value).lower() in ('0', 'false', 'no', 'off'):
+        return False
+    raise ValueError(f"不是布尔值: {value}")
+
+
+# 可扫描的参数及其类型；除 rec_batch_num 外都是 det_rec_functions.get_process 的检测参数
+PARAM_TYPES = {
+    'det_db_thresh': float,
+    'det_db_box_thresh': float,
+    'max_candidates': int,
+    'unclip_ratio': float,
+    'use_dilation': parse_bool,
+    'limit_side_len': int,
+    'rec_batch_num': int,
+}
+
+METRICS = ('char_f1', 'text_f1', 'char_recall', 'text_recall')
+
+# 标注中不计入评估的文本（PaddleOCR 标注中表示无法辨认）
+IGNORED_TEXT = '###'
+
+
+def load_labels(path):
+    """
+    读取标注文件，图片路径相对标注文件所在目录
+    每行为 {"image": 路径, "texts": [文本, ...]}，或 PaddleOCR Label.txt 格式：路径\\t[{"transcription": 文本, ...}, ...]
+    :return: [(图片路径, [文本, ...]), ...]
+    """
+    root = os.path.dirname(os.path.abspath(path))
+    samples = []
+    with open(path, 'r', encoding='utf-8') as fin:
+        for line in fin:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                item = json.loads(line)
+                image, texts = item['image'], item['texts']
+            else:
+                image, annotations = line.split('\t', 1)
+                texts = [item['transcription'] for item in json.loads(annotations)]
+            texts = [text for text in texts if text != IGNORED_TEXT]
+            samples.append((os.path.join(root, image), texts))
+    return samples
+
+
+def text_counts(pred_texts, gt_texts):
+    """
+    一张图片的匹配计数
+    文本级：识别出的文本行与标注完全相同才算匹配（按多重集合比较，不看位置）
+    字符级：识别出的字符与标注字符的多重集合交集，对漏字、错字、多字都敏感
+    """
+    pred_texts = [text for text in pred_texts if text]
+    pred_chars = Counter(''.join(pred_texts))
+    gt_chars = Counter(''.join(gt_texts))
+    return Counter({
+        'text_matched': sum((Counter(pred_texts) & Counter(gt_texts)).values()),
+        'text_pred': len(pred_texts),
+        'text_gt': len(gt_texts),
+        'char_matched': sum((pred_chars & gt_chars).values()),
+        'char_pred': sum(pred_chars.values()),
+        'char_gt': sum(gt_chars.values()),
+    })
+
+
+def summarize_counts(counts):
+    """由累计的匹配计数计算文本级、字符级的精确率、召回率和F1"""
+    summary = {}
+    for level in ('text', 'char'):
+        matched = counts[f'{level}_matched']
+        precision = matched / counts[f'{level}_pred'] if counts[f'{level}_pred'] else 0.0
+        recall = matched / counts[f'{level}_gt'] if counts[f'{level}_gt'] else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        summary[f'{level}_precision'] = round(precision, 4)
+        summary[f'{level}_recall'] = round(recall, 4)
+        summary[f'{level}_f1'] = round(f1, 4)
+    return summary
+
+
+def iter_grid(grid):
+    """参数网格 {参数: [取值, ...]} 的所有组合"""
+    names = list(grid)
+    for values in itertools.product(*(grid[name] for name in names)):
+        yield dict(zip(names, values))
+
+
+def apply_params(engine, params):
+    """把一组参数设置到引擎上，之后创建的 det_rec_functions 使用这些参数"""
+    engine.det_params = {name: value for name, value in params.items() if name != 'rec_batch_num'}
+    engine.rec_batch_num = params.get('rec_batch_num', 1)
+
+
+def evaluate(engine, samples, params, repeat=SWEEP_REPEAT, warmup=SWEEP_WARMUP):
+    """
+    用一组参数识别所有图片
+    :param samples: [(图片名, BGR图像, 标注文本), ...]
+    :param repeat: 重复次数，耗时取所有轮次，精度只按第一轮计算（结果与轮次无关）
+    :param warmup: 先不计时地识别前几张图片
+    :return: {'params', 'latency_ms': {mean, p50, p95, max}, 'boxes', 精度指标...}
+    """
+    apply_params(engine, params)
+    for _, image, _ in samples[:warmup]:
+        engine.ocr(image)
+    latencies = []
+    counts = Counter()
+    boxes = 0
+    for round_index in range(max(repeat, 1)):
+        for _, image, gt_texts in samples:
+            start_time = time.perf_counter()
+            _, rec_results = engine.ocr(image)
+            latencies.append(time.perf_counter() - start_time)
+            if round_index == 0:
+                counts += text_counts([rec_result[0] for rec_result in rec_results], gt_texts)
+                boxes += len(rec_results)
+    latencies = np.array(latencies) * 1000
+    record = {
+        'params': params,
+        'latency_ms': {
+            'mean': round(float(latencies.mean()), 2),
+            'p50': round(float(np.percentile(latencies, 50)), 2),
+            'p95': round(float(np.percentile(latencies, 95)), 2),
+            'max': round(float(latencies.max()), 2)
+        },
+        'boxes': boxes
+    }
+    record.update(summarize_counts(counts))
+    return record
+
+
+def pareto_frontier(records, metric=SWEEP_METRIC):
+    """
+    平均耗时越低越好、metric 越高越好，返回不被其他组合同时在两方面超过的组合，按耗时升序
+    """
+    ordered = sorted(records, key=lambda record: (record['latency_ms']['mean'], -record[metric]))
+    frontier = []
+    best = None
+    for record in ordered:
+        if best is None or record[metric] > best:
+            frontier.append(record)
+            best = record[metric]
+    return frontier
+
+
+def format_table(records, metric):
+    names = list(records[0]['params']) if records else []
+    metrics = [metric] + [name for name in ('text_f1', 'char_f1') if name != metric]
+    header = ['mean_ms', 'p95_ms'] + metrics + names
+    lines = ['  '.join(header)]
+    for record in records:
+        row = [f"{record['latency_ms']['mean']:.1f}", f"{record['latency_ms']['p95']:.1f}"]
+        row += [f"{record[name]:.4f}" for name in metrics]
+        row += [str(record['params'][name]) for name in names]
+        lines.append('  '.join(row))
+    return '\n'.join(lines)
+
+
+def build_grid(args):
+    """命令行给出的参数覆盖 SWEEP_GRID 中的同名项"""
+    grid = {}
+    for name, parse in PARAM_TYPES.items():
+        values = getattr(args, name)
+        if values is not None:
+            grid[name] = [parse(value) for value in values.split(',')]
+        elif name in SWEEP_GRID:
+            grid[name] = [parse(value) for value in SWEEP_GRID[name]]
+    return grid
+
+
+def load_samples(label_path, limit=None):
+    """读取标注并解码图片，无法读取的图片跳过"""
+    samples = []
+    for path, texts in load_labels(label_path)[:limit]:
+        image = cv2.imread(path)
+        if image is None:
+            print(f"⚠️ 无法读取图片，跳过: {path}", file=sys.stderr)
+            continue
+        samples.append((path, image, texts))
+    return samples
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='检测参数和识别批大小的精度/速度扫描，输出Pareto前沿')
+    parser.add_argument('labels', type=str,
+                        help='标注文件：每行 {"image": 路径, "texts": [...]}，或 PaddleOCR Label.txt 格式')
+    for name, parse in PARAM_TYPES.items():
+        parser.add_argument(f'--{name}', type=str, default=None,
+                            help=f'逗号分隔的取值，默认 {",".join(str(v) for v in SWEEP_GRID.get(name, []))}')
+    parser.add_argument('--metric', type=str, default=SWEEP_METRIC, choices=METRICS, help='Pareto前沿使用的精度指标')
+    parser.add_argument('--repeat', type=int, default=SWEEP_REPEAT, help='每个组合重复识别的轮数')
+    parser.add_argument('--warmup', type=int, default=SWEEP_WARMUP, help='每个组合先不计时识别的图片数')
+    parser.add_argument('--limit', type=int, default=None, help='只使用前N张图片')
+    parser.add_argument('-d', '--det_path', type=str, default=DET_MODEL_PATH, help='text detection model path')
+    parser.add_argument('-r', '--rec_path', type=str, default=REC_MODEL_PATH, help='text recognition model path')
+    parser.add_argument('-o', '--ocr_keys_file', type=str, default=OCR_KEYS_PATH, help='word map file')
+    parser.add_argument('--drop_score', type=float, default=DROP_SCORE, help='置信度过滤阈值')
+    parser.add_argument('-O', '--output', type=str, default=None, help='把全部结果和前沿写入JSON文件')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    samples = load_samples(args.labels, args.limit)
+    if not samples:
+        print("❌ 没有可用的图片", file=sys.stderr)
+        return 1
+    grid = build_grid(args)
+    combos = list(iter_grid(grid))
+    print(f"🔍 {len(samples)} 张图片，{len(combos)} 组参数", file=sys.stderr)
+    # 所有组合共用一个引擎，模型只加载一次；不做空白检查，保证每组参数都完整识别
+    engine = OCREngine(args.det_path, args.rec_path, args.ocr_keys_file, args.drop_score, content_check=False)
+    records = []
+    for index, params in enumerate(combos):
+        record = evaluate(engine, samples, params, args.repeat, args.warmup)
+        records.append(record)
+        print(f"[{index + 1}/{len(combos)}] {record['latency_ms']['mean']:.1f}ms "
+              f"{args.metric}={record[args.metric]:.4f} {params}", file=sys.stderr)
+    frontier = pareto_frontier(records, args.metric)
+    print(f"Pareto前沿（{args.metric}，平均耗时升序）：")
+    print(format_table(frontier, args.metric))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fout:
+            json.dump({'images': len(samples), 'metric': args.metric, 'grid': grid,
+                       'results': records, 'frontier': frontier}, fout, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+合成带标注的文档图片，用于测量各阶段耗时随文本行数、分辨率的变化
+文字渲染与 draw_box_txt_fine 相同（见 visualize.draw_text_into，只在框的外接矩形内渲染）；
+页面尺寸、文本行数（1 ~ 10000）、字高、旋转角度和噪声都可以指定，标注为每行的文本和四个角点
+--bench 时对每张生成的图片分别计时检测前处理、推理、后处理、阅读顺序和识别，并按行数估计各阶段的增长阶数
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+from src.core.layout import reading_order
+from src.core.visualize import draw_text_into, load_font
+from src.utils.config import (
+    FONT_PATH, OCR_KEYS_PATH, SYNTH_PAGE_SIZES, SYNTH_LINE_COUNTS, SYNTH_TEXT_HEIGHT,
+    SYNTH_CHARS_PER_LINE, SYNTH_ROTATION, SYNTH_NOISE, SYNTH_SUPERLINEAR_EXPONENT
+)
+
+
+def load_chars(path=OCR_KEYS_PATH):
+    """取文件中的全部非空白字符作为字符集，既可以是每行一个字符的字符表，也可以是普通文本"""
+    with open(path, 'r', encoding='utf-8') as fin:
+        return sorted(set(char for char in fin.read() if not char.isspace()))
+
+
+def rotated_box(x, y, w, h, angle):
+    """左上角为 (x, y)、宽高为 (w, h) 的矩形绕中心旋转 angle 度后的四个角点（左上、右上、右下、左下）"""
+    cx, cy = x + w / 2.0, y + h / 2.0
+    corners = np.float32([[-w / 2.0, -h / 2.0], [w / 2.0, -h / 2.0], [w / 2.0, h / 2.0], [-w / 2.0, h / 2.0]])
+    theta = math.radians(angle)
+    rotation = np.float32([[math.cos(theta), -math.sin(theta)], [math.sin(theta), math.cos(theta)]])
+    return corners @ rotation.T + np.float32([cx, cy])
+
+
+def layout_lines(rng, chars, width, height, count, text_height=SYNTH_TEXT_HEIGHT,
+                 chars_per_line=SYNTH_CHARS_PER_LINE, rotation=SYNTH_ROTATION, font_path=FONT_PATH):
+    """
+    从左到右、从上到下排列文本行，每行为随机字符，放不下时提前结束
+    行间距为字高的0.6倍，同一行相邻文本的间隔为一个字高；旋转角度较大时相邻文本可能重叠
+    :return: (boxes (N, 4, 2), texts)，N 可能小于 count
+    """
+    font = load_font(font_path, int(text_height * 0.99))
+    margin = text_height
+    pitch = int(math.ceil(text_height * 1.6))
+    usable = width - 2 * margin
+    boxes, texts = [], []
+    x, y = margin, margin
+    while len(texts) < count and y + text_height <= height - margin:
+        text = ''.join(rng.choice(chars) for _ in range(rng.randint(*chars_per_line)))
+        text_width = int(math.ceil(font.getlength(text)))
+        if text_width > usable:
+            # 单个文本比整行还宽时按比例截短
+            text = text[:max(int(len(text) * usable / text_width), 1)]
+            text_width = int(math.ceil(font.getlength(text)))
+        if x + text_width > width - margin:
+            x, y = margin, y + pitch
+            continue
+        boxes.append(rotated_box(x, y, text_width, text_height, rng.uniform(-rotation, rotation)))
+        texts.append(text)
+        x += text_width + text_height
+    return np.array(boxes, dtype=np.float32).reshape(-1, 4, 2), texts
+
+
+def render_page(boxes, texts, width, height, noise=SYNTH_NOISE, font_path=FONT_PATH, seed=0):
+    """白底黑字渲染，noise 为高斯噪声的标准差（灰度级）"""
+    page = np.full((height, width, 3), 255, dtype=np.uint8)
+    for box, text in zip(boxes, texts):
+        draw_text_into(page, box, text, None, font_path)
+    if noise > 0:
+        noisy = page.astype(np.float32) + np.random.RandomState(seed).normal(0, noise, page.shape)
+        page = np.clip(noisy, 0, 255).astype(np.uint8)
+    return page
+
+
+def generate(output_dir, sizes=SYNTH_PAGE_SIZES, line_counts=SYNTH_LINE_COUNTS, per_combo=1,
+             text_height=SYNTH_TEXT_HEIGHT, chars_per_line=SYNTH_CHARS_PER_LINE, rotation=SYNTH_ROTATION,
+             noise=SYNTH_NOISE, chars=None, font_path=FONT_PATH, seed=0, ext='.png'):
+    """
+    生成 sizes × line_counts 的每个组合各 per_combo 张图片，逐张返回标注记录
+    标注同时写入 output_dir/labels.jsonl，格式可直接用于 src.core.sweep
+    """
+    if not os.path.exists(font_path):
+        raise FileNotFoundError(f"字体文件不存在: {font_path}")
+    chars = chars or load_chars()
+    os.makedirs(output_dir, exist_ok=True)
+    rng = random.Random(seed)
+    index = 0
+    with open(os.path.join(output_dir, 'labels.jsonl'), 'w', encoding='utf-8') as fout:
+        for width, height in sizes:
+            for count in line_counts:
+                for _ in range(per_combo):
+                    boxes, texts = layout_lines(rng, chars, width, height, count, text_height,
+                                                chars_per_line, rotation, font_path)
+                    page = render_page(boxes, texts, width, height, noise, font_path, seed + index)
+                    name = f"synth_{index:05d}{ext}"
+                    cv2.imwrite(os.path.join(output_dir, name), page)
+                    record = {'image': name, 'width': width, 'height': height, 'requested': count,
+                              'lines': len(texts), 'texts': texts,
+                              'boxes': np.round(boxes.astype(np.float64), 1).tolist()}
+                    fout.write(json.dumps(record, ensure_ascii=False) + '\n')
+                    index += 1
+                    yield record, page
+
+
+def bench_page(engine, image, boxes, rec=True):
+    """
+    分阶段计时（毫秒）
+    det_pre / det_infer / det_post：检测前处理、推理、后处理（模型输出）
+    gt_post：用标注框生成的概率图做一次后处理，框数与标注一致，不受模型好坏影响
+    order：标注框的阅读顺序；rec：裁剪并识别全部标注框
+    """
+    timings = {}
+    system = engine.create_system(image)
+    start_time = time.perf_counter()
+    img_part, shape = system.transform({'image': image.copy()}, system.infer_before_process_op)
+    img_part, shape = img_part[np.newaxis], np.expand_dims(shape, axis=0)
+    timings['det_pre'] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    outs = system.onet_det_session.run(None, {system.onet_det_session.get_inputs()[0].name: img_part})
+    timings['det_infer'] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    system.det_re_process_op(outs[0], shape)
+    timings['det_post'] = time.perf_counter() - start_time
+
+    # 概率图与检测输入同尺寸，标注框按缩放比例画成1
+    prob = np.zeros((1, 1) + img_part.shape[2:], dtype=np.float32)
+    ratio = np.float32([shape[0][3], shape[0][2]])
+    cv2.fillPoly(prob[0, 0], list(np.round(boxes * ratio).astype(np.int32)), 1.0)
+    start_time = time.perf_counter()
+    system.det_re_process_op(prob, shape)
+    timings['gt_post'] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    reading_order(boxes)
+    timings['order'] = time.perf_counter() - start_time
+
+    if rec:
+        start_time = time.perf_counter()
+        system.recognition_img(list(boxes))
+        timings['rec'] = time.perf_counter() - start_time
+    return {stage: round(seconds * 1000, 3) for stage, seconds in timings.items()}
+
+
+def scaling_exponents(rows):
+    """
+    同一页面尺寸下，按 log(耗时) 对 log(行数) 做最小二乘拟合，斜率即增长阶数（1为线性）
+    :return: {(宽, 高): {阶段: 斜率}}，少于两种行数时不计算
+    """
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[(row['width'], row['height'])].append(row)
+    result = {}
+    for size, items in grouped.items():
+        lines = np.array([item['lines'] for item in items], dtype=np.float64)
+        if len(set(lines.tolist())) < 2 or lines.min() <= 0:
+            continue
+        result[size] = {}
+        for stage in items[0]['timings']:
+            seconds = np.array([item['timings'][stage] for item in items], dtype=np.float64)
+            if seconds.min() <= 0:
+                continue
+            result[size][stage] = round(float(np.polyfit(np.log(lines), np.log(seconds), 1)[0]), 2)
+    return result
+
+
+def format_summary(rows, threshold=SYNTH_SUPERLINEAR_EXPONENT):
+    """按 (页面尺寸, 行数) 汇总各阶段平均耗时，并列出增长阶数，超过 threshold 的阶段标出"""
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[(row['width'], row['height'], row['lines'])].append(row['timings'])
+    stages = list(rows[0]['timings']) if rows else []
+    lines = ['  '.join(['size', 'lines'] + [f'{stage}_ms' for stage in stages])]
+    for (width, height, count), items in sorted(grouped.items()):
+        means = [sum(item[stage] for item in items) / len(items) for stage in stages]
+        lines.append('  '.join([f'{width}x{height}', str(count)] + [f'{value:.2f}' for value in means]))
+    for (width, height), exponents in sorted(scaling_exponents(rows).items()):
+        marks = [f"{stage}={value}{' ⚠️' if value > threshold else ''}" for stage, value in exponents.items()]
+        lines.append(f"增长阶数 {width}x{height}: " + '  '.join(marks))
+    return '\n'.join(lines)
+
+
+def parse_size(value):
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='合成带标注的文档图片，可选分阶段测量耗时随行数、分辨率的变化')
+    parser.add_argument('-O', '--output_dir', type=str, required=True, help='图片和 labels.jsonl 的输出目录')
+    parser.add_argument('--sizes', type=str, default=','.join(f'{w}x{h}' for w, h in SYNTH_PAGE_SIZES),
+                        help='逗号分隔的页面尺寸，宽x高')
+    parser.add_argument('--lines', type=str, default=','.join(str(n) for n in SYNTH_LINE_COUNTS),
+                        help='逗号分隔的文本行数，页面放不下时按实际放下的行数标注')
+    parser.add_argument('-n', '--per_combo', type=int, default=1, help='每种尺寸、行数组合生成的图片数')
+    parser.add_argument('--text_height', type=int, default=SYNTH_TEXT_HEIGHT, help='字高（像素）')
+    parser.add_argument('--chars_per_line', type=str, default='%d,%d' % SYNTH_CHARS_PER_LINE,
+                        help='每行字符数的范围，最小,最大')
+    parser.add_argument('--rotation', type=float, default=SYNTH_ROTATION, help='每行随机旋转的最大角度（度）')
+    parser.add_argument('--noise', type=float, default=SYNTH_NOISE, help='高斯噪声标准差，0表示不加噪声')
+    parser.add_argument('--charset', type=str, default=OCR_KEYS_PATH, help='从该文件的字符中随机取字')
+    parser.add_argument('--font', type=str, default=FONT_PATH, help='TrueType字体，需要包含字符集中的字')
+    parser.add_argument('--format', type=str, default='.png', choices=['.png', '.jpg'], help='图片格式')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子，相同参数和种子生成相同的图片')
+    parser.add_argument('--bench', action='store_true', help='对生成的每张图片分阶段计时，结果写入 bench.jsonl')
+    parser.add_argument('--no_rec', action='store_true', help='计时时跳过识别阶段')
+    args = parser.parse_args(argv)
+    args.sizes = [parse_size(value) for value in args.sizes.split(',')]
+    args.lines = [int(value) for value in args.lines.split(',')]
+    args.chars_per_line = tuple(int(value) for value in args.chars_per_line.split(','))
+    return args
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    if not os.path.exists(args.font):
+        print(f"❌ 字体文件不存在: {args.font}，用 --font 指定", file=sys.stderr)
+        return 1
+    engine = None
+    if args.bench:
+        from src.core.engine import OCREngine
+        engine = OCREngine(content_check=False)
+        engine.warmup()
+    records = generate(args.output_dir, args.sizes, args.lines, args.per_combo, args.text_height,
+                       args.chars_per_line, args.rotation, args.noise, load_chars(args.charset),
+                       args.font, args.seed, args.format)
+    rows = []
+    os.makedirs(args.output_dir, exist_ok=True)
+    bench_file = open(os.path.join(args.output_dir, 'bench.jsonl'), 'w', encoding='utf-8') if args.bench else None
+    try:
+        for record, page in records:
+            message = f"🖼️ {record['image']} {record['width']}x{record['height']} {record['lines']} 行"
+            if record['lines'] < record['requested']:
+                message += f"（要求 {record['requested']} 行，页面放不下）"
+            if engine is not None:
+                boxes = np.array(record['boxes'], dtype=np.float32).reshape(-1, 4, 2)
+                row = {key: record[key] for key in ('image', 'width', 'height', 'lines')}
+                row['timings'] = bench_page(engine, page, boxes, rec=not args.no_rec)
+                bench_file.write(json.dumps(row, ensure_ascii=False) + '\n')
+                rows.append(row)
+            print(message, file=sys.stderr)
+    finally:
+        if bench_file is not None:
+            bench_file.close()
+    if rows:
+        print(format_summary(rows))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+识别结果可视化
+左半边为原图叠加半透明的检测框，右半边为白底上按框的位置和角度写出的识别文本，与 draw_ocr_box_txt 的输出一致
+每个框的文字只渲染、透视变换到该框的外接矩形内，再合并到同一张画布上，耗时与框的面积成正比，与整图大小无关；
+字体按 (路径, 字号) 缓存，只在首次用到某个字号时加载
+"""
+
+import functools
+import math
+import random
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from src.utils.config import FONT_PATH, DROP_SCORE
+
+
+@functools.lru_cache(maxsize=256)
+def load_font(font_path, size):
+    """按字号缓存的TrueType字体"""
+    return ImageFont.truetype(font_path, max(int(size), 1), encoding="utf-8")
+
+
+def fit_font(txt, sz, font_path=FONT_PATH):
+    """
+    选取能把 txt 写进 sz=(宽, 高) 的字体：字号取高度的0.99，文字超宽时按比例缩小
+    与 create_font 的规则相同
+    """
+    font_size = int(sz[1] * 0.99)
+    font = load_font(font_path, font_size)
+    length = font.getlength(txt)
+    if length > sz[0]:
+        font = load_font(font_path, int(font_size * sz[0] / length))
+    return font
+
+
+def render_text_tile(box, txt, font_path=FONT_PATH):
+    """
+    把文本写到与框同尺寸的白底图上，竖排的框（高大于宽的2倍）先横向书写再旋转
+    :return: RGB数组，形状为 (框高, 框宽, 3)
+    """
+    box_height = int(math.sqrt((box[0][0] - box[3][0]) ** 2 + (box[0][1] - box[3][1]) ** 2))
+    box_width = int(math.sqrt((box[0][0] - box[1][0]) ** 2 + (box[0][1] - box[1][1]) ** 2))
+    vertical = box_height > 2 * box_width and box_height > 30
+    size = (box_height, box_width) if vertical else (box_width, box_height)
+    img_text = Image.new('RGB', size, (255, 255, 255))
+    if txt:
+        ImageDraw.Draw(img_text).text([0, 0], txt, fill=(0, 0, 0), font=fit_font(txt, size, font_path))
+    if vertical:
+        img_text = img_text.transpose(Image.ROTATE_270)
+    return np.array(img_text, dtype=np.uint8)
+
+
+def draw_text_into(canvas, box, txt, color, font_path=FONT_PATH):
+    """
+    把一个框的文本和边框按位与到画布上，只处理框的外接矩形；color 为None时不画边框
+    与 draw_box_txt_fine 渲染整图大小的图层再合并的结果一致（最近邻取样的舍入偶尔相差一个像素）
+    """
+    img_h, img_w = canvas.shape[:2]
+    box = np.asarray(box, dtype=np.float32)
+    x0, y0 = np.maximum(np.floor(box.min(axis=0)).astype(int), 0)
+    x1, y1 = np.ceil(box.max(axis=0)).astype(int) + 1
+    x1, y1 = min(x1, img_w), min(y1, img_h)
+    if x1 <= x0 or y1 <= y0:
+        return
+    origin = np.float32([x0, y0])
+    tile = render_text_tile(box, txt, font_path)
+    tile_h, tile_w = tile.shape[:2]
+    if tile_h and tile_w:
+        src = np.float32([[0, 0], [tile_w, 0], [tile_w, tile_h], [0, tile_h]])
+        M = cv2.getPerspectiveTransform(src, box - origin)
+        warped = cv2.warpPerspective(tile, M, (int(x1 - x0), int(y1 - y0)), flags=cv2.INTER_NEAREST,
+                                     borderMode=cv2.BORDER_CONSTANT, borderValue=(255, 255, 255))
+    else:
+        # 退化为线段的框只画边框
+        warped = np.full((y1 - y0, x1 - x0, 3), 255, dtype=np.uint8)
+    if color is not None:
+        pts = (np.array(box, np.int32) - origin.astype(np.int32)).reshape((-1, 1, 2))
+        cv2.polylines(warped, [pts], True, color, 1)
+    roi = canvas[y0:y1, x0:x1]
+    np.bitwise_and(roi, warped, out=roi)
+
+
+def draw_ocr(image, boxes, txts=None, scores=None, drop_score=DROP_SCORE, font_path=FONT_PATH):
+    """
+    绘制左右并排的可视化图
+    :param image: (H, W, 3) uint8数组，通道顺序不限，输出与输入一致
+    :return: (H, 2W, 3) uint8数组
+    """
+    h, w = image.shape[:2]
+    overlay = Image.fromarray(image)
+    draw_overlay = ImageDraw.Draw(overlay)
+    canvas = np.full((h, w, 3), 255, dtype=np.uint8)
+    # 与 draw_ocr_box_txt 的 random.seed(0) 取色顺序相同，但不影响全局随机数状态
+    rng = random.Random(0)
+    if txts is None or len(txts) != len(boxes):
+        txts = [None] * len(boxes)
+    for idx, (box, txt) in enumerate(zip(boxes, txts)):
+        if scores is not None and scores[idx] < drop_score:
+            continue
+        color = (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255))
+        draw_overlay.polygon([tuple(point) for point in np.asarray(box).tolist()], fill=color)
+        draw_text_into(canvas, box, txt, color, font_path)
+    show = np.empty((h, w * 2, 3), dtype=np.uint8)
+    cv2.addWeighted(image, 0.5, np.asarray(overlay), 0.5, 0, dst=show[:, :w])
+    show[:, w:] = canvas
+    return show
+
+
+def encode_visualization(image, result, ext='.jpg', quality=90, font_path=FONT_PATH):
+    """
+    按识别结果（OCRResult）绘制可视化图并编码
+    :param image: BGR图像
+    :return: 编码后的字节
+    """
+    show = draw_ocr(image, result.boxes, result.texts, font_path=font_path, drop_score=0)
+    params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)] if ext.lower() in ('.jpg', '.jpeg') else []
+    ok, buffer = cv2.imencode(ext, show, params)
+    if not ok:
+        raise ValueError(f"可视化图片编码失败: {ext}")
+    return buffer.tobytes()
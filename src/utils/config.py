@@ -9,6 +9,7 @@ OCR API服务配置文件
 import os
 import platform
 import sys
+import tempfile
 
 # 导入编码处理模块
 try:
@@ -63,6 +64,11 @@ except ImportError:
 SERVER_HOST = "localhost"
 SERVER_PORT = 8080
 SERVER_DEBUG = False
+# HTTP/1.1 长连接空闲多少秒后由服务器关闭
+KEEPALIVE_TIMEOUT = 30
+# 客户端支持gzip（Accept-Encoding）且响应体不小于 GZIP_MIN_SIZE 字节时压缩，为0时不压缩
+GZIP_MIN_SIZE = 1024
+GZIP_LEVEL = 5
 
 # API基础URL
 API_BASE_URL = f"http://{SERVER_HOST}:{SERVER_PORT}"
@@ -72,7 +78,25 @@ API_BASE_URL = f"http://{SERVER_HOST}:{SERVER_PORT}"
 DET_MODEL_PATH = "models/det.onnx"
 REC_MODEL_PATH = "models/rec.onnx"
 OCR_KEYS_PATH = "models/ppocr_keys_v1.txt"
+# 识别模型注册表：模型名 -> 识别模型和字符表，请求中用 model 字段选择，首次使用时才加载
+# 默认模型即上面的 REC_MODEL_PATH，随服务启动加载，不会被淘汰，热更新也只作用于默认模型
+DEFAULT_REC_MODEL = "ch"
+REC_MODELS = {
+    DEFAULT_REC_MODEL: {"rec": REC_MODEL_PATH, "keys": OCR_KEYS_PATH},
+    # "japan": {"rec": "models/japan_rec.onnx", "keys": "models/japan_dict.txt"},
+    # "korean": {"rec": "models/korean_rec.onnx", "keys": "models/korean_dict.txt"},
+    # "latin": {"rec": "models/latin_rec.onnx", "keys": "models/latin_dict.txt"},
+    # "large": {"rec": "models/rec_large.onnx", "keys": OCR_KEYS_PATH},
+}
+# 语言代码到模型名的别名，目标模型未注册时视为不支持
+REC_MODEL_ALIASES = {"zh": "ch", "en": "ch", "ja": "japan", "ko": "korean", "fr": "latin", "de": "latin"}
+# 同时驻留的非默认识别模型数上限，以及按模型文件大小估计的内存上限（MB，为0时不限制），
+# 超出时释放最久未使用的模型
+REC_MODEL_MAX_LOADED = 2
+REC_MODEL_MAX_MEMORY_MB = 0
 FONT_PATH = "assets/fonts/simfang.ttf"
+# 预编译字符表的缓存目录，为空时不写缓存
+CHARSET_CACHE_DIR = os.path.join(tempfile.gettempdir(), "text_recognition_cache")
 
 # ==================== 测试配置 ====================
 # 测试图片目录
@@ -91,9 +115,197 @@ DET_DB_BOX_THRESH = 0.5
 MAX_CANDIDATES = 2000
 UNCLIP_RATIO = 1.6
 USE_DILATION = True
+# 检测输入最长边上限，超出时等比缩小
+DET_LIMIT_SIDE_LEN = 2500
 
 # OCR识别参数
 DROP_SCORE = 0.5
+# 每次送入识别模型的文本行数，大于1时补零到同一宽度批量推理
+REC_BATCH_NUM = 1
+
+# 识别输入（高48）宽度超过 REC_MAX_WIDTH 的文本行切成重叠的若干段分别识别，为0时不切分
+REC_MAX_WIDTH = 1280
+# 相邻两段的重叠宽度（同样按高48计），应能容纳至少两个字符
+REC_CHUNK_OVERLAP = 128
+
+# 逐字符详情：默认候选数，以及需要给出候选的字符置信度上限
+CHAR_TOPK = 3
+CHAR_ALT_THRESHOLD = 0.9
+
+# 指定识别区域（rois）时的数量上限，以及裁剪时四周多留的像素数
+ROI_MAX_COUNT = 64
+ROI_MARGIN = 8
+
+# 多帧图片（多页TIFF、GIF）最多识别的页数，超出部分忽略并标记 truncated；0表示不限制
+MULTIPAGE_MAX_PAGES = 100
+
+# 可视化（/ocr?visualize=1）返回图片的编码格式和JPEG质量
+VISUALIZE_FORMAT = ".jpg"
+VISUALIZE_QUALITY = 85
+
+# 阅读顺序参数
+# 相邻框中心y之差超过 LINE_TOLERANCE * 框高 时视为不同行
+LINE_TOLERANCE = 0.5
+# 相邻行间距超过 PARAGRAPH_GAP * 行高 时视为不同段落
+PARAGRAPH_GAP = 1.0
+
+# ==================== 预热配置 ====================
+# 启动时是否预热模型，预热完成前 /ready 返回503
+WARMUP_ENABLED = True
+# 检测模型预热的输入尺寸 (高, 宽)，需为32的倍数
+WARMUP_DET_SIZES = [(960, 960), (1088, 1920)]
+# 识别模型预热的输入宽度（高度固定为48）
+WARMUP_REC_WIDTHS = [160, 320, 640, 1280]
+
+# 进程启动到首次响应 /health 的目标耗时（毫秒），--profile-startup 时对照检查
+STARTUP_HEALTH_TARGET_MS = 500
+
+# ==================== 空白图片检查配置 ====================
+# 检测前先检查图片是否几乎没有内容，是则直接返回空结果
+CONTENT_CHECK_ENABLED = True
+# 检查时把图片缩小到的最长边
+CONTENT_CHECK_MAX_SIDE = 1024
+# 相邻像素灰度差超过该值视为边缘
+CONTENT_EDGE_THRESH = 24
+# 边缘像素数少于该值视为没有文字
+CONTENT_MIN_EDGE_PIXELS = 16
+# 被判为空白的图片中按该比例抽查完整识别，统计误判（0表示不抽查）
+CONTENT_AUDIT_RATE = 0.0
+
+# ==================== 模型热更新配置 ====================
+# --watch-models 时检查模型文件修改时间的间隔（秒）；文件在连续两次检查之间不再变化后才重新加载
+MODEL_WATCH_INTERVAL = 5
+# POST /admin/reload 只接受该目录（含子目录）下的模型文件，符号链接按实际指向的位置判断
+MODEL_RELOAD_DIR = "models"
+# 非空时 POST /admin/reload 需要带请求头 X-Admin-Token: <该值>，服务监听在非本机地址时应设置
+MODEL_RELOAD_TOKEN = os.environ.get("OCR_ADMIN_TOKEN", "")
+
+# ==================== 尺寸分桶配置 ====================
+# 是否把检测/识别输入补零到固定尺寸，并通过 IOBinding 复用输入输出缓冲区
+SHAPE_BUCKETS_ENABLED = False
+# 检测输入尺寸桶 (高, 宽)，需为32的倍数；超出所有桶的输入按原尺寸推理
+# 默认取下列边长的两两组合，缓冲区在首次用到某个桶时才分配
+DET_BUCKET_SIDES = [320, 480, 640, 800, 960, 1088, 1280, 1600, 1920, 2496]
+DET_SHAPE_BUCKETS = [(h, w) for h in DET_BUCKET_SIDES for w in DET_BUCKET_SIDES]
+# 识别输入宽度桶（高度固定为48）
+REC_WIDTH_BUCKETS = [80, 160, 320, 480, 640, 960, 1280, 1920, 2560]
+# 每个尺寸最多分配几份缓冲区（即该尺寸同时进行的推理数），已全部被占用时其余线程等待空闲的一份
+# 为1时每个尺寸在进程内只分配一次，同尺寸的推理依次进行
+SHAPE_BUCKET_POOL_SIZE = 1
+
+# ==================== 批量处理配置 ====================
+# 批量识别时收集的图片扩展名
+BATCH_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+# 解码线程数和预取队列长度
+BATCH_DECODE_THREADS = 4
+BATCH_PREFETCH = 16
+
+# ==================== 流水线配置 ====================
+# 解码、检测、裁剪、识别各阶段的线程数
+PIPELINE_DECODE_WORKERS = 2
+PIPELINE_DET_WORKERS = 1
+PIPELINE_CROP_WORKERS = 1
+PIPELINE_REC_WORKERS = 2
+# 相邻阶段之间的队列长度
+PIPELINE_QUEUE_SIZE = 8
+
+# ==================== 视频流配置 ====================
+# 每隔多少帧强制做一次完整检测
+STREAM_KEYFRAME_INTERVAL = 30
+# 帧间差分时把图片缩小到的最长边
+STREAM_DIFF_MAX_SIDE = 320
+# 灰度差超过该值的像素视为变化
+STREAM_PIXEL_DIFF_THRESH = 25
+# 整帧变化像素比例超过该值时重新检测
+STREAM_SCENE_CHANGE_RATIO = 0.3
+# 文本框以外区域变化比例超过该值时重新检测（可能出现了新文字）
+STREAM_NEW_TEXT_RATIO = 0.002
+# 文本框内变化比例超过该值时重新识别该框
+STREAM_CROP_CHANGE_RATIO = 0.02
+# 全局平移跟踪的最低相关响应
+STREAM_TRACK_MIN_RESPONSE = 0.2
+
+# ==================== 增量识别配置 ====================
+# 会话空闲多少秒后过期
+INCREMENTAL_SESSION_TTL = 300
+# 同时保留的会话数上限，超出后淘汰最久未使用的
+INCREMENTAL_MAX_SESSIONS = 64
+# 灰度差超过该值的像素视为变化
+INCREMENTAL_PIXEL_DIFF_THRESH = 20
+# 变化区域向外扩展的像素数，保证完整包含文字
+INCREMENTAL_REGION_MARGIN = 16
+# 变化面积占比超过该值时直接整图识别
+INCREMENTAL_FULL_RATIO = 0.5
+
+# ==================== 异步任务配置 ====================
+# 是否启用异步任务接口 /jobs（创建任务数据库并启动后台识别线程），也可用 --jobs 开启
+JOBS_ENABLED = False
+# 任务数据库所在目录，任务和待处理的图片保存在其中，服务重启后继续处理
+JOBS_DATA_DIR = "data"
+JOBS_DB_PATH = os.path.join(JOBS_DATA_DIR, "jobs.sqlite3")
+# 后台识别线程数
+JOBS_WORKERS = 1
+# 单个任务的图片数上限
+JOBS_MAX_IMAGES = 200
+# 任务完成后结果保留的秒数，过期后删除
+JOBS_RETENTION_SECONDS = 24 * 3600
+# 空闲时检查新任务的间隔，以及清理过期任务的间隔（秒）
+JOBS_POLL_INTERVAL = 1.0
+JOBS_PURGE_INTERVAL = 60
+# 每页最多处理的次数；处理中服务退出（如解码崩溃、内存不足）的页在重启后重新排队，达到该次数后标记为失败
+JOBS_MAX_ATTEMPTS = 3
+
+# ==================== 内存统计配置 ====================
+# 是否统计每个请求的内存变化（tracemalloc + RSS），开启后Python分配会变慢，也可用 --memory-tracking 开启
+MEMORY_TRACKING = False
+# tracemalloc 为每次分配保存的调用栈深度
+MEMORY_TRACE_FRAMES = 10
+# 报告中列出的分配位置数
+MEMORY_TOP_SITES = 10
+# 保存的快照数上限，超出时删除最早的
+MEMORY_MAX_SNAPSHOTS = 8
+# 保留最近多少个请求的逐请求记录
+MEMORY_RECENT_REQUESTS = 50
+
+# ==================== 参数扫描配置 ====================
+# python -m src.core.sweep 默认扫描的参数网格，命令行参数覆盖同名项
+SWEEP_GRID = {
+    "det_db_thresh": [DET_DB_THRESH],
+    "det_db_box_thresh": [0.5, 0.6],
+    "max_candidates": [MAX_CANDIDATES],
+    "unclip_ratio": [1.6, 2.0],
+    "use_dilation": [USE_DILATION],
+    "limit_side_len": [960, 1600, DET_LIMIT_SIDE_LEN],
+    "rec_batch_num": [1, 6],
+}
+# 选取Pareto前沿使用的精度指标：char_f1 / text_f1 / char_recall / text_recall
+SWEEP_METRIC = "char_f1"
+# 每组参数重复识别的轮数，以及先不计时识别的图片数
+SWEEP_REPEAT = 1
+SWEEP_WARMUP = 1
+
+# ==================== 合成文档配置 ====================
+# python -m src.core.synth 默认生成的页面尺寸 (宽, 高) 和文本行数
+SYNTH_PAGE_SIZES = [(1240, 1754), (2480, 3508)]
+SYNTH_LINE_COUNTS = [1, 10, 100, 1000]
+# 字高（像素）、每行字符数范围、每行随机旋转的最大角度（度）、高斯噪声标准差
+SYNTH_TEXT_HEIGHT = 24
+SYNTH_CHARS_PER_LINE = (2, 12)
+SYNTH_ROTATION = 0.0
+SYNTH_NOISE = 0.0
+# --bench 时增长阶数（耗时对行数的log-log斜率）超过该值的阶段标为超线性
+SYNTH_SUPERLINEAR_EXPONENT = 1.2
+
+# ==================== 压测配置 ====================
+# 固定并发模式的默认并发数，以及默认压测时长（秒）
+LOADTEST_CONCURRENCY = 4
+LOADTEST_DURATION = 30
+# 按时间窗口（秒）统计吞吐、延迟和服务端各阶段耗时
+LOADTEST_WINDOW = 5
+# 固定到达率模式下同时在途的请求数上限，超出的请求计为丢弃
+LOADTEST_MAX_INFLIGHT = 64
+# 自动启动服务器时等待 /ready 的最长时间（秒）
+LOADTEST_STARTUP_TIMEOUT = 120
 
 # ==================== 路径配置 ====================
 # 项目根目录
@@ -112,6 +324,7 @@ def get_test_images():
 # API端点
 ENDPOINTS = {
     "ocr": "/ocr",
+    "jobs": "/jobs",
     "health": "/health",
     "info": "/"
 }
@@ -121,6 +334,10 @@ def get_api_url(endpoint):
     """获取完整的API URL"""
     return f"{API_BASE_URL}{ENDPOINTS.get(endpoint, endpoint)}"
 
+# 响应格式: full(逐框字典) / compact(同full但不缩进) / text(仅文本) / columnar(按列)
+RESPONSE_PROFILES = ("full", "compact", "text", "columnar")
+RESPONSE_PROFILE = "full"
+
 # ==================== 日志配置 ====================
 # 日志格式
 LOG_FORMAT = "[{time}] {message}"
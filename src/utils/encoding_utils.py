@@ -10,8 +10,15 @@ import platform
 import sys
 import os
 
+# 是否已经设置过编码，避免多个模块重复包装stdout/stderr
+_encoding_configured = False
+
 def setup_windows_encoding():
-    """设置Windows环境下的编码处理"""
+    """设置Windows环境下的编码处理，重复调用时直接返回"""
+    global _encoding_configured
+    if _encoding_configured:
+        return
+    _encoding_configured = True
     if platform.system() == 'Windows':
         import codecs
         import locale
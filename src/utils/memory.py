@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+请求级内存统计
+tracemalloc 统计Python分配（包括numpy数组），RSS 另外包含 ONNX Runtime 内存池、OpenCV 等原生分配，
+两者之差用于判断增长来自Python对象还是原生内存
+tracemalloc 和 RSS 都是进程级的，并发请求时各请求的数值包含同时进行的其他请求的分配，
+需要精确归因时应以并发1压测
+"""
+
+import gc
+import os
+import sys
+import time
+import threading
+import tracemalloc
+from collections import OrderedDict, deque
+
+from src.utils.config import (
+    MEMORY_TRACE_FRAMES, MEMORY_TOP_SITES, MEMORY_MAX_SNAPSHOTS, MEMORY_RECENT_REQUESTS
+)
+
+# 项目根目录，分配位置显示为相对路径
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 报告中不列出 tracemalloc 自身和导入机制的分配
+# 不用 Snapshot.filter_traces：加载模型后有数万条记录，逐条匹配文件名要数秒
+_IGNORED_FILES = frozenset([
+    tracemalloc.__file__,
+    '<frozen importlib._bootstrap>',
+    '<frozen importlib._bootstrap_external>',
+    '<unknown>',
+    __file__,
+])
+
+# 统计存活实例数的类型，用于发现未释放的单图对象
+LIVE_OBJECT_TYPES = ('det_rec_functions', 'OCRResult')
+
+
+def current_rss():
+    """当前进程的常驻内存（字节），不支持的平台返回None"""
+    if sys.platform.startswith('linux'):
+        try:
+            with open('/proc/self/statm') as fin:
+                return int(fin.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, IndexError):
+            return None
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class _Counters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = _Counters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+    return None
+
+
+def _kb(size):
+    return round(size / 1024.0, 1) if size is not None else None
+
+
+def _delta(new, old):
+    return new - old if new is not None and old is not None else None
+
+
+def _format_frame(frame):
+    filename = frame.filename
+    if filename.startswith(_ROOT):
+        filename = os.path.relpath(filename, _ROOT)
+    else:
+        # 第三方库只保留最后两级路径
+        filename = os.path.join(*filename.replace('\\', '/').split('/')[-2:])
+    return f"{filename}:{frame.lineno}"
+
+
+def format_sites(stats, limit=MEMORY_TOP_SITES):
+    """把 Statistic / StatisticDiff 列表整理成可JSON序列化的分配位置"""
+    sites = []
+    for stat in stats:
+        if len(sites) >= limit:
+            break
+        if stat.traceback[0].filename in _IGNORED_FILES:
+            continue
+        site = {
+            'site': _format_frame(stat.traceback[0]),
+            'size_kb': _kb(stat.size),
+            'count': stat.count
+        }
+        if hasattr(stat, 'size_diff'):
+            site['size_diff_kb'] = _kb(stat.size_diff)
+            site['count_diff'] = stat.count_diff
+        if len(stat.traceback) > 1:
+            site['traceback'] = [_format_frame(frame) for frame in stat.traceback]
+        sites.append(site)
+    return sites
+
+
+def take_snapshot():
+    return tracemalloc.take_snapshot()
+
+
+def live_objects(type_names=LIVE_OBJECT_TYPES):
+    """按类型名统计垃圾回收器跟踪的存活实例数"""
+    counts = dict.fromkeys(type_names, 0)
+    for obj in gc.get_objects():
+        name = type(obj).__name__
+        if name in counts:
+            counts[name] += 1
+    return counts
+
+
+class StageMeter(dict):
+    """
+    阶段计时字典，可直接作为 OCREngine.ocr_result 的 timings 参数
+    每记录一个阶段的耗时，同时记下自上一个阶段结束以来的Python分配（tracemalloc）和RSS变化；
+    sample 为True时在阶段边界各取一次快照，请求结束后由 MemoryTracker 在后台比较相邻快照，
+    得到各阶段新增内存最多的分配位置
+    """
+
+    def __init__(self, sample=False):
+        super().__init__()
+        self.sample = sample
+        self.memory = {}
+        # [(阶段名, 该阶段结束时的快照), ...]，第一项为开始时的快照
+        self.snapshots = []
+        self.start_time = time.time()
+        self._mark(None)
+        self.traced_start, self.rss_start = self.traced, self.rss
+
+    def _mark(self, stage):
+        if self.sample:
+            self.snapshots.append((stage, take_snapshot()))
+        # 快照对象本身也在 tracemalloc 的统计中，取完快照后再读数
+        self.traced = tracemalloc.get_traced_memory()[0]
+        self.rss = current_rss()
+
+    def __setitem__(self, stage, seconds):
+        super().__setitem__(stage, seconds)
+        traced, rss = tracemalloc.get_traced_memory()[0], current_rss()
+        entry = self.memory.setdefault(stage, {'traced_kb': 0.0, 'rss_kb': 0.0})
+        entry['traced_kb'] = round(entry['traced_kb'] + _kb(traced - self.traced), 1)
+        rss_delta = _delta(rss, self.rss)
+        entry['rss_kb'] = round(entry['rss_kb'] + _kb(rss_delta), 1) if rss_delta is not None else None
+        self._mark(stage)
+
+
+class MemoryTracker(object):
+    """
+    进程内的请求内存统计
+    begin() 返回 StageMeter 供请求记录各阶段，finish() 汇总；另外保存命名快照并按需比较
+    """
+
+    def __init__(self, nframes=MEMORY_TRACE_FRAMES, top=MEMORY_TOP_SITES,
+                 max_snapshots=MEMORY_MAX_SNAPSHOTS, recent=MEMORY_RECENT_REQUESTS):
+        self.nframes = nframes
+        self.top = top
+        self.max_snapshots = max_snapshots
+        self.lock = threading.Lock()
+        self.active = 0
+        self.requests = 0
+        self.totals = {'rss_kb': 0.0, 'traced_kb': 0.0, 'max_rss_kb': 0.0, 'max_traced_peak_kb': 0.0}
+        self.stages = {}
+        self.stage_sites = {}
+        self.sample_remaining = 0
+        # 比较快照很慢（加载模型后每次数秒），放在后台线程中逐个进行，不占用请求时间
+        self.analyze_lock = threading.Lock()
+        self.pending_analyses = 0
+        self.recent = deque(maxlen=recent)
+        self.snapshots = OrderedDict()
+        self.base_rss = None
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.nframes)
+        self.base_rss = current_rss()
+
+    def begin(self):
+        """开始统计一个请求"""
+        with self.lock:
+            # 峰值是进程级的，只在没有其他请求进行时清零，并发时峰值覆盖所有重叠的请求
+            if self.active == 0:
+                tracemalloc.reset_peak()
+            self.active += 1
+            sample = self.sample_remaining > 0
+            if sample:
+                self.sample_remaining -= 1
+        return StageMeter(sample)
+
+    def finish(self, meter, label):
+        """结束统计，返回该请求的记录"""
+        traced, peak = tracemalloc.get_traced_memory()
+        rss = current_rss()
+        record = {
+            'label': label,
+            'time': round(meter.start_time, 3),
+            'duration_ms': round((time.time() - meter.start_time) * 1000, 2),
+            'traced_delta_kb': _kb(traced - meter.traced_start),
+            'traced_peak_kb': _kb(peak - meter.traced_start),
+            'rss_delta_kb': _kb(_delta(rss, meter.rss_start)),
+            'stages': meter.memory
+        }
+        with self.lock:
+            self.active -= 1
+            self.requests += 1
+            self.totals['traced_kb'] += record['traced_delta_kb']
+            self.totals['max_traced_peak_kb'] = max(self.totals['max_traced_peak_kb'], record['traced_peak_kb'])
+            if record['rss_delta_kb'] is not None:
+                self.totals['rss_kb'] += record['rss_delta_kb']
+                self.totals['max_rss_kb'] = max(self.totals['max_rss_kb'], record['rss_delta_kb'])
+            for stage, entry in meter.memory.items():
+                total = self.stages.setdefault(stage, {'count': 0, 'traced_kb': 0.0, 'rss_kb': 0.0})
+                total['count'] += 1
+                total['traced_kb'] += entry['traced_kb']
+                total['rss_kb'] += entry['rss_kb'] or 0.0
+            self.recent.append(record)
+            if meter.sample:
+                self.pending_analyses += 1
+        if meter.sample:
+            threading.Thread(target=self._analyze, args=(meter.snapshots,), name='memory-analyze', daemon=True).start()
+        return record
+
+    def _analyze(self, snapshots):
+        """比较相邻两个阶段边界的快照，把各阶段新增内存最多的分配位置累加到 stage_sites"""
+        with self.analyze_lock:
+            for (_, previous), (stage, snapshot) in zip(snapshots, snapshots[1:]):
+                stats = [stat for stat in snapshot.compare_to(previous, 'lineno') if stat.size_diff > 0]
+                sites = format_sites(stats, self.top)
+                with self.lock:
+                    totals = self.stage_sites.setdefault(stage, {})
+                    for site in sites:
+                        total = totals.setdefault(site['site'], {'size_diff_kb': 0.0, 'count_diff': 0, 'requests': 0})
+                        total['size_diff_kb'] = round(total['size_diff_kb'] + site['size_diff_kb'], 1)
+                        total['count_diff'] += site['count_diff']
+                        total['requests'] += 1
+            del snapshots[:]
+            with self.lock:
+                self.pending_analyses -= 1
+
+    def sample_stages(self, requests):
+        """之后的 requests 个请求在阶段边界取快照，统计各阶段的分配位置，结果在后台比较完成后出现在 stats() 中"""
+        with self.lock:
+            self.sample_remaining = max(0, int(requests))
+            self.stage_sites = {}
+
+    def snapshot(self, name=None):
+        """保存一个命名快照，超出 max_snapshots 时删除最早的"""
+        snapshot = take_snapshot()
+        name = name or time.strftime('%H%M%S') + f"-{len(self.snapshots)}"
+        with self.lock:
+            self.snapshots.pop(name, None)
+            self.snapshots[name] = (time.time(), snapshot, current_rss())
+            while len(self.snapshots) > self.max_snapshots:
+                self.snapshots.popitem(last=False)
+        traced = sum(trace.size for trace in snapshot.traces)
+        return {'name': name, 'traced_kb': _kb(traced), 'traces': len(snapshot.traces), 'rss_kb': _kb(current_rss())}
+
+    def diff(self, old, new=None, group='lineno', limit=None):
+        """
+        比较两个快照，new 为None时与当前状态比较
+        :param group: 'lineno'（按行）、'filename'（按文件）或 'traceback'（按完整调用栈）
+        :raises KeyError: 快照不存在
+        """
+        with self.lock:
+            old_time, old_snapshot, old_rss = self.snapshots[old]
+            if new is not None:
+                new_time, new_snapshot, new_rss = self.snapshots[new]
+        if new is None:
+            new_time, new_snapshot, new_rss = time.time(), take_snapshot(), current_rss()
+        stats = new_snapshot.compare_to(old_snapshot, group)
+        return {
+            'from': old,
+            'to': new or 'now',
+            'elapsed_s': round(new_time - old_time, 2),
+            'traced_delta_kb': _kb(sum(stat.size_diff for stat in stats)),
+            'rss_delta_kb': _kb(_delta(new_rss, old_rss)),
+            'top': format_sites(stats, limit or self.top)
+        }
+
+    def stats(self):
+        traced, peak = tracemalloc.get_traced_memory()
+        rss = current_rss()
+        with self.lock:
+            count = max(self.requests, 1)
+            stage_sites = {
+                stage: [dict(total, site=site) for site, total in
+                        sorted(sites.items(), key=lambda item: -item[1]['size_diff_kb'])[:self.top]]
+                for stage, sites in self.stage_sites.items()
+            }
+            return {
+                'rss_kb': _kb(rss),
+                'rss_growth_kb': _kb(_delta(rss, self.base_rss)),
+                'traced_kb': _kb(traced),
+                'traced_peak_kb': _kb(peak),
+                'requests': self.requests,
+                'active': self.active,
+                'avg_traced_delta_kb': round(self.totals['traced_kb'] / count, 1),
+                'avg_rss_delta_kb': round(self.totals['rss_kb'] / count, 1),
+                'max_traced_peak_kb': self.totals['max_traced_peak_kb'],
+                'max_rss_delta_kb': self.totals['max_rss_kb'],
+                'stages': {stage: {'count': total['count'],
+                                   'avg_traced_kb': round(total['traced_kb'] / total['count'], 1),
+                                   'avg_rss_kb': round(total['rss_kb'] / total['count'], 1)}
+                           for stage, total in self.stages.items()},
+                'stage_sites': stage_sites,
+                'sampling_remaining': self.sample_remaining,
+                'pending_analyses': self.pending_analyses,
+                'snapshots': list(self.snapshots),
+                'recent': list(self.recent)
+            }
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+启动耗时分析
+记录各模块导入、模型加载耗时以及从进程启动到首次响应 /health 的时间
+"""
+
+import importlib
+import sys
+import threading
+import time
+
+# 按依赖顺序逐个导入，每项只统计自身新增的耗时
+PROFILE_MODULES = [
+    'numpy',
+    'cv2',
+    'onnxruntime',
+    'PIL.Image',
+    'shapely.geometry',
+    'pyclipper',
+    'src.core.main',
+    'src.core.engine',
+]
+
+
+class StartupProfiler(object):
+    """
+    启动耗时记录器
+    :param start_time: 进程启动时间（time.time()），默认取创建时刻
+    :param target_ms: 首次 /health 响应的目标耗时
+    """
+
+    def __init__(self, start_time=None, target_ms=None):
+        self.start_time = start_time if start_time is not None else time.time()
+        self.target_ms = target_ms
+        self.durations = []
+        self.marks = []
+        self.lock = threading.Lock()
+
+    def record(self, name, seconds):
+        """记录一项耗时"""
+        with self.lock:
+            self.durations.append((name, seconds * 1000))
+
+    def mark(self, name):
+        """记录从进程启动到现在的时间点，返回毫秒数"""
+        elapsed_ms = (time.time() - self.start_time) * 1000
+        with self.lock:
+            self.marks.append((name, elapsed_ms))
+        return elapsed_ms
+
+    def mark_once(self, name):
+        """同名时间点只记录第一次，已记录过时返回None"""
+        with self.lock:
+            if any(mark_name == name for mark_name, _ in self.marks):
+                return None
+        return self.mark(name)
+
+    def time_imports(self, modules=PROFILE_MODULES):
+        """逐个导入模块并计时，已导入的模块耗时记为0"""
+        for module_name in modules:
+            if module_name in sys.modules:
+                self.record(f"导入: {module_name}", 0.0)
+                continue
+            start_time = time.time()
+            try:
+                importlib.import_module(module_name)
+            except ImportError as e:
+                print(f"⚠️  无法导入 {module_name}: {e}")
+                continue
+            self.record(f"导入: {module_name}", time.time() - start_time)
+
+    def summary(self):
+        with self.lock:
+            return {
+                'durations_ms': {name: round(ms, 2) for name, ms in self.durations},
+                'marks_ms': {name: round(ms, 2) for name, ms in self.marks},
+                'target_ms': self.target_ms
+            }
+
+    def report(self):
+        """打印耗时报告"""
+        with self.lock:
+            durations = sorted(self.durations, key=lambda item: -item[1])
+            marks = list(self.marks)
+        print("=" * 50)
+        print("⏱️  启动耗时分析")
+        for name, ms in durations:
+            print(f"   {ms:9.1f}ms  {name}")
+        print("-" * 50)
+        for name, ms in marks:
+            print(f"   {ms:9.1f}ms  {name} (自进程启动)")
+        if self.target_ms is not None:
+            first_health = dict(marks).get('首次/health响应')
+            if first_health is None:
+                print(f"   尚未收到 /health 请求 (目标 {self.target_ms}ms)")
+            elif first_health <= self.target_ms:
+                print(f"✅ 首次 /health 响应 {first_health:.1f}ms，达到目标 {self.target_ms}ms")
+            else:
+                print(f"⚠️  首次 /health 响应 {first_health:.1f}ms，超过目标 {self.target_ms}ms")
+        print("=" * 50)